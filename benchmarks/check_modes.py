@@ -0,0 +1,77 @@
+"""Benchmark of the thread and the asynchronous proxy checking modes.
+
+Run:
+    python -m benchmarks.check_modes --proxies 1000 --dead-proxies 1000 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from proxy.async_checker import AsyncCheckerProxy
+from proxy.checker import CheckerProxy
+from proxy.judges import JudgeRegistry
+from proxy.parsing import Addresses, Proxy, parse_lines
+
+from .stand_ins import StandIns
+
+
+def measure(name: str, func: Callable[[], int], total: int) -> None:
+    start_cpu = time.process_time()
+    start_time = time.monotonic()
+    good = func()
+    wall_time = time.monotonic() - start_time
+    cpu_time = time.process_time() - start_cpu
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{name:<8} checks: {total:<6} good: {good:<6} time: {wall_time:6.2f} sec  "
+        f"checks/sec: {total / wall_time:8.1f}  cpu: {cpu_time:6.2f} sec  max rss: {max_rss:.1f} MiB"
+    )
+
+
+def run_threads(checker: CheckerProxy, proxies: Addresses, max_workers: int) -> int:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(result.is_good for result in executor.map(checker, proxies))
+
+
+def run_async(checker: AsyncCheckerProxy, proxies: Addresses, max_concurrent_checks: int) -> int:
+    async def check_all() -> int:
+        semaphore = asyncio.Semaphore(max_concurrent_checks)
+
+        async def check(proxy: Proxy) -> bool:
+            async with semaphore:
+                return (await checker(proxy)).is_good
+
+        return sum(await asyncio.gather(*[check(proxy) for proxy in proxies]))
+
+    return asyncio.run(check_all())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--proxies", type=int, default=500, help="number of alive stand-in proxies")
+    parser.add_argument("--dead-proxies", type=int, default=500, help="number of addresses refusing connections")
+    parser.add_argument("--latency", type=float, default=0.2, help="delay of every alive proxy in seconds")
+    parser.add_argument("--threads", type=int, default=230, help="number of threads in the thread mode")
+    parser.add_argument("--concurrency", type=int, default=2000, help="checks in flight in the async mode")
+    parser.add_argument("--modes", default="threads,async", help="comma separated modes to run")
+    args = parser.parse_args()
+
+    with StandIns(proxies=args.proxies, dead_proxies=args.dead_proxies, latency=args.latency) as stand_ins:
+        judges = JudgeRegistry(judges=[stand_ins.judge])
+        candidates = parse_lines([*stand_ins.proxies, *stand_ins.dead_proxies])
+        modes = args.modes.split(",")
+
+        if "threads" in modes:
+            checker = CheckerProxy(judges=judges)
+            measure("threads", lambda: run_threads(checker, candidates, args.threads), len(candidates))
+        if "async" in modes:
+            async_checker = AsyncCheckerProxy(judges=judges)
+            measure("async", lambda: run_async(async_checker, candidates, args.concurrency), len(candidates))
+
+
+if __name__ == "__main__":
+    main()
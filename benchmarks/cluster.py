@@ -0,0 +1,110 @@
+"""Benchmark of the distributed checking: a coordinator and worker node processes on this machine.
+
+The nodes connect to the coordinator over a Unix socket. One node can be paused to hold its leases without
+disconnecting: they expire and its proxies are checked by the other nodes, its late results are ignored when
+it is resumed.
+
+Run:
+    python -m benchmarks.cluster --nodes 3 --pause-node-after 5 --lease-ttl 4 --duration 20
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import time
+from threading import Timer
+
+from common.logger import get_main_logger
+from proxy.checker import CheckerProxy
+from proxy.cluster import CoordinatorRunThreads, run_node_process
+from proxy.judges import JudgeRegistry
+from proxy.metrics import LEASE_EVENTS, NODE_RESULTS
+
+from .scenarios import get_local_providers
+from .stand_ins import StandIns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=3, help="number of worker node processes")
+    parser.add_argument("--mode", default="threads", choices=("threads", "async"), help="check mode of the nodes")
+    parser.add_argument("--threads", type=int, default=50, help="number of check threads of every node")
+    parser.add_argument("--concurrency", type=int, default=500, help="checks in flight of every node in async mode")
+    parser.add_argument("--latency", type=float, default=1, help="delay of every alive proxy in seconds")
+    parser.add_argument("--lease-ttl", type=float, default=4, help="lifetime of a lease without results in seconds")
+    parser.add_argument("--pause-node-after", type=float, default=2, help="pause the first node, 0 never pauses")
+    parser.add_argument("--duration", type=float, default=20, help="run time in seconds")
+    args = parser.parse_args()
+
+    get_main_logger().setLevel(logging.WARNING)
+    context = multiprocessing.get_context("spawn")
+    address = os.path.join(tempfile.mkdtemp(), "coordinator.sock")
+    authkey = os.urandom(16)
+
+    with StandIns(proxies=500, dead_proxies=500, latency=args.latency) as stand_ins:
+        checker_proxy = CheckerProxy(judges=JudgeRegistry(judges=[stand_ins.judge]))
+        coordinator = CoordinatorRunThreads(
+            address=address,
+            authkey=authkey,
+            max_custom_worker=0,
+            providers_list=get_local_providers(stand_ins.base_url),
+            checker_proxy=checker_proxy,
+            lease_ttl=args.lease_ttl,
+        )
+        nodes = [
+            context.Process(
+                target=run_node_process,
+                args=(address, authkey),
+                kwargs={
+                    "check_mode": args.mode,
+                    "max_workers_proxies": args.threads,
+                    "max_concurrent_checks": args.concurrency,
+                    "name": f"node-{num}",
+                },
+                daemon=True,
+            )
+            for num in range(1, args.nodes + 1)
+        ]
+        for node in nodes:
+            node.start()
+
+        timers = [Timer(args.duration, coordinator.terminate)]
+        pid = nodes[0].pid
+        if args.pause_node_after and pid is not None:
+            # The node is resumed after its leases have expired, so its results come late.
+            timers.append(Timer(args.pause_node_after, os.kill, (pid, signal.SIGSTOP)))
+            timers.append(Timer(args.pause_node_after + 2 * args.lease_ttl, os.kill, (pid, signal.SIGCONT)))
+        for timer in timers:
+            timer.start()
+
+        start_time = time.monotonic()
+        checker_proxy.start()
+        try:
+            coordinator.run()
+        finally:
+            checker_proxy.stop()
+            for timer in timers:
+                timer.cancel()
+            if args.pause_node_after and pid is not None and nodes[0].is_alive():
+                os.kill(pid, signal.SIGCONT)
+            for node in nodes:
+                node.join(timeout=10)
+                if node.is_alive():
+                    node.terminate()
+        wall_time = time.monotonic() - start_time
+
+    print(
+        f"nodes: {args.nodes}  checks: {coordinator.count_of_checks}  good: {coordinator.count_of_good_checks}  "
+        f"checks/sec: {coordinator.count_of_checks / wall_time:.1f}  "
+        f"expired leases: {LEASE_EVENTS.value('expired'):.0f}  "
+        f"requeued proxies: {LEASE_EVENTS.value('requeued'):.0f}  late results: {LEASE_EVENTS.value('late_result'):.0f}"
+    )
+    for sample in NODE_RESULTS.snapshot():
+        print(f"  {sample['labels']['node']:<12} results: {sample['value']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
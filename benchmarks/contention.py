@@ -0,0 +1,132 @@
+"""Microbenchmark of the publication of the check results under many check threads.
+
+The checks are instant, so the threads do nothing but publish and the locks on the way are all that is measured.
+`direct` publishes every result in the check thread under the locks of the pool, the scheduler, the limiter and
+the generation, with a pool whose readers take its lock, as the scraper did before. `batched` hands the results
+to the publisher thread and reads the pool from its snapshot. Reader threads take and return proxies from the
+pool meanwhile with a short request in between, like the custom workers, and the time of `acquire()` is reported.
+
+Run:
+    python -m benchmarks.contention --workers 100,500,1000 --results 100000
+"""
+
+import argparse
+import logging
+import time
+from threading import Event, RLock, Thread
+from typing import Any
+
+from common.adaptive import AimdLimiter
+from common.logger import get_main_logger
+from proxy.checker import CheckerProxy
+from proxy.parsing import Proxy
+from proxy.pool import ProxyPool
+from proxy.results import CheckResult, CheckStatus
+from proxy.run_threads import RunThreads, put_many
+
+
+class InstantChecker(CheckerProxy):
+    """Checker without requests, every other proxy is good."""
+
+    def checker(self, proxy: Proxy) -> CheckResult:
+        if proxy & 1:
+            return CheckResult(proxy, CheckStatus.NO_RESPONSE)
+        return CheckResult(proxy, CheckStatus.GOOD, 0.1 + (proxy & 0xFF) / 1000, "judge")
+
+
+class LockedPool(ProxyPool):
+    """Pool whose readers take the lock of the pool, as before the snapshot."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Reentrant, a failed release removes the proxy under the same lock.
+        self._locker = RLock()  # type: ignore[assignment]
+
+    def acquire(self, *args: Any, **kwargs: Any) -> Proxy | None:
+        with self._locker:
+            return super().acquire(*args, **kwargs)
+
+    def release(self, *args: Any, **kwargs: Any) -> None:
+        with self._locker:
+            super().release(*args, **kwargs)
+
+
+class DirectRunThreads(RunThreads):
+    """Publishes every result in the check thread that has got it."""
+
+    def add_checked_proxy(self, result: CheckResult) -> None:
+        self.publish([result])
+
+
+def read_pool(pool: ProxyPool, stop_event: Event, waits: list[float]) -> None:
+    while not stop_event.is_set():
+        start_time = time.perf_counter()
+        proxy = pool.acquire()
+        waits.append(time.perf_counter() - start_time)
+        time.sleep(0.001)
+        if proxy is not None:
+            pool.release(proxy, True, 0.1)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q / 100))] if values else 0.0
+
+
+def run(mode: str, workers: int, results: int, proxies: int, readers: int) -> None:
+    pool = LockedPool() if mode == "direct" else ProxyPool()
+    runner_class = DirectRunThreads if mode == "direct" else RunThreads
+    runner = runner_class(
+        max_workers_proxies=workers,
+        max_custom_worker=0,
+        providers_list=[],
+        checker_proxy=InstantChecker(),
+        pool=pool,
+        concurrency=AimdLimiter(max_limit=workers),
+    )
+    # Proxies are checked again and again, the good ones are in the pool and the others never get there.
+    candidates = [(num % proxies) << 16 | 8080 + num % proxies % 2 for num in range(results)]
+    pool.publish(CheckResult(proxy, CheckStatus.GOOD, 0.1) for proxy in set(candidates) if not proxy & 1)
+    put_many(runner._unchecked_proxies_queue, [*candidates, *[None] * workers])
+
+    stop_event = Event()
+    waits: list[float] = []
+    reader_threads = [Thread(target=read_pool, args=(pool, stop_event, waits)) for _ in range(readers)]
+    check_threads = [Thread(target=runner.get_checked_proxies) for _ in range(workers)]
+    publisher = Thread(target=runner.publish_results)
+
+    start_time = time.monotonic()
+    for thread in [*reader_threads, *check_threads, publisher]:
+        thread.start()
+    for thread in check_threads:
+        thread.join()
+    runner._results_queue.put(None)
+    publisher.join()
+    wall_time = time.monotonic() - start_time
+    stop_event.set()
+    for thread in reader_threads:
+        thread.join()
+
+    assert runner.count_of_checks == results
+    print(
+        f"{mode:<8} workers: {workers:<5} results/sec: {results / wall_time:9.1f}  time: {wall_time:6.2f} sec  "
+        f"acquire p50: {percentile(waits, 50) * 1e6:7.1f}  p99: {percentile(waits, 99) * 1e6:8.1f} us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="100,500,1000", help="comma separated numbers of check threads")
+    parser.add_argument("--results", type=int, default=100_000, help="number of results to publish")
+    parser.add_argument("--proxies", type=int, default=5000, help="number of distinct proxies checked")
+    parser.add_argument("--readers", type=int, default=8, help="number of threads reading the pool")
+    args = parser.parse_args()
+
+    # Per-proxy messages would measure the console.
+    get_main_logger().setLevel(logging.WARNING)
+    for workers in map(int, args.workers.split(",")):
+        for mode in ("direct", "batched"):
+            run(mode, workers, args.results, args.proxies, args.readers)
+
+
+if __name__ == "__main__":
+    main()
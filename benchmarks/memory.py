@@ -0,0 +1,71 @@
+"""Benchmark of the memory footprint over many cycles of the providers.
+
+The same provider instances are reused for every cycle, as the providers of the REGISTRY are. The refresh
+interval is 0 and the stand-in pages are served in a new order on every request, so every cycle fetches, parses
+and dedups the full volume of candidates. A churning list with new random proxies on every request stands in
+for the free lists that change all the time. The proxies go through the dedup stage, like in RunThreads, and the
+footprint is reported after every cycle.
+
+Run:
+    python -m benchmarks.memory --cycles 10 --pages 5 --proxies-per-page 10000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from common.rate_limit import HostLimiter
+from proxy.dedup import ProxyDeduplicator
+from proxy.providers import Provider, SourceProvider
+from proxy.sources import SourceDefinition
+
+from .scenarios import get_local_providers, get_rss
+from .stand_ins import StandIns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cycles", type=int, default=10, help="number of cycles of all the providers")
+    parser.add_argument("--pages", type=int, default=5, help="number of pages of the churning list")
+    parser.add_argument("--proxies-per-page", type=int, default=10_000, help="number of proxies on every page")
+    args = parser.parse_args()
+
+    with StandIns(proxies=500, dead_proxies=500, rotate_pages=True) as stand_ins:
+        providers: list[Provider] = [
+            *get_local_providers(stand_ins.base_url, min_refresh_interval=0),
+            SourceProvider(
+                SourceDefinition(
+                    name="ChurningProxies",
+                    # The query makes every page a separate url.
+                    urls=(f"{stand_ins.base_url}/random/{args.proxies_per_page}.txt?page={{page}}",),
+                    params={"page": list(range(args.pages))},
+                ),
+                host_limiter=HostLimiter(max_concurrency=8, rate=1000),
+                min_refresh_interval=0,
+            ),
+        ]
+        deduplicator = ProxyDeduplicator()
+        tracemalloc.start()
+
+        for cycle in range(1, args.cycles + 1):
+            start_time = time.monotonic()
+            candidates = accepted = 0
+            for provider in providers:
+                for addresses in provider.stream():
+                    candidates += len(addresses)
+                    accepted += len(deduplicator.accept(addresses))
+            deduplicator.new_generation()
+            gc.collect()
+
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                f"cycle: {cycle:<4} candidates: {candidates:<8} accepted: {accepted:<8} "
+                f"time: {time.monotonic() - start_time:6.2f} sec  traced: {current / 2**20:7.1f} MiB  "
+                f"traced peak: {peak / 2**20:7.1f} MiB  rss: {get_rss():7.1f} MiB"
+            )
+            tracemalloc.reset_peak()
+
+
+if __name__ == "__main__":
+    main()
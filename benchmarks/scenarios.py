@@ -0,0 +1,168 @@
+"""End to end benchmark of the scraper against local stand-in providers, judges and proxies.
+
+Every scenario runs the Facade for a fixed time and reports the rate of checks, the time to the first good
+check and to the first proxy served by the pool, the CPU time and the memory.
+
+The fleet is listed once, its candidates are checked in a burst and the rest of the run is idle, so the rate is
+measured over the active window from the first check to the last one, not over the whole run.
+
+Run:
+    python -m benchmarks.scenarios --scenarios baseline,lossy --mode async --duration 20
+"""
+
+import argparse
+import logging
+import resource
+import time
+from dataclasses import dataclass, replace
+from threading import Event, Thread, Timer
+
+from common.logger import get_main_logger
+from common.rate_limit import HostLimiter
+from proxy.facade import Facade
+from proxy.providers import Provider, SourceProvider
+from proxy.sources import FATEZERO, FREEPROXYLIST, GITHUB_ACCOUNTS, SSLPROXIES
+
+from .stand_ins import StandIns
+
+
+@dataclass
+class Scenario:
+    """Behaviour of the stand-in proxy fleet."""
+
+    proxies: int
+    dead_proxies: int = 0
+    blackhole_proxies: int = 0
+    latency: float = 0
+    jitter: float = 0
+    drop_rate: float = 0
+
+
+SCENARIOS: dict[str, Scenario] = {
+    # Fast proxies, half of the candidates refuse connections.
+    "baseline": Scenario(proxies=500, dead_proxies=500),
+    # Slow proxies with scattered latencies.
+    "slow": Scenario(proxies=500, dead_proxies=500, latency=1, jitter=0.5),
+    # Every third request through an alive proxy is dropped.
+    "lossy": Scenario(proxies=500, dead_proxies=500, latency=0.2, jitter=0.5, drop_rate=0.3),
+    # Proxies that accept connections and never respond pass the TCP prefilter and hold the checks until timeout.
+    "blackhole": Scenario(proxies=300, dead_proxies=300, blackhole_proxies=400, latency=0.2),
+}
+
+
+def get_local_providers(base_url: str, min_refresh_interval: float = 60) -> list[Provider]:
+    """Get the providers of the built-in sources with their pages on the stand-in server."""
+    # All the pages are on one local host, its politeness limits would only measure the sleeps.
+    host_limiter = HostLimiter(max_concurrency=8, rate=1000, burst=1000)
+    sources = [
+        replace(FREEPROXYLIST, urls=(f"{base_url}/freeproxylist/{{protocol}}?page={{page}}",)),
+        replace(SSLPROXIES, urls=(f"{base_url}/sslproxies/",)),
+        replace(FATEZERO, urls=(f"{base_url}/fatezero/proxy.list",)),
+        replace(GITHUB_ACCOUNTS, urls=(f"{base_url}/github/http.txt", f"{base_url}/github/mirror.txt")),
+    ]
+    return [
+        SourceProvider(source, host_limiter=host_limiter, min_refresh_interval=min_refresh_interval)
+        for source in sources
+    ]
+
+
+def get_rss() -> float:
+    """Get the current resident set size in MiB, the peak one where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scenario(name: str, scenario: Scenario, mode: str, duration: float, args: argparse.Namespace) -> None:
+    with StandIns(
+        proxies=scenario.proxies,
+        dead_proxies=scenario.dead_proxies,
+        blackhole_proxies=scenario.blackhole_proxies,
+        latency=scenario.latency,
+        jitter=scenario.jitter,
+        drop_rate=scenario.drop_rate,
+    ) as stand_ins:
+        facade = Facade(
+            url_of_second_check="",
+            max_workers_proxies=args.threads,
+            max_custom_worker=0,
+            check_mode=mode,
+            max_concurrent_checks=args.concurrency,
+            processes=args.processes,
+            providers_list=get_local_providers(stand_ins.base_url),
+            judges=[stand_ins.judge],
+        )
+
+        first_good_check: float | None = None
+        first_served: float | None = None
+        first_check: float | None = None
+        last_check: float | None = None
+        done = Event()
+
+        def watch() -> None:
+            nonlocal first_good_check, first_served, first_check, last_check
+            count_of_checks = 0
+            while not done.wait(0.01):
+                runner = facade.runner
+                if runner is None:
+                    continue
+                if runner.count_of_checks != count_of_checks:
+                    count_of_checks = runner.count_of_checks
+                    last_check = time.monotonic()
+                    if first_check is None:
+                        first_check = last_check
+                if first_good_check is None and runner.count_of_good_checks:
+                    first_good_check = time.monotonic() - start_time
+                if first_served is None and len(runner.pool):
+                    first_served = time.monotonic() - start_time
+
+        start_cpu = time.process_time()
+        start_time = time.monotonic()
+        watcher = Thread(target=watch, daemon=True)
+        watcher.start()
+        timer = Timer(duration, facade.terminate)
+        timer.start()
+        try:
+            facade.run()
+        finally:
+            timer.cancel()
+            done.set()
+            watcher.join()
+
+        cpu_time = time.process_time() - start_cpu
+        runner = facade.runner
+        assert runner is not None
+
+    def seconds(value: float | None) -> str:
+        return "-" if value is None else f"{value:.2f}"
+
+    # The poll interval is the resolution of the window.
+    active_time = last_check - first_check + 0.01 if first_check is not None and last_check is not None else None
+    rate = runner.count_of_checks / active_time if active_time else 0.0
+    print(
+        f"{name:<10} {mode:<8} checks: {runner.count_of_checks:<6} good: {runner.count_of_good_checks:<6} "
+        f"checks/sec: {rate:8.1f}  active: {seconds(active_time):>6} sec  first good: {seconds(first_good_check):>6} sec  "
+        f"first served: {seconds(first_served):>6} sec  cpu: {cpu_time:6.2f} sec  rss: {get_rss():.1f} MiB"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated scenarios to run")
+    parser.add_argument("--mode", default="threads", choices=("threads", "async"), help="check mode of the Facade")
+    parser.add_argument("--duration", type=float, default=20, help="run time of every scenario in seconds")
+    parser.add_argument("--threads", type=int, default=230, help="number of check threads in the thread mode")
+    parser.add_argument("--concurrency", type=int, default=2000, help="checks in flight in the async mode")
+    parser.add_argument("--processes", type=int, default=0, help="number of check processes, 0 checks in this one")
+    args = parser.parse_args()
+
+    # Per-proxy messages would measure the console.
+    get_main_logger().setLevel(logging.WARNING)
+    for name in args.scenarios.split(","):
+        run_scenario(name, SCENARIOS[name], args.mode, args.duration, args)
+
+
+if __name__ == "__main__":
+    main()
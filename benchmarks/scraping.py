@@ -0,0 +1,96 @@
+"""Benchmark of the scraping through the pool with and without hedged requests.
+
+Some requests hang on the stand-in proxies, like free proxies that accept a request and never answer. Without
+hedging such a job waits for the whole timeout, with hedging a backup request goes out at the 95th percentile.
+
+Run:
+    python -m benchmarks.scraping --jobs 1000 --hang-rate 0.02 --latency 0.1
+"""
+
+import argparse
+import logging
+import time
+from threading import Event, Lock, Thread
+
+from common.adaptive import TimeoutController
+from common.logger import get_main_logger
+from common.smart_request import SmartRequest
+from proxy.metrics import SCRAPE_HEDGES
+from proxy.parsing import parse_lines
+from proxy.pool import ProxyPool
+from proxy.results import CheckResult, CheckStatus
+from proxy.scraping import Frontier, ScrapeJob, Scraper, ScrapeResult
+
+from .stand_ins import StandIns
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def run(base_url: str, proxies: list[str], jobs: int, threads: int, timeout: float, hedge: bool) -> None:
+    pool = ProxyPool()
+    for proxy in parse_lines(proxies):
+        pool.add(CheckResult(proxy, CheckStatus.GOOD, 0.1))
+
+    frontier = Frontier(delay=0, max_per_domain=threads)
+    for num in range(jobs):
+        frontier.put(ScrapeJob(f"{base_url}/azenv.php?job={num}", timeout=timeout))
+
+    locker = Lock()
+    results: list[ScrapeResult] = []
+    finished = Event()
+
+    def sink(result: ScrapeResult) -> None:
+        with locker:
+            results.append(result)
+            if len(results) == jobs:
+                finished.set()
+
+    # Fresh adaptive timeouts, so the runs do not learn from each other.
+    scraper = Scraper(frontier, sink, request=SmartRequest(timeouts=TimeoutController()), hedge=hedge)
+    hedges_started, hedges_won = SCRAPE_HEDGES.value("started"), SCRAPE_HEDGES.value("won")
+    stop_event = Event()
+    workers = [Thread(target=scraper.work, args=(pool, stop_event)) for _ in range(threads)]
+
+    start_time = time.monotonic()
+    for worker in workers:
+        worker.start()
+    finished.wait()
+    wall_time = time.monotonic() - start_time
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+    scraper.close()
+
+    latencies = [result.latency for result in results]
+    print(
+        f"hedge: {'on' if hedge else 'off':<4} jobs: {jobs}  success: {sum(map(bool, results))}  "
+        f"jobs/sec: {jobs / wall_time:7.1f}  p50: {percentile(latencies, 50):.3f}  "
+        f"p95: {percentile(latencies, 95):.3f}  p99: {percentile(latencies, 99):.3f}  max: {max(latencies):.3f} sec  "
+        f"hedges started: {SCRAPE_HEDGES.value('started') - hedges_started:.0f}  "
+        f"won: {SCRAPE_HEDGES.value('won') - hedges_won:.0f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=1000, help="number of urls to scrape")
+    parser.add_argument("--proxies", type=int, default=50, help="number of stand-in proxies in the pool")
+    parser.add_argument("--latency", type=float, default=0.1, help="delay of every proxy in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="relative random spread of the delay")
+    parser.add_argument("--hang-rate", type=float, default=0.02, help="probability that a request hangs")
+    parser.add_argument("--threads", type=int, default=20, help="number of scraping threads")
+    parser.add_argument("--timeout", type=float, default=5, help="timeout of a request in seconds")
+    args = parser.parse_args()
+
+    get_main_logger().setLevel(logging.WARNING)
+    with StandIns(
+        proxies=args.proxies, latency=args.latency, jitter=args.jitter, hang_rate=args.hang_rate
+    ) as stand_ins:
+        for hedge in (False, True):
+            run(stand_ins.base_url, stand_ins.proxies, args.jobs, args.threads, args.timeout, hedge)
+
+
+if __name__ == "__main__":
+    main()
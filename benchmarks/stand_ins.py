@@ -0,0 +1,402 @@
+"""Local stand-in servers for the benchmarks: proxy providers, proxy judges and fleets of HTTP and SOCKS proxies.
+
+Servers run on the event loop of a separate process so that they do not compete with the measured code for the GIL.
+"""
+
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import struct
+from multiprocessing.connection import Connection
+from typing import Any
+from urllib.parse import urlsplit
+
+HOST = "127.0.0.1"
+PROXIES_PER_PAGE = 50
+
+
+async def read_head(reader: asyncio.StreamReader) -> list[str]:
+    """Read the request line and the headers."""
+    lines: list[str] = []
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            return lines
+        lines.append(line.decode("latin-1").rstrip("\r\n"))
+
+
+def write_response(
+    writer: asyncio.StreamWriter, status: str, body: bytes, content_type: str = "text/plain", etag: str | None = None
+) -> None:
+    headers = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nConnection: close\r\n"
+    if etag is not None:
+        headers += f"ETag: {etag}\r\n"
+    writer.write(f"{headers}Content-Length: {len(body)}\r\n\r\n".encode() + body)
+
+
+def html_table(proxies: list[str], table_attrs: str, tbody_attrs: str = "") -> bytes:
+    rows = "".join(
+        f"<tr><td>{proxy.split(':')[0]}</td><td>{proxy.split(':')[1]}</td><td>elite</td></tr>" for proxy in proxies
+    )
+    return (
+        f"<html><body><table {table_attrs}><thead><tr><th>IP</th><th>Port</th><th>Type</th></tr></thead>"
+        f"<tbody {tbody_attrs}>{rows}</tbody></table></body></html>"
+    ).encode()
+
+
+class Web:
+    """Proxy judge and provider pages on one server.
+
+    Pages mimic the sources parsed by the providers, static pages have an ETag and answer 304 to If-None-Match:
+        /azenv.php - judge, echoes the environment of the request.
+        /freeproxylist/{http,https}?page=N - html table of FreeproxylistProxies.
+        /sslproxies/ - html table of SslproxiesProxies.
+        /fatezero/proxy.list - json lines of FatezeroProxies.
+        /github/{name}.txt - raw `ip:port` lists of GithubAccountProxies.
+        /random/{count}.txt - raw list of `count` random addresses, new on every request like a churning list.
+
+    With `rotate_pages` every request of a static page gets its proxies in a new order, like a list that is
+    updated all the time, so every fetch is changed and parsed whole.
+
+    Args:
+        proxies (list[str]): Addresses listed by the providers.
+        rotate_pages (bool): Shuffle the proxies of a static page on every request. Defaults to False.
+    """
+
+    def __init__(self, proxies: list[str], rotate_pages: bool = False) -> None:
+        self.proxies = proxies
+        self.rotate_pages = rotate_pages
+        self.pages = self.build_pages(proxies)
+
+    @staticmethod
+    def build_pages(proxies: list[str], shuffle: bool = False) -> dict[str, tuple[bytes, str]]:
+        """Build the static pages, with `shuffle` the proxies of every page are in a random order."""
+
+        def order(chunk: list[str]) -> list[str]:
+            return random.sample(chunk, len(chunk)) if shuffle else chunk
+
+        pages: dict[str, tuple[bytes, str]] = {}
+        chunks = [proxies[i : i + PROXIES_PER_PAGE] for i in range(0, len(proxies), PROXIES_PER_PAGE)] or [[]]
+
+        # Every proxy is listed by two providers, like the same list on several mirrors.
+        for num, chunk in enumerate(chunks[:20]):
+            protocol, page = ("http", num + 1) if num < 10 else ("https", num - 9)
+            body = html_table(order(chunk), "class='table'", "class='table-proxy-list'")
+            pages[f"/freeproxylist/{protocol}?page={page}"] = (body, "text/html")
+        pages["/sslproxies/"] = (
+            html_table(order(proxies[: PROXIES_PER_PAGE * 2]), "class='table table-striped'"),
+            "text/html",
+        )
+        fatezero = "\n".join(
+            json.dumps({"host": p.split(":")[0], "port": int(p.split(":")[1])}) for p in order(proxies)
+        )
+        pages["/fatezero/proxy.list"] = (fatezero.encode(), "text/plain")
+        pages["/github/http.txt"] = ("\n".join(order(proxies)).encode(), "text/plain")
+        pages["/github/mirror.txt"] = ("\n".join(order(proxies[::-1])).encode(), "text/plain")
+        return pages
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await read_head(reader)
+            if not head:
+                return
+            path = urlsplit(head[0].split(" ")[1]).path
+            query = urlsplit(head[0].split(" ")[1]).query
+            if path == "/azenv.php":
+                env = [f"REMOTE_ADDR = {writer.get_extra_info('peername')[0]}"]
+                for line in head[1:]:
+                    key, _, value = line.partition(":")
+                    env.append(f"HTTP_{key.strip().upper().replace('-', '_')} = {value.strip()}")
+                write_response(writer, "200 OK", "\n".join(env).encode())
+            elif path.startswith("/random/"):
+                count = int(path.removeprefix("/random/").removesuffix(".txt"))
+                body = "\n".join(
+                    f"{random.randint(1, 223)}.{random.randint(0, 255)}.{random.randint(0, 255)}"
+                    f".{random.randint(0, 255)}:{random.randint(1, 65535)}"
+                    for _ in range(count)
+                )
+                write_response(writer, "200 OK", body.encode())
+            else:
+                pages = self.build_pages(self.proxies, shuffle=True) if self.rotate_pages else self.pages
+                page = pages.get(f"{path}?{query}" if query else path)
+                etag = f'"{hash(page)}"'
+                if page is None:
+                    write_response(writer, "404 Not Found", b"")
+                elif f"If-None-Match: {etag}" in head:
+                    write_response(writer, "304 Not Modified", b"", etag=etag)
+                else:
+                    write_response(writer, "200 OK", page[0], page[1], etag=etag)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while chunk := await reader.read(65536):
+            writer.write(chunk)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+class ForwardProxy:
+    """Forward http proxy with absolute-form requests and CONNECT tunnels.
+
+    latency (float): Delay in seconds before the request is forwarded. Defaults to 0.
+    jitter (float): The delay is random within `latency * (1 ± jitter)`. Defaults to 0.
+    drop_rate (float): Probability of closing the connection without a response. Defaults to 0.
+    hang_rate (float): Probability of holding the request without a response. Defaults to 0.
+    blackhole (bool): Accept connections and never respond. Defaults to False.
+    transparent (bool): Pass the address of the client on in X-Forwarded-For. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        jitter: float = 0,
+        drop_rate: float = 0,
+        hang_rate: float = 0,
+        blackhole: bool = False,
+        transparent: bool = False,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.hang_rate = hang_rate
+        self.blackhole = blackhole
+        self.transparent = transparent
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            if self.blackhole:
+                await reader.read()
+                return
+            head = await read_head(reader)
+            if not head or random.random() < self.drop_rate:
+                return
+            if random.random() < self.hang_rate:
+                await reader.read()
+                return
+            if self.latency:
+                await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+            method, target, version = head[0].split(" ", 2)
+            if method == "CONNECT":
+                host, port = target.rsplit(":", 1)
+                upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+                writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+            else:
+                parts = urlsplit(target)
+                path = parts.path or "/"
+                if parts.query:
+                    path = f"{path}?{parts.query}"
+                upstream_reader, upstream_writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                lines = [f"{method} {path} {version}", *head[1:], f"Via: 1.1 {HOST}"]
+                if self.transparent:
+                    lines.append(f"X-Forwarded-For: {writer.get_extra_info('peername')[0]}")
+                upstream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+
+class SocksProxy:
+    """SOCKS proxy without authentication, SOCKS5 or SOCKS4 with the 4a extension.
+
+    version (int): Version of the protocol, 5 or 4. Defaults to 5.
+    latency (float): Delay in seconds before the tunnel is opened. Defaults to 0.
+    """
+
+    def __init__(self, version: int = 5, latency: float = 0) -> None:
+        self.version = version
+        self.latency = latency
+
+    async def __call__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            if self.version == 5:
+                host, port = await self.socks5_target(reader, writer)
+            else:
+                host, port = await self.socks4_target(reader)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+            except OSError:
+                writer.write(b"\x05\x05\x00\x01" + bytes(6) if self.version == 5 else b"\x00\x5b" + bytes(6))
+                return
+            writer.write(b"\x05\x00\x00\x01" + bytes(6) if self.version == 5 else b"\x00\x5a" + bytes(6))
+            await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def socks5_target(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> tuple[str, int]:
+        version, count = await reader.readexactly(2)
+        if version != 5:
+            raise ConnectionError("not a SOCKS5 greeting")
+        if 0 not in await reader.readexactly(count):
+            writer.write(b"\x05\xff")
+            raise ConnectionError("no acceptable method")
+        writer.write(b"\x05\x00")
+        _, command, _, address_type = await reader.readexactly(4)
+        if address_type == 1:
+            host = socket.inet_ntoa(await reader.readexactly(4))
+        elif address_type == 3:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        else:
+            host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+        (port,) = struct.unpack(">H", await reader.readexactly(2))
+        if command != 1:
+            raise ConnectionError("only CONNECT is supported")
+        return host, port
+
+    @staticmethod
+    async def socks4_target(reader: asyncio.StreamReader) -> tuple[str, int]:
+        version, command, port, ip = struct.unpack(">BBH4s", await reader.readexactly(8))
+        if version != 4 or command != 1:
+            raise ConnectionError("only SOCKS4 CONNECT is supported")
+        await reader.readuntil(b"\x00")
+        host = socket.inet_ntoa(ip)
+        if host.startswith("0.0.0.") and host != "0.0.0.0":
+            host = (await reader.readuntil(b"\x00"))[:-1].decode()
+        return host, port
+
+
+def get_closed_port() -> int:
+    """Get a port on which nothing is listening, connections to it are refused."""
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return int(sock.getsockname()[1])
+
+
+async def start_fleet(count: int, proxy: ForwardProxy | SocksProxy) -> list[str]:
+    servers = [await asyncio.start_server(proxy, HOST, 0, backlog=1024) for _ in range(count)]
+    return [f"{HOST}:{server.sockets[0].getsockname()[1]}" for server in servers]
+
+
+async def serve(config: dict[str, Any], conn: Connection) -> None:
+    # Connections dropped by the clients are expected, their errors are not interesting.
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: None)
+
+    proxies = await start_fleet(
+        config["proxies"],
+        ForwardProxy(
+            latency=config["latency"],
+            jitter=config["jitter"],
+            drop_rate=config["drop_rate"],
+            hang_rate=config["hang_rate"],
+        ),
+    )
+    transparent_proxies = await start_fleet(
+        config["transparent_proxies"], ForwardProxy(latency=config["latency"], transparent=True)
+    )
+    socks5_proxies = await start_fleet(config["socks5_proxies"], SocksProxy(5, latency=config["latency"]))
+    socks4_proxies = await start_fleet(config["socks4_proxies"], SocksProxy(4, latency=config["latency"]))
+    blackhole_proxies = await start_fleet(config["blackhole_proxies"], ForwardProxy(blackhole=True))
+    dead_proxies = [f"{HOST}:{get_closed_port()}" for _ in range(config["dead_proxies"])]
+
+    listed = [*proxies, *transparent_proxies, *socks5_proxies, *socks4_proxies, *blackhole_proxies, *dead_proxies]
+    random.Random(0).shuffle(listed)
+    web_server = await asyncio.start_server(Web(listed, config["rotate_pages"]), HOST, 0, backlog=4096)
+    base_url = f"http://{HOST}:{web_server.sockets[0].getsockname()[1]}"
+
+    conn.send(
+        {
+            "base_url": base_url,
+            "judge": f"{base_url}/azenv.php",
+            "proxies": proxies,
+            "transparent_proxies": transparent_proxies,
+            "socks5_proxies": socks5_proxies,
+            "socks4_proxies": socks4_proxies,
+            "blackhole_proxies": blackhole_proxies,
+            "dead_proxies": dead_proxies,
+        }
+    )
+    await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+
+def run_server_process(config: dict[str, Any], conn: Connection) -> None:
+    asyncio.run(serve(config, conn))
+
+
+class StandIns:
+    """Context manager that starts the stand-in servers in a child process.
+
+    Args:
+        proxies (int): Number of working forward proxies. Defaults to 100.
+        dead_proxies (int): Number of addresses that refuse connections. Defaults to 0.
+        latency (float): Delay of every working proxy in seconds. Defaults to 0.
+        jitter (float): Relative random spread of the delay. Defaults to 0.
+        drop_rate (float): Probability that a working proxy drops a request. Defaults to 0.
+        hang_rate (float): Probability that a working proxy holds a request without a response. Defaults to 0.
+        blackhole_proxies (int): Number of proxies that accept connections and never respond. Defaults to 0.
+        transparent_proxies (int): Number of forward proxies that pass the client address on. Defaults to 0.
+        socks5_proxies (int): Number of SOCKS5 proxies. Defaults to 0.
+        socks4_proxies (int): Number of SOCKS4 proxies. Defaults to 0.
+        rotate_pages (bool): Serve the static provider pages with their proxies in a new order on every request.
+            Defaults to False.
+    """
+
+    def __init__(
+        self,
+        proxies: int = 100,
+        dead_proxies: int = 0,
+        latency: float = 0,
+        jitter: float = 0,
+        drop_rate: float = 0,
+        hang_rate: float = 0,
+        blackhole_proxies: int = 0,
+        transparent_proxies: int = 0,
+        socks5_proxies: int = 0,
+        socks4_proxies: int = 0,
+        rotate_pages: bool = False,
+    ) -> None:
+        self.config: dict[str, Any] = {
+            "proxies": proxies,
+            "dead_proxies": dead_proxies,
+            "latency": latency,
+            "jitter": jitter,
+            "drop_rate": drop_rate,
+            "hang_rate": hang_rate,
+            "blackhole_proxies": blackhole_proxies,
+            "transparent_proxies": transparent_proxies,
+            "socks5_proxies": socks5_proxies,
+            "socks4_proxies": socks4_proxies,
+            "rotate_pages": rotate_pages,
+        }
+        self.base_url = ""
+        self.judge = ""
+        self.proxies: list[str] = []
+        self.transparent_proxies: list[str] = []
+        self.socks5_proxies: list[str] = []
+        self.socks4_proxies: list[str] = []
+        self.blackhole_proxies: list[str] = []
+        self.dead_proxies: list[str] = []
+
+    def __enter__(self) -> "StandIns":
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=run_server_process, args=(self.config, child_conn), daemon=True)
+        self._process.start()
+        addresses = self._conn.recv()
+        self.base_url = addresses["base_url"]
+        self.judge = addresses["judge"]
+        self.proxies = addresses["proxies"]
+        self.transparent_proxies = addresses["transparent_proxies"]
+        self.socks5_proxies = addresses["socks5_proxies"]
+        self.socks4_proxies = addresses["socks4_proxies"]
+        self.blackhole_proxies = addresses["blackhole_proxies"]
+        self.dead_proxies = addresses["dead_proxies"]
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._conn.send(None)
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
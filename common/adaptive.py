@@ -0,0 +1,250 @@
+import math
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Condition, Lock
+
+
+class LatencyHistogram:
+    """Streaming latency percentiles on a log-scale histogram.
+
+    Buckets grow by `growth` from `min_value`, so a percentile is known within that ratio in constant memory.
+    All counts are halved every `half_life` observations, so percentiles follow the recent latencies.
+
+    Args:
+        min_value (float): Upper bound of the first bucket in seconds. Defaults to 0.001.
+        max_value (float): Lower bound of the last bucket in seconds. Defaults to 120.
+        growth (float): Ratio of the bounds of neighbouring buckets. Defaults to 1.1.
+        half_life (int): Number of observations after which old counts weigh half. Defaults to 1000.
+    """
+
+    def __init__(
+        self, min_value: float = 0.001, max_value: float = 120, growth: float = 1.1, half_life: int = 1000
+    ) -> None:
+        self._locker = Lock()
+        self.min_value = min_value
+        self.growth = growth
+        self.half_life = half_life
+        self._log_growth = math.log(growth)
+        self._counts = [0.0] * (self._bucket(max_value) + 1)
+        self._total = 0.0
+        self._count_since_decay = 0
+        self.count = 0
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / self._log_growth) + 1
+
+    def observe(self, value: float) -> None:
+        with self._locker:
+            self._counts[min(self._bucket(value), len(self._counts) - 1)] += 1
+            self._total += 1
+            self.count += 1
+            self._count_since_decay += 1
+            if self._count_since_decay >= self.half_life:
+                self._count_since_decay = 0
+                self._counts = [count / 2 for count in self._counts]
+                self._total /= 2
+
+    def percentile(self, q: float) -> float | None:
+        """Get the upper bound of the bucket of the percentile.
+
+        Args:
+            q (float): Percentile from 0 to 100.
+
+        Returns:
+            float | None: Latency in seconds or None if nothing has been observed.
+        """
+        with self._locker:
+            if self._total == 0:
+                return None
+            rank = self._total * q / 100
+            cumulative = 0.0
+            for index, count in enumerate(self._counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return float(self.min_value * self.growth**index)
+            return float(self.min_value * self.growth ** (len(self._counts) - 1))
+
+
+class TimeoutController:
+    """Timeouts of request classes derived from their observed latencies.
+
+    The timeout of a class is `factor` times its 99th percentile of successful responses, never longer than
+    the default timeout of the call and never shorter than `min_timeout`. Until `min_samples` responses are
+    observed, the default timeout is used.
+
+    Args:
+        factor (float): Multiplier of the 99th percentile. Defaults to 1.5.
+        min_timeout (float): Lower bound of the timeouts in seconds. Defaults to 0.5.
+        min_samples (int): Number of responses of a class before its timeout adapts. Defaults to 50.
+    """
+
+    def __init__(self, factor: float = 1.5, min_timeout: float = 0.5, min_samples: int = 50) -> None:
+        self._locker = Lock()
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self.factor = factor
+        self.min_timeout = min_timeout
+        self.min_samples = min_samples
+
+    def histogram(self, request_class: str) -> LatencyHistogram:
+        with self._locker:
+            if request_class not in self._histograms:
+                self._histograms[request_class] = LatencyHistogram()
+            return self._histograms[request_class]
+
+    def observe(self, request_class: str, latency: float) -> None:
+        """Record the response time of a successful request."""
+        self.histogram(request_class).observe(latency)
+
+    def timeout(self, request_class: str, default: float) -> float:
+        """Get the timeout for the next request of the class."""
+        histogram = self.histogram(request_class)
+        p99 = histogram.percentile(99)
+        if histogram.count < self.min_samples or p99 is None:
+            return default
+        return min(default, max(self.min_timeout, p99 * self.factor))
+
+    def percentiles(self) -> dict[str, dict[str, float | None]]:
+        """Get p50/p95/p99 of every request class."""
+        with self._locker:
+            histograms = dict(self._histograms)
+        return {
+            name: {f"p{q}": histogram.percentile(q) for q in (50, 95, 99)} for name, histogram in histograms.items()
+        }
+
+
+def get_load_per_cpu() -> float | None:
+    """Get the 1-minute load average per CPU, None where it is unknown."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+class AimdLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease.
+
+    After every window of results the success rate of the window is compared with its moving average. If it has
+    dropped by more than `tolerance` and by more than `z_score` standard deviations of the count of successes
+    expected at the average rate, or the load of the machine is above `max_load_per_cpu`, the extra concurrency
+    hurts and the limit is multiplied by `decrease_factor`. Otherwise it grows by `increase`.
+
+    Free proxies succeed a few times in a hundred, a window of 100 results holds a couple of successes and its
+    rate is mostly noise. A window therefore lasts until `min_expected_successes` are expected at the average
+    rate, at least `window` and at most `max_window` results, and a drop within the noise of the window is not
+    counted.
+
+    Args:
+        max_limit (int): Upper bound of the limit.
+        min_limit (int): Lower bound of the limit. Defaults to 1.
+        initial (int | None): Initial limit. Defaults to `max_limit`.
+        increase (int): Additive increase. Defaults to 1.
+        decrease_factor (float): Multiplicative decrease. Defaults to 0.7.
+        window (int): Minimum number of results between adjustments. Defaults to 100.
+        max_window (int): Maximum number of results between adjustments. Defaults to 5000.
+        min_expected_successes (float): Successes expected at the average rate that close a window.
+            Defaults to 50.
+        tolerance (float): Relative drop of the success rate that triggers a decrease. Defaults to 0.3.
+        z_score (float): Standard deviations of the expected count of successes that a drop must exceed.
+            Defaults to 3.5.
+        max_load_per_cpu (float): Load average per CPU that triggers a decrease. Defaults to 2.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial: int | None = None,
+        increase: int = 1,
+        decrease_factor: float = 0.7,
+        window: int = 100,
+        max_window: int = 5000,
+        min_expected_successes: float = 50,
+        tolerance: float = 0.3,
+        z_score: float = 3.5,
+        max_load_per_cpu: float = 2,
+    ) -> None:
+        self._condition = Condition()
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = max(self.min_limit, min(initial or max_limit, max_limit))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.window = window
+        self.max_window = max(window, max_window)
+        self.min_expected_successes = min_expected_successes
+        self.tolerance = tolerance
+        self.z_score = z_score
+        self.max_load_per_cpu = max_load_per_cpu
+
+        self.in_flight = 0
+        self._count_of_results = 0
+        self._count_of_successes = 0
+        self._success_rate: float | None = None
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one unit of concurrency, wait while the limit is reached."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def record(self, success: bool) -> None:
+        """Record the result of a unit of work done under the limit."""
+        self.record_many(1, int(success))
+
+    def record_many(self, count_of_results: int, count_of_successes: int) -> None:
+        """Record a batch of results under one acquisition of the lock."""
+        with self._condition:
+            self._count_of_results += count_of_results
+            self._count_of_successes += count_of_successes
+            if not self._is_window_closed():
+                return
+
+            dropped = self._has_dropped(self._count_of_results, self._count_of_successes)
+            success_rate = self._count_of_successes / self._count_of_results
+            self._count_of_results = self._count_of_successes = 0
+            load = get_load_per_cpu()
+
+            if dropped or (load is not None and load > self.max_load_per_cpu):
+                self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase)
+                self._condition.notify_all()
+
+            if self._success_rate is None:
+                self._success_rate = success_rate
+            else:
+                self._success_rate += 0.3 * (success_rate - self._success_rate)
+
+    def _is_window_closed(self) -> bool:
+        if self._count_of_results < self.window:
+            return False
+        if self._count_of_results >= self.max_window:
+            return True
+        if self._success_rate is None:
+            # The first window sets the average, it needs as many successes as a window is expected to have.
+            return self._count_of_successes >= self.min_expected_successes
+        return self._count_of_results * self._success_rate >= self.min_expected_successes
+
+    def _has_dropped(self, count_of_results: int, count_of_successes: int) -> bool:
+        """Whether the successes of the window are below the average rate beyond the noise of the sample."""
+        if self._success_rate is None:
+            return False
+        expected = count_of_results * self._success_rate
+        deviation = math.sqrt(expected * (1 - self._success_rate))
+        return (
+            count_of_successes < expected * (1 - self.tolerance)
+            and count_of_successes < expected - self.z_score * deviation
+        )
+
+
+TIMEOUTS = TimeoutController()
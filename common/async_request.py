@@ -0,0 +1,195 @@
+import asyncio
+import ssl
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+from .adaptive import TIMEOUTS, TimeoutController
+from .smart_request import HEADERS, REQUEST_ERRORS, error_reason
+from .tunnel import (
+    AsyncTunnel,
+    HandshakeError,
+    ProxyProtocol,
+    detection_order,
+    http_status,
+    is_other_protocol,
+    split_url,
+)
+
+
+class AsyncResponse:
+    """Minimal response of the asynchronous request.
+
+    proxy_protocol (ProxyProtocol | None): Protocol of the proxy of the request. Defaults to None.
+    """
+
+    __slots__ = ("status_code", "headers", "content", "proxy_protocol")
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: dict[str, str],
+        content: bytes,
+        proxy_protocol: ProxyProtocol | None = None,
+    ) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.proxy_protocol = proxy_protocol
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+class AsyncSmartRequest:
+    """Asynchronous HTTP/1.1 request through an optional HTTP or SOCKS proxy.
+
+    Only what the proxy checks need is implemented: one request per connection, no redirects and
+    `https` urls through a tunnel.
+
+    max_body_size (int): The body of the response is cut to this size. Defaults to 1 MiB.
+    timeouts (TimeoutController | None): Adaptive timeouts of request classes. Defaults to the shared TIMEOUTS.
+    timeout_backoff (float): Seconds added to the timeout on every retry. Defaults to 1.
+    """
+
+    def __init__(
+        self, max_body_size: int = 1024 * 1024, timeouts: TimeoutController | None = None, timeout_backoff: float = 1
+    ) -> None:
+        self.max_body_size = max_body_size
+        self.timeouts = timeouts or TIMEOUTS
+        self.timeout_backoff = timeout_backoff
+        self._ssl_context = ssl.create_default_context()
+
+    async def request(
+        self,
+        url: str,
+        method: str = "GET",
+        timeout: float = 6,
+        retry: int = 1,
+        headers: dict[str, Any] | None = HEADERS,
+        proxy: str | None = None,
+        proxy_protocol: ProxyProtocol | None = ProxyProtocol.HTTP,
+        request_class: str | None = None,
+    ) -> AsyncResponse | None:
+        """Send the request.
+
+        Args:
+            url (str): Url of the request.
+            method (str): Method of the request. Defaults to "GET".
+            timeout (float): Timeout of the whole request in seconds. Defaults to 6.
+            retry (int): Number of attempts. Defaults to 1.
+            headers (dict[str, Any] | None): Headers of the request. Defaults to HEADERS.
+            proxy (str | None): Proxy address as `ip:port`. Defaults to None.
+            proxy_protocol (ProxyProtocol | None): Protocol of the proxy, None detects it and the response
+                tells the detected one. Defaults to ProxyProtocol.HTTP.
+            request_class (str | None): Class of the request for the adaptive timeout, `timeout` is then
+                the upper bound. Defaults to None.
+
+        Returns:
+            AsyncResponse | None: Response or None if all attempts have failed.
+        """
+        if request_class is not None:
+            timeout = self.timeouts.timeout(request_class, timeout)
+
+        for _ in range(retry):
+            try:
+                start_time = time.monotonic()
+                resp = await asyncio.wait_for(
+                    self._request(url, method, headers or {}, proxy, proxy_protocol), timeout
+                )
+                if request_class is not None:
+                    self.timeouts.observe(request_class, time.monotonic() - start_time)
+                return resp
+            except Exception as exc:
+                REQUEST_ERRORS.inc(request_class or "", error_reason(exc))
+                timeout += self.timeout_backoff
+        return None
+
+    async def __call__(self, *args: Any, **kwargs: Any) -> AsyncResponse | None:
+        return await self.request(*args, **kwargs)
+
+    async def _request(
+        self,
+        url: str,
+        method: str,
+        headers: dict[str, Any],
+        proxy: str | None,
+        proxy_protocol: ProxyProtocol | None,
+    ) -> AsyncResponse:
+        host, port, _, is_https = split_url(url)
+        if proxy is None:
+            return await self._exchange(
+                AsyncTunnel(f"{host}:{port}", host, port, is_https), None, url, method, headers
+            )
+
+        protocols = detection_order(proxy_protocol, is_https)
+        for protocol in protocols[:-1]:
+            try:
+                return await self._exchange(AsyncTunnel(proxy, host, port, is_https), protocol, url, method, headers)
+            except Exception as exc:
+                if not is_other_protocol(exc):
+                    raise
+        return await self._exchange(AsyncTunnel(proxy, host, port, is_https), protocols[-1], url, method, headers)
+
+    async def _exchange(
+        self, tunnel: AsyncTunnel, protocol: ProxyProtocol | None, url: str, method: str, headers: dict[str, Any]
+    ) -> AsyncResponse:
+        """Send the request on a new connection, through the proxy of the tunnel unless the protocol is None."""
+        host, _, target, is_https = split_url(url)
+        if protocol is ProxyProtocol.HTTP and not is_https:
+            target = url
+        try:
+            await tunnel.open(protocol)
+            reader, writer = await asyncio.open_connection(
+                sock=tunnel.detach(),
+                ssl=self._ssl_context if is_https else None,
+                server_hostname=host if is_https else None,
+            )
+        finally:
+            tunnel.close()
+
+        try:
+            head = [f"{method} {target} HTTP/1.1", f"Host: {urlsplit(url).netloc}", "Connection: close"]
+            head.extend(f"{key}: {value}" for key, value in headers.items())
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            resp = await self._read_response(reader)
+            resp.proxy_protocol = protocol
+            return resp
+        finally:
+            writer.close()
+
+    async def _read_response(self, reader: asyncio.StreamReader) -> AsyncResponse:
+        status_line = await reader.readline()
+        status_code = http_status(status_line)
+        if status_code is None:
+            raise HandshakeError(f"The reply is not an HTTP response, it starts with {status_line[:16]!r}")
+
+        headers: dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            content = b""
+            while len(content) < self.max_body_size:
+                size = int((await reader.readline()).split(b";", 1)[0], 16)
+                if size == 0:
+                    break
+                content += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            content = await reader.readexactly(min(int(headers["content-length"]), self.max_body_size))
+        else:
+            content = b""
+            while len(content) < self.max_body_size:
+                chunk = await reader.read(self.max_body_size - len(content))
+                if not chunk:
+                    break
+                content += chunk
+
+        return AsyncResponse(status_code, headers, content)
@@ -1,9 +1,16 @@
+import atexit
 import logging
 import logging.config
+import time
 from functools import wraps
-from logging import Logger
+from logging import Filter, Logger, LogRecord
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
 from typing import Callable, ParamSpec, TypeVar
 
+MAIN_LOGGER = "MLGGR"
+
 logger_config = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -28,7 +35,7 @@ logger_config = {
     },
     "loggers": {
         # Main Logger
-        "MLGGR": {
+        MAIN_LOGGER: {
             "level": logging.DEBUG,
             "handlers": [
                 "console",
@@ -44,10 +51,33 @@ logger_config = {
 
 
 class MyLogger:
-    """Create a logger with custom settings."""
+    """Create a logger with custom settings.
+
+    The config is applied once per process. The handlers of the main logger are then moved behind a queue and
+    written by a background thread, so a log call only puts the record in the queue, even under a lock.
+    """
+
+    _locker = Lock()
+    _listener: QueueListener | None = None
 
     def __init__(self) -> None:
+        if MyLogger._listener is not None:
+            return
+        with MyLogger._locker:
+            if MyLogger._listener is None:
+                MyLogger._listener = self._configure()
+
+    @staticmethod
+    def _configure() -> QueueListener:
         logging.config.dictConfig(logger_config)
+        main_logger = logging.getLogger(MAIN_LOGGER)
+        queue: SimpleQueue[LogRecord] = SimpleQueue()
+        listener = QueueListener(queue, *main_logger.handlers, respect_handler_level=True)
+        main_logger.handlers = [QueueHandler(queue)]
+        listener.start()
+        # Writes the records left in the queue at the exit.
+        atexit.register(listener.stop)
+        return listener
 
     def get_logger(self, name: str | None = None) -> Logger:
         """Get a logger object."""
@@ -56,7 +86,57 @@ class MyLogger:
 
 def get_main_logger() -> Logger:
     """Get the main custom logger."""
-    return MyLogger().get_logger("MLGGR")
+    return MyLogger().get_logger(MAIN_LOGGER)
+
+
+class RateLimitFilter(Filter):
+    """Pass at most `rate` records per second with bursts of `burst` records, drop the rest.
+
+    The number of the dropped records is added to the next passed record, so the volume stays visible.
+
+    Args:
+        rate (float): Records passed per second.
+        burst (float): Number of records that can be passed at once. Defaults to `rate`.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None) -> None:
+        super().__init__()
+        self._locker = Lock()
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._dropped = 0
+
+    def filter(self, record: LogRecord) -> bool:
+        with self._locker:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens < 1:
+                self._dropped += 1
+                return False
+            self._tokens -= 1
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages dropped)"
+            record.args = None
+        return True
+
+
+def get_rate_limited_logger(name: str, rate: float, burst: float | None = None) -> Logger:
+    """Get a child of the main logger for high-volume messages, e.g. one per proxy.
+
+    Args:
+        name (str): Name of the child logger.
+        rate (float): Records written per second, the rest are dropped and counted.
+        burst (float | None): Number of records that can be written at once. Defaults to `rate`.
+    """
+    logger = get_main_logger().getChild(name)
+    with MyLogger._locker:
+        if not any(isinstance(log_filter, RateLimitFilter) for log_filter in logger.filters):
+            logger.addFilter(RateLimitFilter(rate, burst))
+    return logger
 
 
 P = ParamSpec("P")
@@ -66,10 +146,10 @@ R = TypeVar("R")
 def log(func: Callable[P, R]) -> Callable[P, R]:
     """Decorator for functions that need to be logged."""
 
+    logger: Logger = get_main_logger()
+
     @wraps(func)
     def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-        logger: Logger = get_main_logger()
-
         logger.debug(f"Enter: {func.__qualname__}")
         try:
             result = func(*args, **kwargs)
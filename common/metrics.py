@@ -0,0 +1,345 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, local
+from typing import Any
+
+Labels = tuple[str, ...]
+# Name suffix, labels and value of a sample in the Prometheus text format.
+Sample = tuple[str, dict[str, str], float]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class PerThreadCells:
+    """Values of a metric aggregated per thread.
+
+    Every thread updates only its own cell, so recording takes no lock. Readers add up the cells. The cells of
+    finished threads are merged into one by the readers and whenever a new thread gets its cell, so short-lived
+    threads do not pile up even if nothing reads the metric.
+
+    Args:
+        size (int): Number of values of every label set.
+    """
+
+    def __init__(self, size: int) -> None:
+        self._local = local()
+        self._locker = Lock()
+        self._cells: list[tuple[Thread, dict[Labels, list[float]]]] = []
+        self._merged: dict[Labels, list[float]] = {}
+        self.size = size
+
+    def values(self, labels: Labels) -> list[float]:
+        """Get the values of the label set in the cell of the current thread."""
+        try:
+            cell: dict[Labels, list[float]] = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = {}
+            with self._locker:
+                self._merge_finished()
+                self._cells.append((threading.current_thread(), cell))
+        values = cell.get(labels)
+        if values is None:
+            values = cell[labels] = [0.0] * self.size
+        return values
+
+    def totals(self) -> dict[Labels, list[float]]:
+        """Get the sums of the values of all the threads."""
+        with self._locker:
+            self._merge_finished()
+            totals = {labels: list(values) for labels, values in self._merged.items()}
+            for _, cell in self._cells:
+                self._add(totals, cell)
+        return totals
+
+    def _merge_finished(self) -> None:
+        """Merge the cells of the finished threads, under the lock."""
+        alive: list[tuple[Thread, dict[Labels, list[float]]]] = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                self._add(self._merged, cell)
+        self._cells = alive
+
+    def _add(self, target: dict[Labels, list[float]], cell: dict[Labels, list[float]]) -> None:
+        for labels, values in list(cell.items()):
+            total = target.setdefault(labels, [0.0] * self.size)
+            for index, value in enumerate(values):
+                total[index] += value
+
+
+class Metric:
+    """Named metric with a set of labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names: Labels = tuple(labels)
+
+    def _labels(self, labels: Labels) -> dict[str, str]:
+        return dict(zip(self.label_names, labels))
+
+    def samples(self) -> list[Sample]:
+        raise NotImplementedError
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [{"labels": labels, "value": value} for _, labels, value in self.samples()]
+
+
+class Counter(Metric):
+    """Monotonic counter, recorded without locks."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._cells = PerThreadCells(1)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Add to the counter of the label values."""
+        self._cells.values(labels)[0] += amount
+
+    def value(self, *labels: str) -> float:
+        """Get the current value for the label values."""
+        return self._cells.totals().get(labels, [0.0])[0]
+
+    def samples(self) -> list[Sample]:
+        return [("_total", self._labels(labels), values[0]) for labels, values in self._cells.totals().items()]
+
+
+class Gauge(Metric):
+    """Current value, either set or read from a function at collection time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+        self._function: Callable[[], float | dict[Labels, float]] | None = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def set_function(self, function: Callable[[], float | dict[Labels, float]] | None) -> None:
+        """Read the gauge from the function, e.g. the size of a queue. It replaces the previous function.
+
+        Args:
+            function (Callable[[], float | dict[Labels, float]] | None): Returns the value or the values by the
+                label values. None goes back to the set values.
+        """
+        self._function = function
+
+    def value(self, *labels: str) -> float | None:
+        """Get the current value for the label values, None if there is none."""
+        for _, named, value in self.samples():
+            if tuple(named.values()) == labels:
+                return value
+        return None
+
+    def samples(self) -> list[Sample]:
+        if self._function is None:
+            values = dict(self._values)
+        else:
+            result = self._function()
+            values = result if isinstance(result, dict) else {(): result}
+        return [("", self._labels(labels), float(value)) for labels, value in values.items()]
+
+
+class Histogram(Metric):
+    """Distribution of the observed values in buckets, recorded without locks.
+
+    Args:
+        name (str): Name of the metric.
+        documentation (str): Help text of the metric.
+        labels (Iterable[str]): Names of the labels. Defaults to ().
+        buckets (Iterable[float]): Upper bounds of the buckets in increasing order. Defaults to DEFAULT_BUCKETS.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Counts of the buckets, of the values above the last bound and the sum of the values.
+        self._cells = PerThreadCells(len(self.buckets) + 2)
+
+    def observe(self, value: float, *labels: str) -> None:
+        values = self._cells.values(labels)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self) -> list[Sample]:
+        samples: list[Sample] = []
+        for labels, values in self._cells.totals().items():
+            named = self._labels(labels)
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, float("inf")), values):
+                cumulative += count
+                samples.append(("_bucket", {**named, "le": format_value(bound)}, cumulative))
+            samples.append(("_sum", named, values[-1]))
+            samples.append(("_count", named, cumulative))
+        return samples
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        result: list[dict[str, Any]] = []
+        for labels, values in self._cells.totals().items():
+            count = sum(values[:-1])
+            result.append(
+                {
+                    "labels": self._labels(labels),
+                    "count": count,
+                    "sum": values[-1],
+                    "p50": self._percentile(values, count, 50),
+                    "p95": self._percentile(values, count, 95),
+                    "p99": self._percentile(values, count, 99),
+                }
+            )
+        return result
+
+    def _percentile(self, values: list[float], count: float, q: float) -> float | None:
+        """Get the upper bound of the bucket of the percentile, None above the last bound."""
+        if not count:
+            return None
+        cumulative = 0.0
+        for bound, bucket_count in zip(self.buckets, values):
+            cumulative += bucket_count
+            if cumulative >= count * q / 100:
+                return bound
+        return None
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Registry of the metrics of the process.
+
+    Metrics are created once by name, asking for the same name again returns the same metric.
+    """
+
+    def __init__(self) -> None:
+        self._locker = Lock()
+        self._metrics: dict[str, Metric] = {}
+
+    def _get(self, metric: Metric) -> Any:
+        with self._locker:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError(f"Metric {metric.name!r} is already registered as a {existing.kind}")
+        return existing
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        counter: Counter = self._get(Counter(name, documentation, labels))
+        return counter
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        gauge: Gauge = self._get(Gauge(name, documentation, labels))
+        return gauge
+
+    def histogram(
+        self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        histogram: Histogram = self._get(Histogram(name, documentation, labels, buckets))
+        return histogram
+
+    def metrics(self) -> list[Metric]:
+        with self._locker:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def to_prometheus(self) -> str:
+        """Get all the metrics in the Prometheus text format."""
+        lines: list[str] = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+                lines.append(
+                    f"{metric.name}{suffix}{{{text}}} {format_value(value)}"
+                    if text
+                    else f"{metric.name}{suffix} {format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict[str, Any]:
+        """Get all the metrics as a JSON-serializable dict, histograms with their percentiles."""
+        return {
+            "time": time.time(),
+            "metrics": {metric.name: metric.snapshot() for metric in self.metrics()},
+        }
+
+
+class MetricsServer:
+    """Local HTTP endpoint of the metrics: `/metrics` in the Prometheus text format, `/metrics.json` as a snapshot.
+
+    Args:
+        registry (MetricsRegistry): Metrics to serve.
+        host (str): Host to listen on. Defaults to "127.0.0.1".
+        port (int): Port to listen on, 0 picks a free one. Defaults to 9108.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108) -> None:
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: ThreadingHTTPServer | None = None
+        self._thread: Thread | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/metrics"
+
+    def start(self) -> None:
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path == "/metrics":
+                    body = registry.to_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = Thread(target=self._server.serve_forever, name="METRICS", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+METRICS = MetricsRegistry()
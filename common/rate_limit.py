@@ -0,0 +1,70 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, the size of a burst.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._locker = Lock()
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def acquire(self) -> None:
+        """Take a token, wait until one is available."""
+        while True:
+            with self._locker:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = (1 - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class HostLimiter:
+    """Per-host limits of concurrent requests and of the request rate.
+
+    Args:
+        max_concurrency (int): Maximum number of requests in flight to one host. Defaults to 4.
+        rate (float): Maximum number of requests per second to one host. Defaults to 5.
+        burst (float): Number of requests to one host that can be sent at once. Defaults to 5.
+    """
+
+    def __init__(self, max_concurrency: int = 4, rate: float = 5, burst: float = 5) -> None:
+        self._locker = Lock()
+        self._semaphores: dict[str, BoundedSemaphore] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        """Wait for the limits of the host of the url and hold a slot of the host."""
+        host = urlsplit(url).netloc
+        with self._locker:
+            if host not in self._semaphores:
+                self._semaphores[host] = BoundedSemaphore(self.max_concurrency)
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            semaphore = self._semaphores[host]
+            bucket = self._buckets[host]
+
+        bucket.acquire()
+        with semaphore:
+            yield
+
+
+HOST_LIMITER = HostLimiter()
@@ -0,0 +1,370 @@
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Mapping
+from email.utils import parsedate_to_datetime
+from threading import Event, Lock
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .metrics import METRICS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    reason TEXT,
+    headers TEXT NOT NULL,
+    content BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+# Statuses that are cacheable by default, RFC 9110 section 15.1.
+CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501))
+CACHEABLE_METHODS = frozenset(("GET", "HEAD"))
+
+CACHE_REQUESTS = METRICS.counter(
+    "http_cache_requests",
+    "Lookups of the response cache by outcome: memory, disk, collapsed into a fetch in flight, miss.",
+    ("outcome",),
+)
+CACHE_BYTES = METRICS.gauge("http_cache_bytes", "Size of the cached responses by tier.", ("tier",))
+
+
+class CachedResponse:
+    """Response stored in the cache."""
+
+    __slots__ = ("url", "status", "reason", "headers", "content", "expires_at")
+
+    def __init__(
+        self, url: str, status: int, reason: str | None, headers: dict[str, str], content: bytes, expires_at: float
+    ) -> None:
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_response(cls, resp: Response, expires_at: float) -> "CachedResponse":
+        return cls(resp.url, resp.status_code, resp.reason, dict(resp.headers), resp.content, expires_at)
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(key) + len(value) for key, value in self.headers.items())
+
+    def to_response(self) -> Response:
+        """Build a new response, every caller gets its own copy."""
+        resp = Response()
+        resp.url = self.url
+        resp.status_code = self.status
+        resp.reason = self.reason  # type: ignore[assignment]
+        resp.headers = CaseInsensitiveDict(self.headers)
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = self.content
+        return resp
+
+
+def cache_control_ttl(headers: Mapping[str, str], now: float | None = None) -> float | None:
+    """Get the freshness lifetime set by the server in `Cache-Control` or `Expires`.
+
+    Returns:
+        float | None: Lifetime in seconds, 0 if the response must not be cached, None if the server sets none.
+    """
+    directives: dict[str, str] = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    if "max-age" in directives:
+        try:
+            age = float(headers.get("Age", 0))
+            return max(0.0, int(directives["max-age"]) - age)
+        except ValueError:
+            return 0
+
+    expires = headers.get("Expires")
+    if expires is None:
+        return None
+    try:
+        expires_at = parsedate_to_datetime(expires).timestamp()
+        date = headers.get("Date")
+        date_at = parsedate_to_datetime(date).timestamp() if date else now if now is not None else time.time()
+    except (TypeError, ValueError):
+        # An invalid date means that the response has already expired.
+        return 0
+    return max(0.0, expires_at - date_at)
+
+
+class ResponseCache:
+    """Cache of responses with a memory tier and an optional SQLite tier on disk.
+
+    The lifetime of a response is the TTL of the first rule whose pattern is found in the url, or `default_ttl`.
+    With `respect_cache_control`, `no-store` and `no-cache` keep the response out of the cache and a shorter
+    `max-age` or `Expires` of the server wins. Only GET and HEAD responses with a cacheable status are stored.
+    Request headers do not bypass the cache: the default HEADERS ask the proxies not to serve cached pages,
+    this cache is configured by its rules instead.
+
+    Both tiers evict the least recently used responses beyond their size. Responses are written through to the
+    disk, which keeps them over restarts. Concurrent fetches of the same url collapse into one request in flight.
+
+    Args:
+        ttl_rules (Iterable[tuple[str, float]]): Regular expressions of urls and the TTL of their responses in
+            seconds, 0 does not cache the matched urls. Defaults to ().
+        default_ttl (float | None): TTL of the urls without a rule, None caches them only for the lifetime set
+            by the server. Defaults to None.
+        respect_cache_control (bool): Follow the `Cache-Control` and `Expires` of the responses. Defaults to True.
+        max_memory_bytes (int): Size of the memory tier. Defaults to 64 MiB.
+        path (str | None): Path of the SQLite database of the disk tier, None keeps responses in memory only.
+            Defaults to None.
+        max_disk_bytes (int): Size of the disk tier. Defaults to 1 GiB.
+    """
+
+    def __init__(
+        self,
+        ttl_rules: Iterable[tuple[str, float]] = (),
+        default_ttl: float | None = None,
+        respect_cache_control: bool = True,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        path: str | None = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        self._locker = Lock()
+        self._memory: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._memory_bytes = 0
+        # Fetches in flight by key, the event is set when the response has been stored.
+        self._in_flight: dict[str, tuple[Event, list[Response | None]]] = {}
+
+        self.ttl_rules = [(re.compile(pattern), ttl) for pattern, ttl in ttl_rules]
+        self.default_ttl = default_ttl
+        self.respect_cache_control = respect_cache_control
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.path = path
+
+        self._conn: sqlite3.Connection | None = None
+        self._disk_bytes = 0
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            CACHE_BYTES.set(self._disk_bytes, "disk")
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        return f"{method.upper()} {url}"
+
+    def ttl(self, url: str, resp: Response) -> float:
+        """Get the lifetime of the response in seconds, 0 if it must not be cached."""
+        if resp.status_code not in CACHEABLE_STATUSES:
+            return 0
+        ttl = self.default_ttl
+        for pattern, rule_ttl in self.ttl_rules:
+            if pattern.search(url):
+                ttl = rule_ttl
+                break
+        if self.respect_cache_control:
+            server_ttl = cache_control_ttl(resp.headers)
+            if server_ttl is not None:
+                ttl = server_ttl if ttl is None else min(ttl, server_ttl)
+        return ttl or 0
+
+    def get(self, method: str, url: str) -> Response | None:
+        """Get a fresh response from the memory or the disk."""
+        if method.upper() not in CACHEABLE_METHODS:
+            return None
+        key = self.key(method, url)
+        now = time.time()
+        with self._locker:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._memory.move_to_end(key)
+                    CACHE_REQUESTS.inc("memory")
+                    return entry.to_response()
+                self._drop(key)
+
+            entry = self._load(key, now)
+            if entry is not None:
+                self._remember(key, entry)
+                CACHE_REQUESTS.inc("disk")
+                return entry.to_response()
+        return None
+
+    def put(self, method: str, url: str, resp: Response) -> bool:
+        """Store the response if it is cacheable, returns whether it has been stored."""
+        if method.upper() not in CACHEABLE_METHODS:
+            return False
+        ttl = self.ttl(url, resp)
+        if ttl <= 0:
+            return False
+        key = self.key(method, url)
+        entry = CachedResponse.from_response(resp, time.time() + ttl)
+        with self._locker:
+            self._remember(key, entry)
+            self._save(key, entry)
+        return True
+
+    def fetch(self, method: str, url: str, send: Callable[[], Response | None]) -> Response | None:
+        """Get the response from the cache or send the request, one request in flight per url.
+
+        Callers that arrive while the url is fetched wait for that fetch and get a copy of its response if it is
+        cacheable or successful. If the fetch has failed or got an error, e.g. a 403 or a 5xx from a bad proxy of
+        the leader, they send their own request, so an error of one proxy is not charged to the proxies of others.
+
+        Args:
+            method (str): Method of the request.
+            url (str): Url of the request.
+            send (Callable[[], Response | None]): Sends the request.
+
+        Returns:
+            Response | None: The response, None if the request has failed.
+        """
+        if method.upper() not in CACHEABLE_METHODS:
+            return send()
+        resp = self.get(method, url)
+        if resp is not None:
+            return resp
+
+        key = self.key(method, url)
+        with self._locker:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                in_flight = self._in_flight[key] = (Event(), [])
+                leader = True
+            else:
+                leader = False
+
+        event, shared = in_flight
+        if not leader:
+            event.wait()
+            if shared[0] is not None:
+                CACHE_REQUESTS.inc("collapsed")
+                return copy_response(shared[0])
+            return send()
+
+        CACHE_REQUESTS.inc("miss")
+        resp = None
+        collapsible = False
+        try:
+            resp = send()
+            if resp is not None:
+                collapsible = self.put(method, url, resp) or resp.ok
+        finally:
+            with self._locker:
+                del self._in_flight[key]
+            shared.append(resp if collapsible else None)
+            event.set()
+        return resp
+
+    def clear(self) -> None:
+        """Drop all the responses of both tiers."""
+        with self._locker:
+            self._memory.clear()
+            self._memory_bytes = 0
+            CACHE_BYTES.set(0, "memory")
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses")
+                self._disk_bytes = 0
+                CACHE_BYTES.set(0, "disk")
+
+    def close(self) -> None:
+        with self._locker:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        """Put the entry in the memory tier, larger than an eighth of the tier it stays on disk only."""
+        self._drop(key)
+        size = entry.size
+        if size > self.max_memory_bytes // 8:
+            return
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+        CACHE_BYTES.set(self._memory_bytes, "memory")
+
+    def _drop(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry.size
+
+    def _load(self, key: str, now: float) -> CachedResponse | None:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT url, status, reason, headers, content, expires_at, size FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            if row[5] <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= row[6]
+                CACHE_BYTES.set(self._disk_bytes, "disk")
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return CachedResponse(row[0], row[1], row[2], json.loads(row[3]), row[4], row[5])
+
+    def _save(self, key: str, entry: CachedResponse) -> None:
+        if self._conn is None:
+            return
+        size = entry.size
+        with self._conn:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    entry.url,
+                    entry.status,
+                    entry.reason,
+                    json.dumps(entry.headers),
+                    entry.content,
+                    entry.expires_at,
+                    time.time(),
+                    size,
+                ),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                evicted: list[tuple[str]] = []
+                for evicted_key, evicted_size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed_at"
+                ):
+                    if self._disk_bytes <= self.max_disk_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    self._disk_bytes -= evicted_size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        CACHE_BYTES.set(self._disk_bytes, "disk")
+
+
+def copy_response(resp: Response) -> Response:
+    """Copy the response for another caller, the content is shared."""
+    copy = CachedResponse.from_response(resp, 0).to_response()
+    copy.elapsed = resp.elapsed
+    return copy
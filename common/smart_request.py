@@ -1,8 +1,15 @@
+import asyncio
+import time
 from typing import Any
 
-import requests
+from requests.exceptions import Timeout
 from requests.models import Response
 
+from .adaptive import TIMEOUTS, TimeoutController
+from .metrics import METRICS
+from .response_cache import ResponseCache
+from .transport import DEFAULT_TRANSPORT, Transport
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/104.0.0.0 Safari/537.36",
     "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -11,21 +18,106 @@ HEADERS = {
     "Referer": "https://www.google.com/",
 }
 
+REQUEST_ERRORS = METRICS.counter(
+    "http_request_errors", "Failed request attempts by request class and reason.", ("request_class", "reason")
+)
+
+
+def error_reason(exc: BaseException) -> str:
+    """Get the reason of a failed request: timeout, refused, reset or other.
+
+    The library errors wrap the socket errors, the causes are looked through.
+    """
+    errors: list[BaseException] = [exc]
+    seen: set[int] = set()
+    while errors:
+        error = errors.pop()
+        if id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, Timeout)):
+            return "timeout"
+        if isinstance(error, ConnectionRefusedError):
+            return "refused"
+        if isinstance(error, (ConnectionResetError, ConnectionAbortedError)):
+            return "reset"
+        causes = [error.__cause__, error.__context__, getattr(error, "reason", None), *error.args]
+        errors.extend(cause for cause in causes if isinstance(cause, BaseException))
+    return "other"
+
 
 class SmartRequest:
-    """Request implementation with custom settings."""
+    """Request implementation with custom settings.
+
+    transport (Transport | None): Pool of keep-alive sessions. Defaults to the shared DEFAULT_TRANSPORT.
+    timeouts (TimeoutController | None): Adaptive timeouts of request classes. Defaults to the shared TIMEOUTS.
+    timeout_backoff (float): Seconds added to the timeout on every retry. Defaults to 1.
+    cache (ResponseCache | None): Cache of the responses of GET and HEAD requests, shared by all proxies.
+        Defaults to None, every request is sent.
+    """
+
+    def __init__(
+        self,
+        transport: Transport | None = None,
+        timeouts: TimeoutController | None = None,
+        timeout_backoff: float = 1,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        self.transport = transport or DEFAULT_TRANSPORT
+        self.timeouts = timeouts or TIMEOUTS
+        self.timeout_backoff = timeout_backoff
+        self.cache = cache
 
     def request(
         self,
         url: str,
         method: str = "GET",
-        timeout: int = 6,
+        timeout: float = 6,
         retry: int = 1,
         headers: dict[str, Any] | None = HEADERS,
         data: dict[str, Any] | None = None,
         proxies: dict[str, Any] | None = None,
         allow_redirects: bool = True,
+        request_class: str | None = None,
+        cached: bool = True,
     ) -> Response | None:
+        """Send the request.
+
+        With `request_class` the timeout adapts to the latencies observed for that class,
+        `timeout` is then the upper bound.
+
+        With a cache, a fresh cached response is returned without a request and concurrent requests of the same
+        url wait for the one in flight. With `cached=False` the request is always sent, its response is still
+        stored, e.g. for a backup request that must not wait for the request it backs up.
+        """
+
+        def send() -> Response | None:
+            return self._send(url, method, timeout, retry, headers, data, proxies, allow_redirects, request_class)
+
+        if self.cache is None or data is not None:
+            return send()
+        if not cached:
+            resp = send()
+            if resp is not None:
+                self.cache.put(method, url, resp)
+            return resp
+        return self.cache.fetch(method, url, send)
+
+    def _send(
+        self,
+        url: str,
+        method: str,
+        timeout: float,
+        retry: int,
+        headers: dict[str, Any] | None,
+        data: dict[str, Any] | None,
+        proxies: dict[str, Any] | None,
+        allow_redirects: bool,
+        request_class: str | None,
+    ) -> Response | None:
+        if request_class is not None:
+            timeout = self.timeouts.timeout(request_class, timeout)
+
         resp = None
         cnt = 1
         while True:
@@ -33,7 +125,8 @@ class SmartRequest:
                 if cnt > retry:
                     break
 
-                resp = requests.request(
+                start_time = time.monotonic()
+                resp = self.transport.request(
                     url=url,
                     method=method,
                     headers=headers,
@@ -42,10 +135,13 @@ class SmartRequest:
                     proxies=proxies,
                     allow_redirects=allow_redirects,
                 )
+                if request_class is not None:
+                    self.timeouts.observe(request_class, time.monotonic() - start_time)
                 break
 
-            except Exception:
-                timeout += 1
+            except Exception as exc:
+                REQUEST_ERRORS.inc(request_class or "", error_reason(exc))
+                timeout += self.timeout_backoff
                 cnt += 1
         return resp
 
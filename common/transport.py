@@ -0,0 +1,130 @@
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock, local
+from typing import Any
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.models import Response
+
+ProxyKey = tuple[tuple[str, str], ...]
+
+
+class Transport:
+    """Pool of keep-alive sessions shared by all requests.
+
+    Direct traffic goes through one session (or one session per thread), proxied traffic goes through a separate
+    session for every proxy, so connections to the same host are reused instead of paying a handshake each time.
+
+    Args:
+        pool_connections (int): Number of hosts whose connection pools are kept by a session. Defaults to 32.
+        pool_maxsize (int): Maximum number of kept-alive connections per host. Defaults to 32.
+        max_proxy_sessions (int): Maximum number of proxied sessions, least recently used are dropped.
+            Defaults to 1024.
+        per_thread (bool): Use a separate direct session in every thread. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 32,
+        pool_maxsize: int = 32,
+        max_proxy_sessions: int = 1024,
+        per_thread: bool = False,
+    ) -> None:
+        self._locker = Lock()
+        self._local = local()
+        self._direct_session: Session | None = None
+        self._proxy_sessions: OrderedDict[ProxyKey, Session] = OrderedDict()
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_proxy_sessions = max_proxy_sessions
+        self.per_thread = per_thread
+
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """Get counters of sessions reuse."""
+        with self._locker:
+            return {"hits": self.hits, "misses": self.misses, "proxy_sessions": len(self._proxy_sessions)}
+
+    def session(self, proxies: dict[str, Any] | None = None) -> Session:
+        """Get a session for direct or proxied traffic.
+
+        Args:
+            proxies (dict[str, Any] | None): Proxies of the request. Defaults to None.
+
+        Returns:
+            Session: Session with a connection pool.
+        """
+        if proxies:
+            return self._get_proxy_session(tuple(sorted((k, str(v)) for k, v in proxies.items())))
+        if self.per_thread:
+            return self._get_thread_session()
+        return self._get_direct_session()
+
+    def request(self, method: str, url: str, proxies: dict[str, Any] | None = None, **kwargs: Any) -> Response:
+        return self.session(proxies).request(method=method, url=url, proxies=proxies, **kwargs)
+
+    def close(self) -> None:
+        """Close all sessions of the calling thread and shared sessions."""
+        with self._locker:
+            sessions = list(self._proxy_sessions.values())
+            self._proxy_sessions.clear()
+            if self._direct_session is not None:
+                sessions.append(self._direct_session)
+                self._direct_session = None
+        thread_session: Session | None = getattr(self._local, "session", None)
+        if thread_session is not None:
+            sessions.append(thread_session)
+            self._local.session = None
+        for session in sessions:
+            session.close()
+
+    def _create_session(self) -> Session:
+        session = Session()
+        # Stay stateless like `requests.request`, cookies of one page must not leak into another request.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_direct_session(self) -> Session:
+        with self._locker:
+            if self._direct_session is None:
+                self.misses += 1
+                self._direct_session = self._create_session()
+            else:
+                self.hits += 1
+            return self._direct_session
+
+    def _get_thread_session(self) -> Session:
+        session: Session | None = getattr(self._local, "session", None)
+        with self._locker:
+            if session is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if session is None:
+            session = self._local.session = self._create_session()
+        return session
+
+    def _get_proxy_session(self, key: ProxyKey) -> Session:
+        with self._locker:
+            session = self._proxy_sessions.get(key)
+            if session is not None:
+                self.hits += 1
+                self._proxy_sessions.move_to_end(key)
+                return session
+
+            self.misses += 1
+            session = self._proxy_sessions[key] = self._create_session()
+            # Dropped sessions are not closed explicitly, another thread may still be using them.
+            while len(self._proxy_sessions) > self.max_proxy_sessions:
+                self._proxy_sessions.popitem(last=False)
+            return session
+
+
+DEFAULT_TRANSPORT = Transport()
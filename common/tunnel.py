@@ -0,0 +1,406 @@
+import asyncio
+import http.client
+import ipaddress
+import socket
+import ssl
+import time
+from enum import Enum
+from typing import Any
+from urllib.parse import urlsplit
+
+from .adaptive import TIMEOUTS, TimeoutController
+from .smart_request import HEADERS, REQUEST_ERRORS, error_reason
+
+MAX_HEAD_SIZE = 64 * 1024
+
+# Offers the method without authentication six times: a SOCKS4 proxy reads the eight bytes of its request
+# before it sees the wrong version, with the usual three bytes it would wait until the timeout.
+SOCKS5_GREETING = b"\x05\x06" + bytes(6)
+
+
+class ProxyProtocol(str, Enum):
+    """Protocol spoken by the proxy.
+
+    HTTP proxies get absolute-form requests for `http` urls and open CONNECT tunnels for `https` urls,
+    HTTPS proxies have been seen to open CONNECT tunnels to any port.
+    """
+
+    HTTP = "http"
+    HTTPS = "https"
+    SOCKS4 = "socks4"
+    SOCKS5 = "socks5"
+
+    @property
+    def is_socks(self) -> bool:
+        return self in (ProxyProtocol.SOCKS4, ProxyProtocol.SOCKS5)
+
+    def url(self, address: str) -> str:
+        """Get the proxy url of the address for `requests`, SOCKS needs the `requests[socks]` extra there."""
+        return f"{'http' if not self.is_socks else self.value}://{address}"
+
+
+class HandshakeError(ConnectionError):
+    """The proxy has refused the tunnel or does not speak the protocol."""
+
+
+def http_connect_request(host: str, port: int) -> bytes:
+    return f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode()
+
+
+def http_status(head: bytes) -> int | None:
+    """Get the status of the head of an HTTP response, None if it is not HTTP."""
+    if not head.startswith(b"HTTP/"):
+        return None
+    try:
+        return int(head.split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def could_be_http(data: bytes) -> bool:
+    """Whether the received start of a reply can be the start of an HTTP response."""
+    return data[:5] == b"HTTP/"[: len(data)]
+
+
+def socks5_connect_request(host: str, port: int) -> bytes:
+    try:
+        address = b"\x01" + ipaddress.IPv4Address(host).packed
+    except ValueError:
+        encoded = host.encode("idna")
+        address = b"\x03" + bytes([len(encoded)]) + encoded
+    return b"\x05\x01\x00" + address + port.to_bytes(2, "big")
+
+
+def socks5_address_size(head: bytes) -> int:
+    """Get the size of the bound address of the SOCKS5 reply from its first five bytes."""
+    if head[3] == 1:
+        return 4
+    if head[3] == 4:
+        return 16
+    return head[4] + 1
+
+
+def socks4_connect_request(host: str, port: int) -> bytes:
+    """Get the SOCKS4 request, SOCKS4a with the host name resolved by the proxy if it is not an address."""
+    try:
+        return b"\x04\x01" + port.to_bytes(2, "big") + ipaddress.IPv4Address(host).packed + b"\x00"
+    except ValueError:
+        return b"\x04\x01" + port.to_bytes(2, "big") + b"\x00\x00\x00\x01\x00" + host.encode("idna") + b"\x00"
+
+
+def split_url(url: str) -> tuple[str, int, str, bool]:
+    """Get the host, the port, the origin-form target and whether the url is `https`."""
+    parts = urlsplit(url)
+    is_https = parts.scheme == "https"
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return parts.hostname or "", parts.port or (443 if is_https else 80), path, is_https
+
+
+def split_address(address: str) -> tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def detection_order(protocol: ProxyProtocol | None, is_https: bool) -> tuple[ProxyProtocol, ...]:
+    """Get the protocols to try in order, the known protocol alone.
+
+    Every attempt sends the request itself, so the detection costs no extra round trip for the common proxies:
+    an HTTP proxy gets the absolute-form request of an `http` url and its reply shows the headers it adds,
+    for an `https` url it gets a CONNECT. SOCKS proxies close the connection at such bytes, then the SOCKS5
+    and the SOCKS4 handshakes are tried on new connections.
+    """
+    if protocol is not None:
+        return (protocol,)
+    return (ProxyProtocol.HTTPS if is_https else ProxyProtocol.HTTP, ProxyProtocol.SOCKS5, ProxyProtocol.SOCKS4)
+
+
+def is_other_protocol(exc: Exception) -> bool:
+    """Whether the failed attempt means that the proxy speaks another protocol, a refused connection does not."""
+    return isinstance(exc, (ConnectionError, http.client.HTTPException)) and not isinstance(
+        exc, ConnectionRefusedError
+    )
+
+
+class Tunnel:
+    """Blocking connection through a proxy to the host of a url.
+
+    Args:
+        address (str): Address of the proxy as `ip:port`.
+        host (str): Host of the url.
+        port (int): Port of the url.
+        is_https (bool): Whether the url is `https`.
+        timeout (float): Timeout of all the connections and handshakes of the tunnel in seconds.
+    """
+
+    def __init__(self, address: str, host: str, port: int, is_https: bool, timeout: float) -> None:
+        self.address = split_address(address)
+        self.host = host
+        self.port = port
+        self.is_https = is_https
+        self.deadline = time.monotonic() + timeout
+        self.sock: socket.socket | None = None
+
+    def open(self, protocol: ProxyProtocol | None) -> None:
+        """Connect to the proxy on a new connection and pass the handshake of the protocol, None only connects."""
+        self.connect()
+        if protocol is not None:
+            self._handshake(protocol)
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def connect(self) -> None:
+        self.close()
+        self.sock = socket.create_connection(self.address, timeout=self.remaining())
+
+    def _handshake(self, protocol: ProxyProtocol) -> None:
+        if protocol is ProxyProtocol.HTTP and not self.is_https:
+            return
+        if protocol in (ProxyProtocol.HTTP, ProxyProtocol.HTTPS):
+            self._send(http_connect_request(self.host, self.port))
+            status = http_status(self._recv_head())
+            if status != 200:
+                raise HandshakeError(f"The proxy has refused the tunnel with status {status}")
+        elif protocol is ProxyProtocol.SOCKS5:
+            self._send(SOCKS5_GREETING)
+            if self._recv(2) != b"\x05\x00":
+                raise HandshakeError("The proxy is not a SOCKS5 proxy without authentication")
+            self._send(socks5_connect_request(self.host, self.port))
+            head = self._recv(5)
+            if head[:2] != b"\x05\x00":
+                raise HandshakeError(f"The SOCKS5 proxy has refused the connection with code {head[1:2]!r}")
+            self._recv(socks5_address_size(head) + 1)
+        else:
+            self._send(socks4_connect_request(self.host, self.port))
+            if self._recv(8)[:2] != b"\x00\x5a":
+                raise HandshakeError("The proxy is not a SOCKS4 proxy or has refused the connection")
+
+    def remaining(self) -> float:
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("The handshake with the proxy has timed out")
+        return remaining
+
+    def _send(self, data: bytes) -> None:
+        assert self.sock is not None
+        self.sock.settimeout(self.remaining())
+        self.sock.sendall(data)
+
+    def _recv(self, size: int) -> bytes:
+        assert self.sock is not None
+        data = b""
+        while len(data) < size:
+            self.sock.settimeout(self.remaining())
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise HandshakeError("The proxy has closed the connection")
+            data += chunk
+        return data
+
+    def _recv_head(self) -> bytes:
+        """Receive the head of an HTTP response, stop early at a reply that is not HTTP."""
+        assert self.sock is not None
+        data = b""
+        while b"\r\n\r\n" not in data and len(data) < MAX_HEAD_SIZE and could_be_http(data):
+            self.sock.settimeout(self.remaining())
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+
+class TunnelResponse:
+    """Response of the request through a tunnel."""
+
+    __slots__ = ("status_code", "headers", "content", "proxy_protocol")
+
+    def __init__(
+        self, status_code: int, headers: dict[str, str], content: bytes, proxy_protocol: ProxyProtocol
+    ) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.proxy_protocol = proxy_protocol
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+
+class TunnelRequest:
+    """Blocking HTTP/1.1 request through an HTTP or a SOCKS proxy on a raw connection.
+
+    `requests` needs an extra dependency for SOCKS and hides the handshake, the proxy checks need to see it to
+    tell the protocol of the proxy. One request per connection, no redirects.
+
+    max_body_size (int): The body of the response is cut to this size. Defaults to 1 MiB.
+    timeouts (TimeoutController | None): Adaptive timeouts of request classes. Defaults to the shared TIMEOUTS.
+    """
+
+    def __init__(self, max_body_size: int = 1024 * 1024, timeouts: TimeoutController | None = None) -> None:
+        self.max_body_size = max_body_size
+        self.timeouts = timeouts or TIMEOUTS
+        self._ssl_context = ssl.create_default_context()
+
+    def request(
+        self,
+        url: str,
+        proxy: str,
+        proxy_protocol: ProxyProtocol | None = None,
+        timeout: float = 6,
+        headers: dict[str, Any] | None = HEADERS,
+        request_class: str | None = None,
+    ) -> TunnelResponse | None:
+        """Send a GET request through the proxy.
+
+        Args:
+            url (str): Url of the request.
+            proxy (str): Proxy address as `ip:port`.
+            proxy_protocol (ProxyProtocol | None): Protocol of the proxy, None detects it. Defaults to None.
+            timeout (float): Timeout of the whole request in seconds. Defaults to 6.
+            headers (dict[str, Any] | None): Headers of the request. Defaults to HEADERS.
+            request_class (str | None): Class of the request for the adaptive timeout, `timeout` is then
+                the upper bound. Defaults to None.
+
+        Returns:
+            TunnelResponse | None: Response with the protocol of the proxy or None if the request has failed.
+        """
+        if request_class is not None:
+            timeout = self.timeouts.timeout(request_class, timeout)
+
+        host, port, _, is_https = split_url(url)
+        tunnel = Tunnel(proxy, host, port, is_https, timeout)
+        start_time = time.monotonic()
+        try:
+            protocols = detection_order(proxy_protocol, is_https)
+            for protocol in protocols[:-1]:
+                try:
+                    resp = self._exchange(tunnel, protocol, url, headers or {})
+                    break
+                except Exception as exc:
+                    if not is_other_protocol(exc):
+                        raise
+            else:
+                resp = self._exchange(tunnel, protocols[-1], url, headers or {})
+            if request_class is not None:
+                self.timeouts.observe(request_class, time.monotonic() - start_time)
+            return resp
+        except Exception as exc:
+            REQUEST_ERRORS.inc(request_class or "", error_reason(exc))
+            return None
+        finally:
+            tunnel.close()
+
+    def _exchange(self, tunnel: Tunnel, protocol: ProxyProtocol, url: str, headers: dict[str, Any]) -> TunnelResponse:
+        """Send the request through the proxy of the tunnel on a new connection."""
+        host, port, target, is_https = split_url(url)
+        tunnel.open(protocol)
+        assert tunnel.sock is not None
+        sock = tunnel.sock
+        if is_https:
+            sock = self._ssl_context.wrap_socket(sock, server_hostname=host)
+            # The tunnel closes the wrapped socket.
+            tunnel.sock = sock
+        elif protocol is ProxyProtocol.HTTP:
+            target = url
+
+        conn = http.client.HTTPConnection(host, port)
+        conn.sock = sock
+        sock.settimeout(tunnel.remaining())
+        conn.request("GET", target, headers={"Connection": "close", **headers})
+        resp = conn.getresponse()
+        content = resp.read(self.max_body_size)
+        return TunnelResponse(resp.status, {key.lower(): value for key, value in resp.getheaders()}, content, protocol)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> TunnelResponse | None:
+        return self.request(*args, **kwargs)
+
+
+class AsyncTunnel:
+    """Connection through a proxy on the event loop, see Tunnel."""
+
+    def __init__(self, address: str, host: str, port: int, is_https: bool) -> None:
+        self.address = split_address(address)
+        self.host = host
+        self.port = port
+        self.is_https = is_https
+        self.sock: socket.socket | None = None
+
+    async def open(self, protocol: ProxyProtocol | None) -> None:
+        """Connect to the address on a new connection and pass the handshake of the protocol, None only connects."""
+        await self.connect()
+        if protocol is not None:
+            await self._handshake(protocol)
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def detach(self) -> socket.socket:
+        """Take the connected socket, the tunnel does not close it any more."""
+        assert self.sock is not None
+        sock, self.sock = self.sock, None
+        return sock
+
+    async def connect(self) -> None:
+        self.close()
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(*self.address, type=socket.SOCK_STREAM)
+        family, _, _, _, sockaddr = infos[0]
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        await loop.sock_connect(self.sock, sockaddr)
+
+    async def _handshake(self, protocol: ProxyProtocol) -> None:
+        if protocol is ProxyProtocol.HTTP and not self.is_https:
+            return
+        if protocol in (ProxyProtocol.HTTP, ProxyProtocol.HTTPS):
+            await self._send(http_connect_request(self.host, self.port))
+            status = http_status(await self._recv_head())
+            if status != 200:
+                raise HandshakeError(f"The proxy has refused the tunnel with status {status}")
+        elif protocol is ProxyProtocol.SOCKS5:
+            await self._send(SOCKS5_GREETING)
+            if await self._recv(2) != b"\x05\x00":
+                raise HandshakeError("The proxy is not a SOCKS5 proxy without authentication")
+            await self._send(socks5_connect_request(self.host, self.port))
+            head = await self._recv(5)
+            if head[:2] != b"\x05\x00":
+                raise HandshakeError(f"The SOCKS5 proxy has refused the connection with code {head[1:2]!r}")
+            await self._recv(socks5_address_size(head) + 1)
+        else:
+            await self._send(socks4_connect_request(self.host, self.port))
+            if (await self._recv(8))[:2] != b"\x00\x5a":
+                raise HandshakeError("The proxy is not a SOCKS4 proxy or has refused the connection")
+
+    async def _send(self, data: bytes) -> None:
+        assert self.sock is not None
+        await asyncio.get_running_loop().sock_sendall(self.sock, data)
+
+    async def _recv(self, size: int) -> bytes:
+        assert self.sock is not None
+        loop = asyncio.get_running_loop()
+        data = b""
+        while len(data) < size:
+            chunk = await loop.sock_recv(self.sock, size - len(data))
+            if not chunk:
+                raise HandshakeError("The proxy has closed the connection")
+            data += chunk
+        return data
+
+    async def _recv_head(self) -> bytes:
+        assert self.sock is not None
+        loop = asyncio.get_running_loop()
+        data = b""
+        while b"\r\n\r\n" not in data and len(data) < MAX_HEAD_SIZE and could_be_http(data):
+            chunk = await loop.sock_recv(self.sock, 4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
@@ -2,21 +2,40 @@ import time
 from datetime import timedelta
 from logging import Logger
 
+import settings
+
 from common.logger import get_main_logger
 from common.utils import get_date_time_now
 from proxy.facade import Facade
-from settings import MAX_CUSTOM_WORKER, MAX_WORKERS_PROXIES, URL_FOR_SECOND_CHECK
 
 logger: Logger = get_main_logger()
 
+# Settings added after the first release are optional, the defaults keep an older settings.py working.
+CHECK_MODE = getattr(settings, "CHECK_MODE", "threads")
+MAX_CONCURRENT_CHECKS = getattr(settings, "MAX_CONCURRENT_CHECKS", 2000)
+PROCESSES = getattr(settings, "PROCESSES", 0)
+COORDINATOR_ADDRESS = getattr(settings, "COORDINATOR_ADDRESS", None)
+CLUSTER_AUTHKEY = getattr(settings, "CLUSTER_AUTHKEY", None)
+METRICS_ADDRESS = getattr(settings, "METRICS_ADDRESS", None)
+METRICS_SNAPSHOT_PATH = getattr(settings, "METRICS_SNAPSHOT_PATH", None)
+PROXY_STORE_PATH = getattr(settings, "PROXY_STORE_PATH", None)
+
 if __name__ == "__main__":
     start_data_time = get_date_time_now()
     start_time = time.monotonic()
 
     f = Facade(
-        url_of_second_check=URL_FOR_SECOND_CHECK,
-        max_workers_proxies=MAX_WORKERS_PROXIES,
-        max_custom_worker=MAX_CUSTOM_WORKER,
+        url_of_second_check=settings.URL_FOR_SECOND_CHECK,
+        max_workers_proxies=settings.MAX_WORKERS_PROXIES,
+        max_custom_worker=settings.MAX_CUSTOM_WORKER,
+        check_mode=CHECK_MODE,
+        max_concurrent_checks=MAX_CONCURRENT_CHECKS,
+        processes=PROCESSES,
+        coordinator_address=COORDINATOR_ADDRESS,
+        authkey=CLUSTER_AUTHKEY,
+        metrics_address=METRICS_ADDRESS,
+        metrics_snapshot_path=METRICS_SNAPSHOT_PATH,
+        store_path=PROXY_STORE_PATH,
     )
     f.run()
 
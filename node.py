@@ -0,0 +1,29 @@
+from logging import Logger
+
+import settings
+
+from common.logger import get_main_logger
+from proxy.cluster import parse_node_address, run_node
+
+logger: Logger = get_main_logger()
+
+# Settings added after the first release are optional, as in main.py.
+CHECK_MODE = getattr(settings, "CHECK_MODE", "threads")
+MAX_CONCURRENT_CHECKS = getattr(settings, "MAX_CONCURRENT_CHECKS", 2000)
+COORDINATOR_ADDRESS = getattr(settings, "COORDINATOR_ADDRESS", None)
+CLUSTER_AUTHKEY = getattr(settings, "CLUSTER_AUTHKEY", None)
+
+if __name__ == "__main__":
+    if COORDINATOR_ADDRESS is None:
+        raise SystemExit("Set COORDINATOR_ADDRESS in settings.py to the address of the coordinator")
+    if not CLUSTER_AUTHKEY:
+        raise SystemExit("Set CLUSTER_AUTHKEY in settings.py to the secret shared with the coordinator")
+
+    run_node(
+        parse_node_address(COORDINATOR_ADDRESS),
+        CLUSTER_AUTHKEY,
+        check_mode=CHECK_MODE,
+        max_workers_proxies=settings.MAX_WORKERS_PROXIES,
+        max_concurrent_checks=MAX_CONCURRENT_CHECKS,
+    )
+    logger.info("The coordinator has stopped the node")
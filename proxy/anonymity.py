@@ -0,0 +1,107 @@
+import json
+import re
+from enum import Enum
+
+
+class Anonymity(str, Enum):
+    """What the proxy reveals to the site.
+
+    TRANSPARENT passes the address of the client on, ANONYMOUS hides it but tells that it is a proxy,
+    ELITE looks like a direct client.
+    """
+
+    TRANSPARENT = "transparent"
+    ANONYMOUS = "anonymous"
+    ELITE = "elite"
+
+    @property
+    def level(self) -> int:
+        return ANONYMITY_LEVELS[self]
+
+
+ANONYMITY_LEVELS = {Anonymity.TRANSPARENT: 0, Anonymity.ANONYMOUS: 1, Anonymity.ELITE: 2}
+
+# Headers that carry the address of the client, as named by the judges without the `HTTP_` prefix.
+CLIENT_ADDRESS_HEADERS = frozenset(
+    (
+        "X_FORWARDED_FOR",
+        "X_FORWARDED",
+        "FORWARDED_FOR",
+        "FORWARDED",
+        "X_REAL_IP",
+        "CLIENT_IP",
+        "X_CLIENT_IP",
+        "X_CLUSTER_CLIENT_IP",
+        "X_ORIGINATING_IP",
+        "TRUE_CLIENT_IP",
+    )
+)
+# Headers that only tell that the request has come through a proxy.
+PROXY_HEADERS = frozenset(("VIA", "PROXY_CONNECTION", "X_PROXY_ID", "X_BLUECOAT_VIA", "PROXY_AGENT"))
+
+PAIR_PATTERN = re.compile(r"^\s*([A-Za-z][A-Za-z0-9_-]*)\s*[=:]\s*(.*?)\s*$")
+TAG_PATTERN = re.compile(r"<[^>]*>")
+IP_PATTERN = re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b")
+
+
+def normalize_name(name: str) -> str:
+    return name.upper().replace("-", "_").removeprefix("HTTP_")
+
+
+def parse_judge_body(body: str) -> dict[str, str]:
+    """Get the environment echoed by the judge, names without the `HTTP_` prefix.
+
+    Judges answer with `NAME = value` lines, html tables of the same or the JSON of httpbin.
+    """
+    text = body.strip()
+    if text.startswith("{"):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        env = {normalize_name(str(key)): str(value) for key, value in (data.get("headers") or {}).items()}
+        if "origin" in data:
+            env["REMOTE_ADDR"] = str(data["origin"])
+        return env
+
+    env = {}
+    # Cells of html tables and line breaks become lines of `NAME = value`.
+    text = re.sub(r"</t[dh]>\s*<t[dh][^>]*>", " = ", text, flags=re.IGNORECASE)
+    text = re.sub(r"<br\s*/?>|</tr>|</p>|</li>", "\n", text, flags=re.IGNORECASE)
+    for line in TAG_PATTERN.sub("", text).splitlines():
+        match = PAIR_PATTERN.match(line)
+        if match:
+            env[normalize_name(match.group(1))] = match.group(2)
+    return env
+
+
+def client_address(body: str) -> str | None:
+    """Get the address the judge has seen the request from, e.g. of a direct request."""
+    match = IP_PATTERN.search(parse_judge_body(body).get("REMOTE_ADDR", ""))
+    return match.group(0) if match else None
+
+
+def classify_anonymity(body: str, origin: str | None) -> Anonymity | None:
+    """Classify the proxy by the environment that the judge has echoed for the request through it.
+
+    Args:
+        body (str): Body of the judge response.
+        origin (str | None): Address of this host as seen by the judges, None if it is unknown. Then any client
+            address passed on by the proxy counts as ours.
+
+    Returns:
+        Anonymity | None: Class of the proxy, None if the body is not an environment echo.
+    """
+    env = parse_judge_body(body)
+    if "REMOTE_ADDR" not in env and not any(name in env for name in ("HOST", "USER_AGENT")):
+        return None
+
+    for name in CLIENT_ADDRESS_HEADERS & env.keys():
+        addresses = IP_PATTERN.findall(env[name])
+        if (origin in addresses) if origin is not None else addresses:
+            return Anonymity.TRANSPARENT
+    if (CLIENT_ADDRESS_HEADERS | PROXY_HEADERS) & env.keys():
+        return Anonymity.ANONYMOUS
+    return Anonymity.ELITE
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from common.async_request import AsyncSmartRequest
+from common.tunnel import ProxyProtocol
+
+from .anonymity import classify_anonymity
+from .judges import JudgeRegistry
+from .parsing import Proxy, format_address
+from .results import CheckResult, CheckStatus
+
+
+class AsyncCheckerProxy:
+    """Checking the proxy for life on the event loop.
+
+    Has the same semantics as CheckerProxy: one request to the fastest alive judge that detects the protocol
+    and the anonymity and then the optional second check, but thousands of checks can be in flight at once.
+
+    url_of_second_check (str | None): Additional verification on a specific site. Defaults to None.
+    judges (JudgeRegistry | None): Shared cache of alive proxy judges. Defaults to None.
+    detect_protocol (bool): Detect the protocol, otherwise every proxy is checked as an HTTP proxy.
+        Defaults to True.
+    """
+
+    def __init__(
+        self, url_of_second_check: str | None = None, judges: JudgeRegistry | None = None, detect_protocol: bool = True
+    ) -> None:
+        self._request = AsyncSmartRequest()
+        self.judges = judges or JudgeRegistry()
+        self.url_of_second_check = url_of_second_check
+        self.detect_protocol = detect_protocol
+
+    async def checker(self, proxy: Proxy) -> CheckResult:
+        address = format_address(proxy)
+        try:
+            # Probing the judges blocks, it must not run on the event loop. The cached list is read directly.
+            if self.judges.needs_refresh:
+                await asyncio.to_thread(self.judges.refresh, False)
+            healthy = self.judges.healthy()
+            judge = healthy[0] if healthy else None
+            if judge is None:
+                return CheckResult(proxy, CheckStatus.NO_JUDGE)
+
+            start_time = time.monotonic()
+            resp = await self._request(
+                url=judge,
+                proxy=address,
+                proxy_protocol=None if self.detect_protocol else ProxyProtocol.HTTP,
+                timeout=3,
+                request_class="judge_check",
+            )
+            latency = time.monotonic() - start_time
+
+            if resp is None:
+                return CheckResult(proxy, CheckStatus.NO_RESPONSE, judge=judge)
+            protocol = resp.proxy_protocol
+            if resp.status_code != 200:
+                return CheckResult(proxy, CheckStatus.BAD_STATUS, latency, judge, protocol)
+            anonymity = classify_anonymity(resp.text, self.judges.origin)
+
+            if self.url_of_second_check:
+                resp_second_check = await self._request(
+                    url=self.url_of_second_check,
+                    proxy=address,
+                    proxy_protocol=protocol,
+                    timeout=6,
+                    request_class="second_check",
+                )
+                if not resp_second_check or resp_second_check.status_code != 200:
+                    return CheckResult(proxy, CheckStatus.SECOND_CHECK_FAILED, latency, judge, protocol, anonymity)
+                if protocol is ProxyProtocol.HTTP and self.url_of_second_check.startswith("https:"):
+                    # The second check has gone through a CONNECT tunnel.
+                    protocol = ProxyProtocol.HTTPS
+
+            return CheckResult(proxy, CheckStatus.GOOD, latency, judge, protocol, anonymity)
+
+        except Exception:
+            return CheckResult(proxy, CheckStatus.ERROR)
+
+    def start(self) -> None:
+        """Start refreshing proxy judges in the background."""
+        self.judges.start()
+
+    def stop(self) -> None:
+        """Stop refreshing proxy judges."""
+        self.judges.stop()
+
+    async def __call__(self, proxy: Proxy) -> CheckResult:
+        return await self.checker(proxy)
@@ -0,0 +1,78 @@
+import asyncio
+from queue import Empty
+from typing import Any, Callable
+
+from common.adaptive import AimdLimiter
+
+from .async_checker import AsyncCheckerProxy
+from .checker import CheckerProxy
+from .parsing import Proxy
+from .providers import Provider
+from .run_threads import RunThreads
+
+
+class AsyncRunThreads(RunThreads):
+    """
+    This class implements an infinite run threads with proxy checks on the event loop.
+
+    All proxy checks run in one thread, the number of checks in flight adapts up to `max_concurrent_checks`.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_checks: int,
+        max_custom_worker: int,
+        providers_list: list[Provider],
+        checker_proxy: AsyncCheckerProxy,
+        **kwargs: Any,
+    ) -> None:
+        kwargs.setdefault("concurrency", AimdLimiter(max_limit=max_concurrent_checks))
+        super().__init__(
+            max_workers_proxies=1,
+            max_custom_worker=max_custom_worker,
+            providers_list=providers_list,
+            # Used only outside of the checking stage, shares the judges with the asynchronous checker.
+            checker_proxy=CheckerProxy(
+                url_of_second_check=checker_proxy.url_of_second_check, judges=checker_proxy.judges
+            ),
+            **kwargs,
+        )
+        self.max_concurrent_checks = max_concurrent_checks
+        self.async_checker_proxy = checker_proxy
+
+    def check_workers(self) -> list[Callable[[], None]]:
+        return [self.get_checked_proxies_async]
+
+    def get_checked_proxies_async(self) -> None:
+        """Getting checked proxies on the event loop."""
+        asyncio.run(self._get_checked_proxies())
+
+    async def _get_checked_proxies(self) -> None:
+        tasks: set[asyncio.Task[None]] = set()
+
+        while True:
+            while len(tasks) >= self.concurrency.limit:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            try:
+                proxy = self._unchecked_proxies_queue.get_nowait()
+            except Empty:
+                # Wait for the next proxy in a helper thread, the loop keeps running the checks in flight.
+                proxy = await asyncio.to_thread(self._unchecked_proxies_queue.get)
+            if proxy is None or not self._running:
+                break
+
+            task = asyncio.create_task(self._check(proxy))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _check(self, proxy: Proxy) -> None:
+        self.concurrency.in_flight += 1
+        try:
+            result = await self.async_checker_proxy(proxy)
+        finally:
+            self.concurrency.in_flight -= 1
+        self.add_checked_proxy(result)
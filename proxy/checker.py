@@ -1,71 +1,88 @@
-from common.smart_request import SmartRequest
-
-JUDGES_LIST = [
-    "http://httpbin.org/get?show_env",
-    "http://www.proxy-listen.de/azenv.php",
-    "https://www2.htw-dresden.de/~beck/cgi-bin/env.cgi",
-    "http://www.meow.org.uk/cgi-bin/env.pl",
-    "http://www.wfuchs.de/azenv.php",
-    "http://wfuchs.de/azenv.php",
-    "https://users.ugent.be/~bfdwever/start/env.cgi",
-    "http://www.suave.net/~dave/cgi/env.cgi",
-    "http://www.cknuckles.com/cgi/env.cgi",
-    "http://httpheader.net",
-    "http://kheper.csoft.net/stuff/env.cgi",
-    "http://proxyjudge.us",
-    "http://www.proxyjudge.biz",
-    "http://azenv.net",
-    "https://www.andrews.edu/~bidwell/examples/env.cgi",
-    "http://shinh.org/env.cgi",
-    "http://users.on.net/~emerson/env/env.pl",
-    "http://www.9ravens.com/env.cgi",
-    "http://www2t.biglobe.ne.jp/~take52/test/env.cgi",
-    "http://www3.wind.ne.jp/hassii/env.cgi",
-    "http://xrea.fukuyan.net/env.cgi",
-]
+import time
+
+from common.tunnel import ProxyProtocol, TunnelRequest
+
+from .anonymity import classify_anonymity
+from .judges import JudgeRegistry
+from .parsing import Proxy, format_address
+from .results import CheckResult, CheckStatus
 
 
 class CheckerProxy:
     """Checking the proxy for life.
 
+    The request to the judge detects the protocol of the proxy on its way (HTTP, CONNECT, SOCKS5, SOCKS4) and
+    the environment echoed by the judge tells its anonymity, so one request classifies the proxy. The second
+    check goes through the detected protocol, an HTTP proxy that opens the tunnel to an `https` url is an HTTPS one.
+
     url_of_second_check (str | None): Additional verification on a specific site. Defaults to None.
+    judges (JudgeRegistry | None): Shared cache of alive proxy judges. Defaults to None.
+    detect_protocol (bool): Detect the protocol, otherwise every proxy is checked as an HTTP proxy.
+        Defaults to True.
     """
 
-    def __init__(self, url_of_second_check: str | None = None) -> None:
-        self._request = SmartRequest()
-        self.judges = JUDGES_LIST
+    def __init__(
+        self, url_of_second_check: str | None = None, judges: JudgeRegistry | None = None, detect_protocol: bool = True
+    ) -> None:
+        self._request = TunnelRequest()
+        self.judges = judges or JudgeRegistry()
         self.url_of_second_check = url_of_second_check
+        self.detect_protocol = detect_protocol
 
     def get_checked_judges(self) -> list[str]:
         """Get the list of url checked proxy judges."""
-        result = []
-        for item in self.judges:
-            resp = self._request(url=item, timeout=1, allow_redirects=False)
-            if resp and resp.status_code == 200:
-                result.append(item)
-
-        return result
+        return self.judges.healthy()
 
-    def checker(self, proxy: str) -> bool:
-        proxies_dict = {"http": "http://" + proxy, "https": "http://" + proxy}
+    def checker(self, proxy: Proxy) -> CheckResult:
+        address = format_address(proxy)
         try:
-            for judge in self.get_checked_judges():
-                resp = self._request(url=judge, proxies=proxies_dict, timeout=3, allow_redirects=False)
+            judge = self.judges.best()
+            if judge is None:
+                return CheckResult(proxy, CheckStatus.NO_JUDGE)
 
-                if resp and resp.status_code == 200:
-                    if not self.url_of_second_check:
-                        return True
+            start_time = time.monotonic()
+            resp = self._request(
+                url=judge,
+                proxy=address,
+                proxy_protocol=None if self.detect_protocol else ProxyProtocol.HTTP,
+                timeout=3,
+                request_class="judge_check",
+            )
+            latency = time.monotonic() - start_time
 
-                    resp_second_check = self._request(
-                        url=self.url_of_second_check, proxies=proxies_dict, timeout=6, allow_redirects=False
-                    )
-                    if resp_second_check and resp_second_check.status_code == 200:
-                        return True
+            if resp is None:
+                return CheckResult(proxy, CheckStatus.NO_RESPONSE, judge=judge)
+            protocol = resp.proxy_protocol
+            if resp.status_code != 200:
+                return CheckResult(proxy, CheckStatus.BAD_STATUS, latency, judge, protocol)
+            anonymity = classify_anonymity(resp.text, self.judges.origin)
+
+            if self.url_of_second_check:
+                resp_second_check = self._request(
+                    url=self.url_of_second_check,
+                    proxy=address,
+                    proxy_protocol=protocol,
+                    timeout=6,
+                    request_class="second_check",
+                )
+                if not resp_second_check or resp_second_check.status_code != 200:
+                    return CheckResult(proxy, CheckStatus.SECOND_CHECK_FAILED, latency, judge, protocol, anonymity)
+                if protocol is ProxyProtocol.HTTP and self.url_of_second_check.startswith("https:"):
+                    # The second check has gone through a CONNECT tunnel.
+                    protocol = ProxyProtocol.HTTPS
+
+            return CheckResult(proxy, CheckStatus.GOOD, latency, judge, protocol, anonymity)
 
         except Exception:
-            pass
+            return CheckResult(proxy, CheckStatus.ERROR)
+
+    def start(self) -> None:
+        """Start refreshing proxy judges in the background."""
+        self.judges.start()
 
-        return False
+    def stop(self) -> None:
+        """Stop refreshing proxy judges."""
+        self.judges.stop()
 
-    def __call__(self, proxy: str) -> bool:
+    def __call__(self, proxy: Proxy) -> CheckResult:
         return self.checker(proxy)
@@ -0,0 +1,333 @@
+import itertools
+import os
+import signal
+import socket
+import time
+from logging import Logger
+from multiprocessing.connection import Client, Connection, Listener
+from threading import Condition, Lock, Thread
+from typing import Any, Callable
+
+from common.logger import get_main_logger
+
+from .checker import CheckerProxy
+from .metrics import CHECK_UTILIZATION, CHECKS_IN_FLIGHT, LEASE_EVENTS, LEASES, NODE_RESULTS, NODES
+from .parsing import Proxy, new_addresses
+from .process_run_threads import ShardConfig, ShardWorker
+from .providers import Provider
+from .results import CheckResult, ResultRecord
+from .run_threads import RunThreads, put_many, take_batch
+
+logger: Logger = get_main_logger()
+
+# Messages are tuples with the kind first:
+#   node -> coordinator: (HELLO, name), (LEASE, size), (RESULTS, [(lease_id, ResultRecord), ...])
+#   coordinator -> node: (CONFIG, url_of_second_check, judges), (LEASE, lease_id, packed proxies), (STOP,)
+# The coordinator sends only replies, so a node reads the connection in one thread.
+HELLO = "hello"
+CONFIG = "config"
+LEASE = "lease"
+RESULTS = "results"
+STOP = "stop"
+
+# Address of a TCP socket or the path of a Unix socket.
+NodeAddress = tuple[str, int] | str
+
+
+def parse_node_address(text: str) -> NodeAddress:
+    """Get the address of the coordinator from `host:port` or the path of a Unix socket."""
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+class Lease:
+    """Proxies handed out to a node, they are taken back after the deadline."""
+
+    __slots__ = ("proxies", "deadline", "node")
+
+    def __init__(self, proxies: set[Proxy], deadline: float, node: str) -> None:
+        self.proxies = proxies
+        self.deadline = deadline
+        self.node = node
+
+
+class CoordinatorRunThreads(RunThreads):
+    """
+    This class implements an infinite run threads that hand the proxy checks out to worker nodes.
+
+    The coordinator runs the providers, the dedup and the TCP prefilter once for all the nodes and serves the
+    candidates in leases over TCP or a Unix socket. A node streams the results back, every result extends the
+    lease of its batch by `lease_ttl`. The proxies of a lease that has expired or whose node has disconnected are
+    queued again for another node, a late result of such a proxy is ignored. The pool, the store and the
+    scheduler are kept here.
+
+    Connections are authenticated with `authkey`, the messages are pickled, so the nodes must be trusted.
+    """
+
+    def __init__(
+        self,
+        address: NodeAddress,
+        authkey: bytes,
+        max_custom_worker: int,
+        providers_list: list[Provider],
+        checker_proxy: CheckerProxy,
+        lease_ttl: float = 30,
+        lease_wait: float = 1,
+        max_lease_size: int = 1000,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            max_workers_proxies=1,
+            max_custom_worker=max_custom_worker,
+            providers_list=providers_list,
+            # Used only outside of the checking stage, its settings are sent to the nodes.
+            checker_proxy=checker_proxy,
+            **kwargs,
+        )
+        self.address = address
+        self.authkey = authkey
+        self.lease_ttl = lease_ttl
+        self.lease_wait = lease_wait
+        self.max_lease_size = max_lease_size
+
+        self._listener: Listener | None = None
+        self._leases_locker = Lock()
+        self._leases: dict[int, Lease] = {}
+        self._lease_ids = itertools.count(1)
+        self._node_ids = itertools.count(1)
+        self.nodes: set[str] = set()
+
+    def terminate(self) -> None:
+        super().terminate()
+        # Wake up the listener blocked in accept().
+        if self._listener is not None:
+            try:
+                Client(self._listener.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+
+    def register_metrics(self) -> None:
+        super().register_metrics()
+        NODES.set_function(lambda: len(self.nodes))
+        LEASES.set_function(lambda: len(self._leases))
+        CHECKS_IN_FLIGHT.set_function(lambda: sum(len(lease.proxies) for lease in list(self._leases.values())))
+        # The workers of the nodes are not seen from here.
+        CHECK_UTILIZATION.set_function(lambda: {})
+
+    def check_workers(self) -> list[Callable[[], None]]:
+        return [self.serve_nodes, self.expire_leases]
+
+    def serve_nodes(self) -> None:
+        """Accepting the connections of the nodes, each one is served in its own thread."""
+        assert self._listener is not None
+        while self._running:
+            try:
+                conn = self._listener.accept()
+            except Exception as exc:
+                if self._running:
+                    logger.warning(f"Node rejected: {exc!r}")
+                continue
+            if not self._running:
+                conn.close()
+                break
+            Thread(target=self.serve_node, args=(conn,), name="NODE", daemon=True).start()
+
+    def serve_node(self, conn: Connection) -> None:
+        """Serving the requests of a node until it disconnects."""
+        node = f"?#{next(self._node_ids)}"
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == HELLO:
+                    node = f"{message[1]}#{node.partition('#')[2]}"
+                    self.nodes.add(node)
+                    logger.info(f"Node {node} connected")
+                    judges = [stats.url for stats in self.checker_proxy.judges.stats()]
+                    conn.send((CONFIG, self.checker_proxy.url_of_second_check, judges))
+                elif message[0] == LEASE:
+                    conn.send(self._lease(node, message[1]))
+                elif message[0] == RESULTS:
+                    self._complete(node, message[1])
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+            self.nodes.discard(node)
+            with self._leases_locker:
+                lease_ids = [lease_id for lease_id, lease in self._leases.items() if lease.node == node]
+                proxies = [proxy for lease_id in lease_ids for proxy in self._leases.pop(lease_id).proxies]
+            self._requeue(proxies)
+            logger.info(f"Node {node} disconnected, {len(proxies)} proxies queued again")
+
+    def _lease(self, node: str, size: int) -> tuple[Any, ...]:
+        if not self._running:
+            return (STOP,)
+        proxies, stopped = take_batch(self._unchecked_proxies_queue, min(size, self.max_lease_size), self.lease_wait)
+        if stopped:
+            # The sentinel is left for the threads serving the other nodes.
+            self._unchecked_proxies_queue.put(None)
+        if not proxies:
+            return (STOP,) if stopped else (LEASE, 0, b"")
+
+        lease_id = next(self._lease_ids)
+        with self._leases_locker:
+            self._leases[lease_id] = Lease(set(proxies), time.monotonic() + self.lease_ttl, node)
+        return (LEASE, lease_id, new_addresses(proxies).tobytes())
+
+    def _complete(self, node: str, records: list[tuple[int, ResultRecord]]) -> None:
+        results: list[CheckResult] = []
+        with self._leases_locker:
+            deadline = time.monotonic() + self.lease_ttl
+            for lease_id, record in records:
+                proxy = record[0]
+                lease = self._leases.get(lease_id)
+                if lease is None or proxy not in lease.proxies:
+                    # The lease has expired and the proxy has been queued again.
+                    LEASE_EVENTS.inc("late_result")
+                    continue
+                lease.proxies.discard(proxy)
+                lease.deadline = deadline
+                if not lease.proxies:
+                    del self._leases[lease_id]
+                results.append(CheckResult.from_record(record))
+        NODE_RESULTS.inc(node, amount=len(results))
+        for result in results:
+            self.add_checked_proxy(result)
+
+    def expire_leases(self) -> None:
+        """Taking back the proxies of the expired leases."""
+        while self._running:
+            now = time.monotonic()
+            with self._leases_locker:
+                lease_ids = [lease_id for lease_id, lease in self._leases.items() if lease.deadline <= now]
+                proxies = [proxy for lease_id in lease_ids for proxy in self._leases.pop(lease_id).proxies]
+            if lease_ids:
+                LEASE_EVENTS.inc("expired", amount=len(lease_ids))
+                logger.info(f"{len(lease_ids)} leases expired, {len(proxies)} proxies queued again")
+                self._requeue(proxies)
+            self._stop_event.wait(self.lease_ttl / 4)
+
+    def _requeue(self, proxies: list[Proxy]) -> None:
+        LEASE_EVENTS.inc("requeued", amount=len(proxies))
+        put_many(self._unchecked_proxies_queue, proxies)
+
+    def run(self) -> None:
+        self._listener = Listener(self.address, authkey=self.authkey)
+        logger.info(f"Coordinator is listening on {self._listener.address}")
+        try:
+            super().run()
+        finally:
+            self._listener.close()
+            self._listener = None
+
+
+class NodeWorker(ShardWorker):
+    """Checking stage of a worker node.
+
+    Proxies are leased from the coordinator, the results are streamed back in batches. A new lease is requested
+    as soon as half of the `capacity` of the node is free, so the checks do not wait for the round trip.
+    """
+
+    def __init__(self, config: ShardConfig, conn: Connection) -> None:
+        super().__init__(config, conn, conn)
+        self._send_locker = Lock()
+        self._outstanding = Condition()
+        self._lease_of_proxy: dict[Proxy, int] = {}
+        self.capacity = 2 * self.concurrency.max_limit
+
+    def _send(self, message: tuple[Any, ...]) -> None:
+        with self._send_locker:
+            self._results_conn.send(message)
+
+    def receive_proxies(self) -> None:
+        """Getting the leases of proxies from the coordinator until the stop or the closed connection."""
+        while True:
+            with self._outstanding:
+                self._outstanding.wait_for(lambda: len(self._lease_of_proxy) <= self.capacity // 2)
+                size = self.capacity - len(self._lease_of_proxy)
+            try:
+                self._send((LEASE, size))
+                reply = self._proxies_conn.recv()
+            except (EOFError, OSError):
+                break
+            if reply[0] == STOP:
+                break
+
+            _, lease_id, data = reply
+            batch = new_addresses()
+            batch.frombytes(data)
+            with self._outstanding:
+                for proxy in batch:
+                    self._lease_of_proxy[proxy] = lease_id
+            for proxy in batch:
+                self._proxies_queue.put(proxy)
+
+    def send_results(self) -> None:
+        """Sending the results to the coordinator in batches."""
+        stopped = False
+        while not stopped:
+            batch, stopped = take_batch(self._results_queue, self.config.batch_size)
+            if not batch:
+                continue
+            with self._outstanding:
+                records = [(self._lease_of_proxy.pop(result.proxy, 0), result.to_record()) for result in batch]
+                self._outstanding.notify_all()
+            try:
+                self._send((RESULTS, records))
+            except OSError:
+                # The coordinator is gone, it queues the proxies of this node again.
+                pass
+
+
+def run_node(
+    address: NodeAddress,
+    authkey: bytes,
+    check_mode: str = "threads",
+    max_workers_proxies: int = 230,
+    max_concurrent_checks: int = 2000,
+    batch_size: int = 256,
+    name: str | None = None,
+    connect_timeout: float = 60,
+) -> None:
+    """Run a worker node until the coordinator stops it or disconnects.
+
+    Args:
+        address (NodeAddress): Address of the coordinator.
+        authkey (bytes): Shared secret of the coordinator and the nodes.
+        check_mode (str): "threads" or "async", as in Facade. Defaults to "threads".
+        max_workers_proxies (int): Number of check threads in the "threads" mode. Defaults to 230.
+        max_concurrent_checks (int): Maximum number of checks in flight in the "async" mode. Defaults to 2000.
+        batch_size (int): Maximum number of results in a message to the coordinator. Defaults to 256.
+        name (str | None): Name of the node in the reports. Defaults to the host name and the process id.
+        connect_timeout (float): Time in seconds to wait for the coordinator to start listening. Defaults to 60.
+    """
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+    conn.send((HELLO, name or f"{socket.gethostname()}:{os.getpid()}"))
+    _, url_of_second_check, judges = conn.recv()
+    config = ShardConfig(
+        check_mode=check_mode,
+        max_workers_proxies=max_workers_proxies,
+        max_concurrent_checks=max_concurrent_checks,
+        url_of_second_check=url_of_second_check,
+        judges=judges,
+        batch_size=batch_size,
+    )
+    logger.info(f"Connected to the coordinator {address}")
+    NodeWorker(config, conn).run()
+
+
+def run_node_process(address: NodeAddress, authkey: bytes, **kwargs: Any) -> None:
+    """Entry point of a worker node started as a child process, e.g. by the benchmarks."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_node(address, authkey, **kwargs)
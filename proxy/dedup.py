@@ -0,0 +1,133 @@
+import hashlib
+import math
+import time
+from threading import Lock
+
+from .parsing import Addresses, Proxy, new_addresses
+
+
+class BloomFilter:
+    """Compact set of packed proxies with false positives but without false negatives.
+
+    Args:
+        capacity (int): Expected number of items.
+        error_rate (float): Probability of false positives at full capacity.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.count_of_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: Proxy) -> list[int]:
+        digest = hashlib.blake2b(item.to_bytes(6, "big"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.count_of_hashes)]
+
+    def add(self, item: Proxy) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: Proxy) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class TimedBloomFilter:
+    """Bloom filter whose items expire.
+
+    Items are added to the current filter, which replaces the previous one every `ttl` seconds,
+    so an item lives from `ttl` to `2 * ttl` seconds.
+
+    Args:
+        ttl (float): Lifetime of the items in seconds.
+        capacity (int): Expected number of items added during `ttl`.
+        error_rate (float): Probability of false positives at full capacity.
+    """
+
+    def __init__(self, ttl: float, capacity: int, error_rate: float) -> None:
+        self.ttl = ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._rotated_at = time.monotonic()
+
+    def _rotate(self) -> None:
+        now = time.monotonic()
+        if now - self._rotated_at < self.ttl:
+            return
+        # After more than two lifetimes both filters have expired.
+        if now - self._rotated_at < 2 * self.ttl:
+            self._previous = self._current
+        else:
+            self._previous = BloomFilter(self.capacity, self.error_rate)
+        self._current = BloomFilter(self.capacity, self.error_rate)
+        self._rotated_at = now
+
+    def add(self, item: Proxy) -> None:
+        self._rotate()
+        self._current.add(item)
+
+    def __contains__(self, item: Proxy) -> bool:
+        self._rotate()
+        return item in self._current or item in self._previous
+
+
+class ProxyDeduplicator:
+    """Dedup stage in front of the check queue.
+
+    Keeps the set of candidates accepted in the current generation and a negative cache of recently failed
+    proxies, so a proxy found by several providers or failed in a previous cycle is not checked again.
+
+    Args:
+        negative_ttl (float): Minimum time in seconds before a failed proxy is checked again. Defaults to 1800.
+        negative_capacity (int): Expected number of failed proxies during `negative_ttl`. Defaults to 1_000_000.
+        error_rate (float): Probability that a new proxy is taken for a failed one. Defaults to 0.001.
+    """
+
+    def __init__(
+        self, negative_ttl: float = 1800, negative_capacity: int = 1_000_000, error_rate: float = 0.001
+    ) -> None:
+        self._locker = Lock()
+        self._in_flight: set[Proxy] = set()
+        self._negative_cache = TimedBloomFilter(negative_ttl, negative_capacity, error_rate)
+        self.count_of_duplicates = 0
+        self.count_of_recently_failed = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return proxy in self._in_flight
+
+    def accept(self, proxy_list: Addresses) -> Addresses:
+        """Get the candidates that are new or due for a recheck and mark them as in flight.
+
+        Args:
+            proxy_list (Addresses): Candidates from a provider.
+
+        Returns:
+            Addresses: Candidates to check.
+        """
+        result = new_addresses()
+        with self._locker:
+            for proxy in proxy_list:
+                if proxy in self._in_flight:
+                    self.count_of_duplicates += 1
+                elif proxy in self._negative_cache:
+                    self.count_of_recently_failed += 1
+                else:
+                    self._in_flight.add(proxy)
+                    result.append(proxy)
+        return result
+
+    def add_failed(self, proxy: Proxy) -> None:
+        """Add the proxy to the negative cache."""
+        with self._locker:
+            self._negative_cache.add(proxy)
+
+    def new_generation(self) -> None:
+        """Forget the candidates of the finished generation, they can be checked again."""
+        with self._locker:
+            self._in_flight.clear()
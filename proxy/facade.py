@@ -1,27 +1,162 @@
 from logging import Logger
 
 from common.logger import get_main_logger
+from common.metrics import METRICS, MetricsServer
 
+from .async_checker import AsyncCheckerProxy
+from .async_run_threads import AsyncRunThreads
 from .checker import CheckerProxy
-from .providers import PROVIDERS
+from .cluster import CoordinatorRunThreads, parse_node_address
+from .judges import JudgeRegistry
+from .process_run_threads import ProcessRunThreads
+from .providers import REGISTRY, Provider
 from .run_threads import RunThreads
+from .scraping import Scraper
+from .store import ProxyStore
 
 logger: Logger = get_main_logger()
 
+CHECK_MODES = ("threads", "async")
+
 
 class Facade:
-    def __init__(self, url_of_second_check: str, max_workers_proxies: int, max_custom_worker: int) -> None:
+    """Start of the scraper.
+
+    check_mode (str): "threads" checks every proxy in its own thread, "async" checks proxies on the event loop.
+        Defaults to "threads".
+    max_concurrent_checks (int): Maximum number of checks in flight in the "async" mode. Defaults to 2000.
+    processes (int): Number of worker processes that check the proxies sharded by address, each in the
+        `check_mode` with its own limits. 0 checks in this process. Defaults to 0.
+    coordinator_address (str | None): `host:port` or the path of a Unix socket to listen on as the coordinator
+        of the worker nodes, which then do all the checks. Defaults to None, the checks are done on this host.
+    authkey (bytes | None): Shared secret of the coordinator and the nodes, required with `coordinator_address`.
+        Defaults to None.
+    metrics_address (str | None): `host:port` of the local HTTP endpoint of the metrics, `/metrics` in the
+        Prometheus text format and `/metrics.json`. Defaults to None, no endpoint.
+    metrics_snapshot_path (str | None): File to which a JSON snapshot of the metrics is appended with every
+        report. Defaults to None.
+    store_path (str | None): Path of the proxy store for the warm start after a restart. Defaults to None.
+    scraper (Scraper | None): Jobs scraped by the custom workers through the pool of checked proxies.
+        Defaults to None, the custom workers run `custom_work`.
+    providers_list (list[Provider] | None): Providers of the proxies. Defaults to the providers of REGISTRY.
+    judges (list[str] | None): Urls of the proxy judges. Defaults to JUDGES_LIST.
+    """
+
+    def __init__(
+        self,
+        url_of_second_check: str,
+        max_workers_proxies: int,
+        max_custom_worker: int,
+        check_mode: str = "threads",
+        max_concurrent_checks: int = 2000,
+        processes: int = 0,
+        coordinator_address: str | None = None,
+        authkey: bytes | None = None,
+        metrics_address: str | None = None,
+        metrics_snapshot_path: str | None = None,
+        store_path: str | None = None,
+        scraper: Scraper | None = None,
+        providers_list: list[Provider] | None = None,
+        judges: list[str] | None = None,
+    ) -> None:
+        if check_mode not in CHECK_MODES:
+            raise ValueError(f"Unknown check mode {check_mode!r}, expected one of {CHECK_MODES}")
+        if processes < 0:
+            raise ValueError(f"Number of processes must not be negative, got {processes}")
+        if coordinator_address is not None and not authkey:
+            raise ValueError("The coordinator needs an authkey shared with the nodes")
+
         self.url_of_second_check = url_of_second_check
         self.max_workers_proxies = max_workers_proxies
         self.max_custom_worker = max_custom_worker
+        self.check_mode = check_mode
+        self.max_concurrent_checks = max_concurrent_checks
+        self.processes = processes
+        self.coordinator_address = coordinator_address
+        self.authkey = authkey
+        self.metrics_address = metrics_address
+        self.metrics_snapshot_path = metrics_snapshot_path
+        self.store_path = store_path
+        self.scraper = scraper
+        self.providers_list = providers_list or REGISTRY.providers()
+        self.judges = judges
+        self.runner: RunThreads | None = None
+
+    def create_runner(self) -> RunThreads:
+        """Create the threads of the scraper with their checker of proxies."""
+        rt: RunThreads
+        checker_proxy: CheckerProxy | AsyncCheckerProxy
+        judges = JudgeRegistry(judges=self.judges)
+        store = ProxyStore(self.store_path) if self.store_path else None
+        if self.coordinator_address is not None:
+            assert self.authkey is not None
+            checker_proxy = CheckerProxy(url_of_second_check=self.url_of_second_check, judges=judges)
+            rt = CoordinatorRunThreads(
+                address=parse_node_address(self.coordinator_address),
+                authkey=self.authkey,
+                providers_list=self.providers_list,
+                checker_proxy=checker_proxy,
+                max_custom_worker=self.max_custom_worker,
+                store=store,
+                metrics_snapshot_path=self.metrics_snapshot_path,
+                scraper=self.scraper,
+            )
+        elif self.processes:
+            checker_proxy = CheckerProxy(url_of_second_check=self.url_of_second_check, judges=judges)
+            rt = ProcessRunThreads(
+                processes=self.processes,
+                check_mode=self.check_mode,
+                max_workers_proxies=self.max_workers_proxies,
+                max_concurrent_checks=self.max_concurrent_checks,
+                providers_list=self.providers_list,
+                checker_proxy=checker_proxy,
+                max_custom_worker=self.max_custom_worker,
+                store=store,
+                metrics_snapshot_path=self.metrics_snapshot_path,
+                scraper=self.scraper,
+            )
+        elif self.check_mode == "async":
+            checker_proxy = AsyncCheckerProxy(url_of_second_check=self.url_of_second_check, judges=judges)
+            rt = AsyncRunThreads(
+                max_concurrent_checks=self.max_concurrent_checks,
+                providers_list=self.providers_list,
+                checker_proxy=checker_proxy,
+                max_custom_worker=self.max_custom_worker,
+                store=store,
+                metrics_snapshot_path=self.metrics_snapshot_path,
+                scraper=self.scraper,
+            )
+        else:
+            checker_proxy = CheckerProxy(url_of_second_check=self.url_of_second_check, judges=judges)
+            rt = RunThreads(
+                max_workers_proxies=self.max_workers_proxies,
+                providers_list=self.providers_list,
+                checker_proxy=checker_proxy,
+                max_custom_worker=self.max_custom_worker,
+                store=store,
+                metrics_snapshot_path=self.metrics_snapshot_path,
+                scraper=self.scraper,
+            )
+        return rt
 
     def run(self) -> None:
-        checker_proxy = CheckerProxy(url_of_second_check=self.url_of_second_check)
-
-        rt = RunThreads(
-            max_workers_proxies=self.max_workers_proxies,
-            providers_list=PROVIDERS,
-            checker_proxy=checker_proxy,
-            max_custom_worker=self.max_custom_worker,
-        )
-        rt.run()
+        self.runner = self.create_runner()
+        metrics_server = None
+        if self.metrics_address is not None:
+            host, _, port = self.metrics_address.rpartition(":")
+            metrics_server = MetricsServer(METRICS, host, int(port))
+            metrics_server.start()
+            logger.info(f"Metrics are served on {metrics_server.url}")
+
+        self.runner.checker_proxy.start()
+        try:
+            self.runner.run()
+        finally:
+            self.runner.checker_proxy.stop()
+            if metrics_server is not None:
+                metrics_server.stop()
+
+    def terminate(self) -> None:
+        """Stop the running scraper from another thread."""
+        if self.runner is not None:
+            self.runner.terminate()
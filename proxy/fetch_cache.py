@@ -0,0 +1,104 @@
+import hashlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+from threading import Lock
+
+from requests.models import Response
+
+
+def content_hash(content: bytes) -> bytes:
+    return hashlib.blake2b(content, digest_size=16).digest()
+
+
+class PageState:
+    """Validators and fingerprint of the last fetched version of a page."""
+
+    __slots__ = ("etag", "last_modified", "content_hash", "size")
+
+    def __init__(self, etag: str | None, last_modified: str | None, content_hash: bytes, size: int) -> None:
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.size = size
+
+
+@dataclass(slots=True)
+class PageUpdate:
+    """What has changed on the page since the previous fetch.
+
+    changed (bool): False if the page is the same and must not be parsed again.
+    appended (bytes | None): Content added to the end of the page, None if the page is new or rewritten.
+        Defaults to None.
+    """
+
+    changed: bool
+    appended: bytes | None = None
+
+
+class FetchCache:
+    """Cache of the validators of the provider pages for conditional and incremental fetching.
+
+    The ETag and Last-Modified of a page are sent back as If-None-Match and If-Modified-Since, so an unchanged
+    page costs a 304 response. Servers without validators are covered by the hash of the content. If the previous
+    content is a prefix of the new one, only the appended part is reported.
+    """
+
+    def __init__(self) -> None:
+        self._locker = Lock()
+        self._pages: dict[str, PageState] = {}
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        """Get the headers of a conditional request for the page."""
+        with self._locker:
+            state = self._pages.get(url)
+        headers: dict[str, str] = {}
+        if state is not None:
+            if state.etag:
+                headers["If-None-Match"] = state.etag
+            if state.last_modified:
+                headers["If-Modified-Since"] = state.last_modified
+        return headers
+
+    def update(self, url: str, resp: Response) -> PageUpdate:
+        """Remember the fetched page and compare it with the previous version.
+
+        Args:
+            url (str): Url of the page.
+            resp (Response): Response to the conditional request.
+
+        Returns:
+            PageUpdate: Change of the page.
+        """
+        if resp.status_code == 304:
+            return PageUpdate(changed=False)
+
+        content = resp.content
+        new_state = PageState(
+            resp.headers.get("ETag"), resp.headers.get("Last-Modified"), content_hash(content), len(content)
+        )
+        with self._locker:
+            state = self._pages.get(url)
+            self._pages[url] = new_state
+
+        if state is None:
+            return PageUpdate(changed=True)
+        if state.content_hash == new_state.content_hash:
+            return PageUpdate(changed=False)
+        # Only whole lines are appended, a line continued at the end would be parsed without its start.
+        if (
+            0 < state.size < len(content)
+            and content[state.size - 1] == ord("\n")
+            and content_hash(content[: state.size]) == state.content_hash
+        ):
+            return PageUpdate(changed=True, appended=content[state.size :])
+        return PageUpdate(changed=True)
+
+    def retain(self, urls: Iterable[str]) -> None:
+        """Forget the pages that are not in the urls, e.g. the pages of previous days."""
+        keep = set(urls)
+        with self._locker:
+            for url in [url for url in self._pages if url not in keep]:
+                del self._pages[url]
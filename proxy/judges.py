@@ -0,0 +1,205 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+from threading import Event, Lock, Thread
+
+from common.logger import get_main_logger
+from common.smart_request import SmartRequest
+
+from .anonymity import client_address
+from .metrics import JUDGE_SECONDS
+
+logger: Logger = get_main_logger()
+
+JUDGES_LIST = [
+    "http://httpbin.org/get?show_env",
+    "http://www.proxy-listen.de/azenv.php",
+    "https://www2.htw-dresden.de/~beck/cgi-bin/env.cgi",
+    "http://www.meow.org.uk/cgi-bin/env.pl",
+    "http://www.wfuchs.de/azenv.php",
+    "http://wfuchs.de/azenv.php",
+    "https://users.ugent.be/~bfdwever/start/env.cgi",
+    "http://www.suave.net/~dave/cgi/env.cgi",
+    "http://www.cknuckles.com/cgi/env.cgi",
+    "http://httpheader.net",
+    "http://kheper.csoft.net/stuff/env.cgi",
+    "http://proxyjudge.us",
+    "http://www.proxyjudge.biz",
+    "http://azenv.net",
+    "https://www.andrews.edu/~bidwell/examples/env.cgi",
+    "http://shinh.org/env.cgi",
+    "http://users.on.net/~emerson/env/env.pl",
+    "http://www.9ravens.com/env.cgi",
+    "http://www2t.biglobe.ne.jp/~take52/test/env.cgi",
+    "http://www3.wind.ne.jp/hassii/env.cgi",
+    "http://xrea.fukuyan.net/env.cgi",
+]
+
+
+class JudgeStats:
+    """Health state of a single proxy judge."""
+
+    __slots__ = ("url", "latency", "failures", "checked_at", "alive")
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.latency: float | None = None
+        self.failures = 0
+        self.checked_at = 0.0
+        self.alive = False
+
+
+class JudgeRegistry:
+    """Thread-safe cache of alive proxy judges.
+
+    Judges are probed in parallel by a background thread every `ttl` seconds. Readers never send requests
+    themselves unless the cache has never been filled or has expired while the background thread is stopped.
+    The direct probes also tell the `origin`, the address of this host as the judges see it.
+
+    Args:
+        judges (list[str] | None): Urls of proxy judges. Defaults to JUDGES_LIST.
+        ttl (float): Lifetime of the probe results in seconds. Defaults to 60.
+        probe_timeout (int): Timeout of a single probe request. Defaults to 1.
+        max_failures (int): Consecutive failures after which a judge is evicted. Defaults to 3.
+        eviction_time (float): Time in seconds after which an evicted judge is probed again. Defaults to 600.
+        latency_smoothing (float): Weight of the last probe in the moving average of the latency. Defaults to 0.3.
+    """
+
+    def __init__(
+        self,
+        judges: list[str] | None = None,
+        ttl: float = 60,
+        probe_timeout: int = 1,
+        max_failures: int = 3,
+        eviction_time: float = 600,
+        latency_smoothing: float = 0.3,
+    ) -> None:
+        self._request = SmartRequest()
+        self._locker = Lock()
+        self._refresh_locker = Lock()
+        self._stop_event = Event()
+        self._thread: Thread | None = None
+
+        self._stats: dict[str, JudgeStats] = {url: JudgeStats(url) for url in (judges or JUDGES_LIST)}
+        self._healthy: list[str] = []
+        self._refreshed_at = 0.0
+        self.origin: str | None = None
+
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.max_failures = max_failures
+        self.eviction_time = eviction_time
+        self.latency_smoothing = latency_smoothing
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self._refreshed_at > self.ttl
+
+    def stats(self) -> list[JudgeStats]:
+        """Get the health state of all judges."""
+        with self._locker:
+            return list(self._stats.values())
+
+    @property
+    def needs_refresh(self) -> bool:
+        """Whether `healthy` has to probe the judges before answering, no list yet or an expired one."""
+        return self._refreshed_at == 0 or (self.expired and not self.is_running())
+
+    def healthy(self) -> list[str]:
+        """Get the list of alive judges sorted by latency, the fastest first."""
+        if self.needs_refresh:
+            self.refresh(force=False)
+        return self._healthy
+
+    def best(self) -> str | None:
+        """Get the fastest alive judge."""
+        healthy = self.healthy()
+        return healthy[0] if healthy else None
+
+    def refresh(self, force: bool = True) -> None:
+        """Probe all judges in parallel and rebuild the list of alive judges.
+
+        Args:
+            force (bool): Probe even if the cache has not expired yet. Defaults to True.
+        """
+        with self._refresh_locker:
+            if not force and self._refreshed_at != 0 and not self.expired:
+                return
+
+            now = time.monotonic()
+            with self._locker:
+                stats_list = [
+                    stats
+                    for stats in self._stats.values()
+                    if stats.failures < self.max_failures or now - stats.checked_at > self.eviction_time
+                ]
+
+            with ThreadPoolExecutor(max_workers=max(len(stats_list), 1), thread_name_prefix="JUDGE") as executor:
+                for stats, latency in zip(stats_list, executor.map(self._probe, stats_list)):
+                    self._update(stats, latency)
+
+            with self._locker:
+                alive = [stats for stats in self._stats.values() if stats.alive]
+                alive.sort(key=lambda x: x.latency or 0)
+                self._healthy = [stats.url for stats in alive]
+                self._refreshed_at = time.monotonic()
+
+            logger.debug(f"Alive judges: {len(self._healthy)} of {len(self._stats)}")
+
+    def start(self) -> None:
+        """Start refreshing judges in the background thread."""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = Thread(target=self._refresh_forever, name="JUDGES", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _refresh_forever(self) -> None:
+        while not self._stop_event.is_set():
+            self.refresh()
+            self._stop_event.wait(self.ttl)
+
+    def _probe(self, stats: JudgeStats) -> float | None:
+        """Send a direct request to the judge.
+
+        Returns:
+            float | None: Response time in seconds or None if the judge is dead.
+        """
+        start_time = time.monotonic()
+        resp = self._request(
+            url=stats.url, timeout=self.probe_timeout, allow_redirects=False, request_class="judge_probe"
+        )
+        if resp is not None and resp.status_code == 200:
+            latency = time.monotonic() - start_time
+            JUDGE_SECONDS.observe(latency, stats.url, "direct")
+            origin = client_address(resp.text)
+            if origin is not None:
+                self.origin = origin
+            return latency
+        return None
+
+    def _update(self, stats: JudgeStats, latency: float | None) -> None:
+        with self._locker:
+            stats.checked_at = time.monotonic()
+            if latency is None:
+                stats.alive = False
+                stats.failures += 1
+                if stats.failures == self.max_failures:
+                    logger.debug(f"Judge evicted: {stats.url}")
+            else:
+                stats.alive = True
+                stats.failures = 0
+                if stats.latency is None:
+                    stats.latency = latency
+                else:
+                    stats.latency += self.latency_smoothing * (latency - stats.latency)
@@ -0,0 +1,76 @@
+from common.metrics import METRICS
+
+# Providers.
+PROVIDER_FETCH_SECONDS = METRICS.histogram(
+    "proxy_provider_fetch_seconds", "Time of fetching a page of the provider.", ("provider",)
+)
+PROVIDER_PARSE_SECONDS = METRICS.histogram(
+    "proxy_provider_parse_seconds", "Time of parsing a page of the provider.", ("provider",)
+)
+PROVIDER_PAGES = METRICS.counter(
+    "proxy_provider_pages",
+    "Pages by provider and outcome: changed, appended, unchanged, failed, skipped as not due.",
+    ("provider", "outcome"),
+)
+PROVIDER_YIELD = METRICS.counter(
+    "proxy_provider_yield", "Proxies parsed from the pages of the provider.", ("provider",)
+)
+PROVIDER_RESULTS = METRICS.counter(
+    "proxy_provider_results",
+    "Checks of the candidates of the provider by outcome: good, bad.",
+    ("provider", "outcome"),
+)
+PROVIDER_LIVE_RATIO = METRICS.gauge(
+    "proxy_provider_live_ratio", "Recent share of the checked candidates of the provider that are good.", ("provider",)
+)
+
+# Pipeline.
+CANDIDATES = METRICS.counter(
+    "proxy_candidates", "Parsed proxies by the outcome of the dedup: accepted, dropped.", ("outcome",)
+)
+PREFILTER = METRICS.counter(
+    "proxy_prefilter", "Connects of the TCP prefilter by outcome: alive, refused, timeout, error.", ("outcome",)
+)
+PREFILTER_CONNECT_SECONDS = METRICS.histogram(
+    "proxy_prefilter_connect_seconds", "Time of a successful connect of the TCP prefilter."
+)
+CHECKS = METRICS.counter("proxy_checks", "Results of the proxy checks by status.", ("status",))
+GOOD_CHECKS = METRICS.counter(
+    "proxy_good_checks", "Good checks by the detected protocol and anonymity.", ("protocol", "anonymity")
+)
+JUDGE_SECONDS = METRICS.histogram(
+    "proxy_judge_seconds",
+    "Response time of the judge, direct for the probes or through the checked proxy.",
+    ("judge", "via"),
+)
+
+# State, the gauges are read from the running scraper.
+QUEUE_DEPTH = METRICS.gauge("proxy_queue_depth", "Number of items waiting in the queues of the stages.", ("queue",))
+POOL_SIZE = METRICS.gauge("proxy_pool_size", "Number of proxies in the pool of checked proxies.")
+CHECKS_IN_FLIGHT = METRICS.gauge("proxy_checks_in_flight", "Number of checks running.")
+CHECK_UTILIZATION = METRICS.gauge("proxy_check_utilization", "Share of the check workers that are busy.")
+DEDUP_IN_FLIGHT = METRICS.gauge("proxy_dedup_in_flight", "Number of proxies of the current generation in flight.")
+SCHEDULED = METRICS.gauge("proxy_scheduled", "Number of proxies scheduled for revalidation.")
+
+# Worker processes and nodes.
+SHARD_IN_FLIGHT = METRICS.gauge(
+    "proxy_shard_checks_in_flight", "Proxies sent to the worker process and not returned yet.", ("process",)
+)
+NODES = METRICS.gauge("proxy_nodes", "Number of worker nodes connected to the coordinator.")
+LEASES = METRICS.gauge("proxy_leases", "Number of leases held by the worker nodes.")
+NODE_RESULTS = METRICS.counter("proxy_node_results", "Results accepted from the worker node.", ("node",))
+LEASE_EVENTS = METRICS.counter(
+    "proxy_lease_events", "Leases and their proxies taken back: expired, requeued, late results.", ("event",)
+)
+
+# Scraping through the pool.
+SCRAPE_JOBS = METRICS.counter(
+    "proxy_scrape_jobs", "Finished scrape jobs by outcome: success, cached, failed.", ("outcome",)
+)
+SCRAPE_ATTEMPTS = METRICS.counter(
+    "proxy_scrape_attempts", "Requests of the scrape jobs by outcome: success, failed.", ("outcome",)
+)
+SCRAPE_HEDGES = METRICS.counter(
+    "proxy_scrape_hedges", "Backup requests of the scrape jobs: started, won by the backup.", ("event",)
+)
+SCRAPE_SECONDS = METRICS.histogram("proxy_scrape_seconds", "Time from the start of a scrape job to its result.")
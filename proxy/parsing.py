@@ -0,0 +1,78 @@
+import re
+import socket
+from array import array
+from collections.abc import Iterable
+from typing import TypeAlias
+
+# Proxy packed into a 48-bit integer: the IPv4 address in the upper 32 bits, the port in the lower 16 bits.
+# Strings are built only at the edges, where a proxy is used for requests, stored or logged.
+Proxy: TypeAlias = int
+# Packed proxies in an array of 8-byte items instead of a list of objects.
+Addresses: TypeAlias = "array[int]"
+
+OCTET = rb"(\d{1,3})"
+# Ports from 1 to 65535 are validated by the scan.
+PORT = rb"(6553[0-5]|655[0-2]\d|65[0-4]\d\d|6[0-4]\d{3}|[1-5]\d{4}|[1-9]\d{0,3})(?!\d)"
+IP = OCTET + rb"\." + OCTET + rb"\." + OCTET + rb"\." + OCTET
+
+# `ip<separator>port` where the separator is anything but digits and line breaks, e.g. `1.2.3.4:80` or
+# `1.2.3.4</td><td>80`.
+ADDRESS_PATTERN = re.compile(rb"(?<![\d.])" + IP + rb"(?![\d.])[^\d\n]{1,32}?" + PORT)
+
+# Lines of json objects with the "host" field before the "port" field.
+JSON_ADDRESS_PATTERN = re.compile(rb'"host":\s*"' + IP + rb'"[^\n]*?"port":\s*"?' + PORT)
+
+# The "port" field before the "host" field, the lookahead keeps the groups in the order of the octets and the port.
+JSON_PORT_FIRST_PATTERN = re.compile(rb'"port":\s*"?(?=\d+"?[^\n]*?"host":\s*"' + IP + rb'")' + PORT)
+
+# Octets without leading zeros shifted to their place in the packed address, the lookup validates and converts.
+OCTETS_BY_SHIFT = [{str(num).encode(): num << shift for num in range(256)} for shift in (40, 32, 24, 16)]
+
+
+def new_addresses(values: Iterable[int] = ()) -> Addresses:
+    return array("Q", values)
+
+
+def format_address(proxy: Proxy) -> str:
+    """Get the proxy as `ip:port` from the packed address."""
+    return f"{proxy >> 40}.{proxy >> 32 & 255}.{proxy >> 24 & 255}.{proxy >> 16 & 255}:{proxy & 65535}"
+
+
+def unpack_address(proxy: Proxy) -> tuple[str, int]:
+    """Get the host and the port of the proxy for a socket."""
+    return socket.inet_ntoa((proxy >> 16).to_bytes(4, "big")), proxy & 65535
+
+
+def parse_proxy(text: str) -> Proxy | None:
+    """Get the packed address of the proxy given as `ip:port`, None if it is not valid."""
+    addresses = parse_addresses(text.encode())
+    return addresses[0] if len(addresses) == 1 else None
+
+
+def parse_addresses(data: bytes, pattern: re.Pattern[bytes] = ADDRESS_PATTERN) -> Addresses:
+    """Find all the proxies in the buffer with one scan.
+
+    Args:
+        data (bytes): Raw content of a page.
+        pattern (re.Pattern[bytes]): Pattern with the four octets and the valid port as groups.
+            Defaults to ADDRESS_PATTERN.
+
+    Returns:
+        Addresses: Packed addresses of the valid proxies in the order of the buffer.
+    """
+    first, second, third, fourth = OCTETS_BY_SHIFT
+    matches = pattern.findall(data)
+    try:
+        return new_addresses([first[a] | second[b] | third[c] | fourth[d] | int(port) for a, b, c, d, port in matches])
+    except KeyError:
+        # Octets above 255 or with leading zeros are rare, only then every match is checked.
+        return new_addresses(
+            first[a] | second[b] | third[c] | fourth[d] | int(port)
+            for a, b, c, d, port in matches
+            if a in first and b in second and c in third and d in fourth
+        )
+
+
+def parse_lines(lines: Iterable[str]) -> Addresses:
+    """Find all the proxies in the lines of text extracted from a page."""
+    return parse_addresses("\n".join(lines).encode())
@@ -0,0 +1,229 @@
+import random
+from collections.abc import Callable, Collection, Iterable, Sequence
+from threading import Lock
+from typing import NamedTuple
+
+from common.tunnel import ProxyProtocol
+
+from .anonymity import Anonymity
+from .parsing import Proxy
+from .results import CheckResult
+
+
+class PooledProxy:
+    """State of a proxy in the pool, the load and the score are changed under the lock of the entry."""
+
+    __slots__ = ("proxy", "score", "in_flight", "failures", "protocol", "anonymity", "locker")
+
+    def __init__(
+        self, proxy: Proxy, score: float, protocol: ProxyProtocol | None = None, anonymity: Anonymity | None = None
+    ) -> None:
+        self.proxy = proxy
+        # Exponentially decayed response time, lower is better.
+        self.score = score
+        self.in_flight = 0
+        self.failures = 0
+        self.protocol = protocol
+        self.anonymity = anonymity
+        self.locker = Lock()
+
+    def cost(self) -> float:
+        return self.score * (1 + self.in_flight)
+
+    def matches(self, protocols: Collection[ProxyProtocol] | None, min_anonymity: Anonymity | None) -> bool:
+        """Whether the proxy is of one of the protocols and at least as anonymous.
+
+        A proxy of an unknown protocol counts as an HTTP proxy, a proxy of an unknown anonymity is never anonymous.
+        """
+        if protocols is not None and (self.protocol or ProxyProtocol.HTTP) not in protocols:
+            return False
+        if min_anonymity is not None and (self.anonymity is None or self.anonymity.level < min_anonymity.level):
+            return False
+        return True
+
+
+class PoolSnapshot(NamedTuple):
+    """Members of the pool at one moment, never changed after it is published."""
+
+    # Entries in a sequence for the random choice.
+    items: tuple[PooledProxy, ...]
+    entries: dict[Proxy, PooledProxy]
+
+
+class ProxyPool:
+    """Thread-safe pool of checked proxies ranked by their response time.
+
+    `acquire()` picks two random proxies and returns the one with the lower expected response time under its
+    current load (the power of two choices), so load goes to fast proxies without piling on a single one.
+    Results of real traffic passed to `release()` update the score; a proxy that fails `max_failures` times
+    in a row is removed from the pool.
+    The protocol and the anonymity found by the check are kept with the proxy, so a worker can ask for a class.
+
+    The members are published as an immutable snapshot. A change of the members copies it and swaps the
+    attribute, which is atomic, so `acquire()` and the readers never take the lock of the pool. Only the writers
+    of the members take it, and a batch of results passed to `publish()` makes one copy.
+
+    Args:
+        decay (float): Weight of the last observation in the score. Defaults to 0.3.
+        failure_latency (float): Response time counted for a failed request in seconds. Defaults to 10.
+        max_failures (int): Consecutive failures after which the proxy is removed. Defaults to 3.
+    """
+
+    def __init__(self, decay: float = 0.3, failure_latency: float = 10, max_failures: int = 3) -> None:
+        # Serializes the writers of the snapshot.
+        self._locker = Lock()
+        self._snapshot = PoolSnapshot((), {})
+
+        self.decay = decay
+        self.failure_latency = failure_latency
+        self.max_failures = max_failures
+
+    def __len__(self) -> int:
+        return len(self._snapshot.items)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return proxy in self._snapshot.entries
+
+    def snapshot(self) -> PoolSnapshot:
+        """Get the current members, the snapshot does not change when the pool does."""
+        return self._snapshot
+
+    def proxies(self) -> list[Proxy]:
+        """Get the proxies of the pool, the fastest first."""
+        return [item.proxy for item in sorted(self._snapshot.items, key=lambda x: x.score)]
+
+    def update(self, results: list[CheckResult]) -> None:
+        """Replace the proxies of the pool with the good proxies of the results.
+
+        The score of the proxies that stay in the pool is decayed with the new response time.
+        """
+        good_results = {result.proxy: result for result in results if result.is_good}
+        with self._locker:
+            entries = {proxy: item for proxy, item in self._snapshot.entries.items() if proxy in good_results}
+            for result in good_results.values():
+                self._add(entries, result)
+            self._swap(entries)
+
+    def publish(self, results: Iterable[CheckResult]) -> None:
+        """Add the proxies of the good results or update their score, remove the proxies of the failed ones.
+
+        The inconclusive results leave the pool as it is. The snapshot is copied once for the batch and only if
+        the members change.
+        """
+        with self._locker:
+            entries = self._snapshot.entries
+            copied = False
+            for result in results:
+                if result.is_good and result.proxy in entries:
+                    self._add(entries, result)
+                    continue
+                if not result.is_good and (not result.is_failure or result.proxy not in entries):
+                    continue
+                if not copied:
+                    entries, copied = dict(entries), True
+                if result.is_good:
+                    self._add(entries, result)
+                else:
+                    del entries[result.proxy]
+            if copied:
+                self._swap(entries)
+
+    def add(self, result: CheckResult) -> None:
+        """Add the proxy to the pool or update its score."""
+        if result.is_good:
+            self.publish((result,))
+
+    def remove(self, proxy: Proxy) -> None:
+        with self._locker:
+            if proxy in self._snapshot.entries:
+                entries = dict(self._snapshot.entries)
+                del entries[proxy]
+                self._swap(entries)
+
+    def acquire(
+        self,
+        exclude: Collection[Proxy] = (),
+        protocols: Collection[ProxyProtocol] | None = None,
+        min_anonymity: Anonymity | None = None,
+    ) -> Proxy | None:
+        """Take a proxy for a request.
+
+        Args:
+            exclude (Collection[Proxy]): Proxies not to take, e.g. the ones already tried for the request.
+                Defaults to ().
+            protocols (Collection[ProxyProtocol] | None): Take only a proxy of these protocols. Defaults to None.
+            min_anonymity (Anonymity | None): Take only a proxy at least this anonymous. Defaults to None.
+
+        Returns:
+            Proxy | None: Packed address of the proxy or None if the pool has no such proxy.
+        """
+        items: Sequence[PooledProxy] = self._snapshot.items
+        if exclude or protocols is not None or min_anonymity is not None:
+            items = self._sample(
+                items, lambda item: item.proxy not in exclude and item.matches(protocols, min_anonymity)
+            )
+        if not items:
+            return None
+        if len(items) == 1:
+            item = items[0]
+        else:
+            first, second = random.sample(items, 2)
+            item = first if first.cost() <= second.cost() else second
+        with item.locker:
+            item.in_flight += 1
+        return item.proxy
+
+    @staticmethod
+    def _sample(items: Sequence[PooledProxy], accept: Callable[[PooledProxy], bool]) -> list[PooledProxy]:
+        """Get two random accepted entries, all the accepted ones if the random draws miss."""
+        if len(items) > 2:
+            # Usually most entries are accepted, a couple of draws find two of them.
+            for _ in range(8):
+                sample = [item for item in random.sample(items, 2) if accept(item)]
+                if len(sample) == 2:
+                    return sample
+        return [item for item in items if accept(item)]
+
+    def protocol(self, proxy: Proxy) -> ProxyProtocol:
+        """Get the detected protocol of the proxy, HTTP if it is unknown."""
+        item = self._snapshot.entries.get(proxy)
+        return (item.protocol if item is not None else None) or ProxyProtocol.HTTP
+
+    def release(self, proxy: Proxy, success: bool, latency: float | None = None) -> None:
+        """Return the proxy taken by `acquire()` with the result of the request.
+
+        Args:
+            proxy (Proxy): Packed address of the proxy.
+            success (bool): Whether the request through the proxy has succeeded.
+            latency (float | None): Response time in seconds. Defaults to None.
+        """
+        item = self._snapshot.entries.get(proxy)
+        if item is None:
+            return
+        with item.locker:
+            item.in_flight = max(0, item.in_flight - 1)
+            if success:
+                item.failures = 0
+                if latency is not None:
+                    item.score += self.decay * (latency - item.score)
+                return
+            item.failures += 1
+            item.score += self.decay * (self.failure_latency - item.score)
+            failed = item.failures >= self.max_failures
+        if failed:
+            self.remove(proxy)
+
+    def _add(self, entries: dict[Proxy, PooledProxy], result: CheckResult) -> None:
+        latency = result.latency if result.latency is not None else self.failure_latency
+        item = entries.get(result.proxy)
+        if item is None:
+            entries[result.proxy] = PooledProxy(result.proxy, latency, result.protocol, result.anonymity)
+            return
+        with item.locker:
+            item.failures = 0
+            item.score += self.decay * (latency - item.score)
+            item.protocol = result.protocol or item.protocol
+            item.anonymity = result.anonymity or item.anonymity
+
+    def _swap(self, entries: dict[Proxy, PooledProxy]) -> None:
+        self._snapshot = PoolSnapshot(tuple(entries.values()), entries)
@@ -0,0 +1,245 @@
+import errno
+import heapq
+import itertools
+import resource
+import selectors
+import socket
+import time
+from collections import deque
+from collections.abc import Iterable
+from queue import Empty, Queue
+from threading import Event
+from typing import Callable
+
+from .metrics import PREFILTER, PREFILTER_CONNECT_SECONDS
+from .parsing import Proxy, unpack_address
+
+# Deadline, sequence number that breaks the ties of the deadlines, socket and proxy of a connect in flight.
+InFlight = list[tuple[float, int, socket.socket, Proxy]]
+
+# Outcomes of the connect errors that come from the proxy, any other error may come from this host, e.g. EMFILE,
+# ENETUNREACH or EADDRNOTAVAIL, and tells nothing about the proxy.
+DEAD_OUTCOMES = {errno.ECONNREFUSED: "refused", errno.ETIMEDOUT: "timeout"}
+
+# How often the queue of candidates is looked at while connects are in flight.
+QUEUE_POLL_INTERVAL = 0.05
+
+# Maximum number of connects in flight, whatever the limit of file descriptors.
+MAX_SOCKETS = 1000
+
+
+def default_max_sockets() -> int:
+    """Get the number of connects in flight that leaves half of the file descriptors to the checks and the rest."""
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return MAX_SOCKETS
+    return max(1, min(MAX_SOCKETS, soft_limit // 2))
+
+
+class TcpPrefilter:
+    """Cheap check that the proxy accepts TCP connections.
+
+    Non-blocking connects to many candidates are multiplexed with a selector. The timeout adapts to the observed
+    connect times: it is `timeout_factor` times their 95th percentile, within `min_timeout` and `max_timeout`.
+
+    Args:
+        max_sockets (int | None): Maximum number of connects in flight. Defaults to None, half of the soft limit
+            of file descriptors, at most 1000.
+        timeout (float): Timeout of a connect in seconds until enough connects are observed. Defaults to 1.
+        min_timeout (float): Lower bound of the adaptive timeout. Defaults to 0.2.
+        max_timeout (float): Upper bound of the adaptive timeout. Defaults to 3.
+        timeout_factor (float): Multiplier of the 95th percentile of connect times. Defaults to 3.
+    """
+
+    def __init__(
+        self,
+        max_sockets: int | None = None,
+        timeout: float = 1,
+        min_timeout: float = 0.2,
+        max_timeout: float = 3,
+        timeout_factor: float = 3,
+    ) -> None:
+        self.max_sockets = max_sockets if max_sockets is not None else default_max_sockets()
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+
+        self._connect_times: deque[float] = deque(maxlen=1000)
+        self._sequence = itertools.count()
+        self._count_of_new_times = 0
+        self.count_of_alive = 0
+        self.count_of_dead = 0
+        self.count_of_errors = 0
+
+    def filter(self, proxies: Iterable[Proxy]) -> list[Proxy]:
+        """Get the proxies that accept TCP connections.
+
+        Args:
+            proxies (Iterable[Proxy]): Packed addresses of the proxies.
+
+        Returns:
+            list[Proxy]: Alive proxies.
+        """
+        alive: list[Proxy] = []
+        source = iter(proxies)
+        with selectors.DefaultSelector() as selector:
+            in_flight: InFlight = []
+            exhausted = False
+            while not exhausted or in_flight:
+                while not exhausted and len(in_flight) < self.max_sockets:
+                    proxy = next(source, None)
+                    if proxy is None:
+                        exhausted = True
+                    else:
+                        self._connect(selector, in_flight, proxy)
+                for proxy, outcome, _ in self._poll(selector, in_flight, None):
+                    if outcome == "alive":
+                        alive.append(proxy)
+        return alive
+
+    def run(
+        self,
+        source: "Queue[Proxy | None]",
+        on_result: Callable[[Proxy, float | None], None],
+        stop_event: Event | None = None,
+        on_error: Callable[[Proxy], None] | None = None,
+    ) -> None:
+        """Prefilter the candidates from the queue until the sentinel None or the stop event.
+
+        Args:
+            source (Queue[Proxy | None]): Queue of packed addresses of the candidates.
+            on_result (Callable[[Proxy, float | None], None]): Called with the proxy and its connect time,
+                None if the proxy has refused the connection or has not answered within the timeout.
+            stop_event (Event | None): Once set, no more candidates are taken and the connects in flight are
+                dropped. Defaults to None, only the sentinel stops.
+            on_error (Callable[[Proxy], None] | None): Called with the proxy whose connect has failed on this
+                host, e.g. out of file descriptors or without a route, which tells nothing about the proxy.
+                Defaults to None, the proxy is dropped.
+        """
+        stopped = False
+        with selectors.DefaultSelector() as selector:
+            in_flight: InFlight = []
+            while not stopped:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                results: list[tuple[Proxy, str, float | None]] = []
+                while len(in_flight) < self.max_sockets:
+                    try:
+                        # Nothing to poll, it is safe to block until the next candidate.
+                        proxy = source.get(block=not in_flight)
+                    except Empty:
+                        break
+                    if proxy is None:
+                        stopped = True
+                        break
+                    outcome = self._connect(selector, in_flight, proxy)
+                    if outcome is not None:
+                        results.append((proxy, outcome, None))
+
+                results.extend(self._poll(selector, in_flight, QUEUE_POLL_INTERVAL))
+                for proxy, outcome, connect_time in results:
+                    if outcome != "error":
+                        on_result(proxy, connect_time)
+                    elif on_error is not None:
+                        on_error(proxy)
+
+            for _, _, sock, _ in in_flight:
+                selector.unregister(sock)
+                sock.close()
+
+    def _connect(self, selector: selectors.BaseSelector, in_flight: InFlight, proxy: Proxy) -> str | None:
+        """Start a non-blocking connect.
+
+        Returns:
+            str | None: Outcome of the connect if it has failed at once, "refused" or "error".
+        """
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError:
+            return self._count("error")
+
+        sock.setblocking(False)
+        try:
+            code = sock.connect_ex(unpack_address(proxy))
+        except (ValueError, OSError, OverflowError):
+            sock.close()
+            return self._count("error")
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            return self._count(DEAD_OUTCOMES.get(code, "error"))
+
+        start_time = time.monotonic()
+        selector.register(sock, selectors.EVENT_WRITE, (proxy, start_time))
+        heapq.heappush(in_flight, (start_time + self.timeout, next(self._sequence), sock, proxy))
+        return None
+
+    def _poll(
+        self,
+        selector: selectors.BaseSelector,
+        in_flight: InFlight,
+        max_wait: float | None,
+    ) -> list[tuple[Proxy, str, float | None]]:
+        """Wait for finished connects and expire the timed out ones.
+
+        `in_flight` is a heap by deadline, the timeout shrinks as connect times are observed and a later connect
+        may expire before an earlier one.
+
+        Returns:
+            list[tuple[Proxy, str, float | None]]: Proxies, the outcomes of their connects and the connect times
+                of the alive ones.
+        """
+        if not in_flight:
+            return []
+
+        wait_time = max(0.0, in_flight[0][0] - time.monotonic())
+        if max_wait is not None:
+            wait_time = min(wait_time, max_wait)
+
+        results: list[tuple[Proxy, str, float | None]] = []
+        done: set[socket.socket] = set()
+        for key, _ in selector.select(wait_time):
+            sock: socket.socket = key.fileobj  # type: ignore[assignment]
+            proxy, start_time = key.data
+            selector.unregister(sock)
+            code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if code == 0:
+                connect_time = time.monotonic() - start_time
+                self._add_connect_time(connect_time)
+                PREFILTER_CONNECT_SECONDS.observe(connect_time)
+                results.append((proxy, self._count("alive"), connect_time))
+            else:
+                results.append((proxy, self._count(DEAD_OUTCOMES.get(code, "error")), None))
+            sock.close()
+            done.add(sock)
+
+        if done:
+            in_flight[:] = [item for item in in_flight if item[2] not in done]
+            heapq.heapify(in_flight)
+
+        now = time.monotonic()
+        while in_flight and in_flight[0][0] <= now:
+            _, _, sock, proxy = heapq.heappop(in_flight)
+            selector.unregister(sock)
+            sock.close()
+            results.append((proxy, self._count("timeout"), None))
+        return results
+
+    def _count(self, outcome: str) -> str:
+        PREFILTER.inc(outcome)
+        if outcome == "alive":
+            self.count_of_alive += 1
+        elif outcome == "error":
+            self.count_of_errors += 1
+        else:
+            self.count_of_dead += 1
+        return outcome
+
+    def _add_connect_time(self, connect_time: float) -> None:
+        self._connect_times.append(connect_time)
+        self._count_of_new_times += 1
+        if self._count_of_new_times >= 100:
+            self._count_of_new_times = 0
+            times = sorted(self._connect_times)
+            p95 = times[int(len(times) * 0.95)]
+            self.timeout = min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_factor))
@@ -0,0 +1,314 @@
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from logging import Logger
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from queue import Empty, Queue
+from typing import Any, Callable
+
+from common.adaptive import AimdLimiter
+from common.logger import get_main_logger
+
+from .async_checker import AsyncCheckerProxy
+from .checker import CheckerProxy
+from .judges import JudgeRegistry
+from .metrics import CHECK_UTILIZATION, CHECKS_IN_FLIGHT, SHARD_IN_FLIGHT
+from .parsing import Proxy, new_addresses
+from .providers import Provider
+from .results import CheckResult, ResultRecord
+from .run_threads import RunThreads, drain, take_batch
+
+logger: Logger = get_main_logger()
+
+
+def shard_of(proxy: Proxy, shards: int) -> int:
+    """Get the shard of the proxy by a multiplicative hash of the packed address.
+
+    The low bits of the address are the port, a plain modulo would send all the proxies on port 8080 to one shard.
+    """
+    return ((proxy * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * shards >> 64
+
+
+@dataclass(slots=True)
+class ShardConfig:
+    """Settings of the checking stage of a worker process.
+
+    check_mode (str): "threads" or "async", as in Facade.
+    max_workers_proxies (int): Number of check threads in the "threads" mode.
+    max_concurrent_checks (int): Maximum number of checks in flight in the "async" mode.
+    url_of_second_check (str | None): Additional verification on a specific site.
+    judges (list[str] | None): Urls of the proxy judges.
+    batch_size (int): Maximum number of results in a message to the parent.
+    """
+
+    check_mode: str
+    max_workers_proxies: int
+    max_concurrent_checks: int
+    url_of_second_check: str | None
+    judges: list[str] | None
+    batch_size: int
+
+
+class ShardWorker:
+    """Checking stage in a worker process.
+
+    Proxies come from the parent in batches of packed addresses, an empty message is the stop. Results go back
+    in batches of tuples. The process has its own judges, checkers and concurrency limit.
+    """
+
+    def __init__(self, config: ShardConfig, proxies_conn: Connection, results_conn: Connection) -> None:
+        self.config = config
+        self._proxies_conn = proxies_conn
+        self._results_conn = results_conn
+        self._proxies_queue: Queue[Proxy | None] = Queue()
+        self._results_queue: Queue[CheckResult | None] = Queue()
+
+        self.judges = JudgeRegistry(judges=config.judges)
+        self.checker_proxy = CheckerProxy(url_of_second_check=config.url_of_second_check, judges=self.judges)
+        self.async_checker_proxy = AsyncCheckerProxy(
+            url_of_second_check=config.url_of_second_check, judges=self.judges
+        )
+        max_limit = config.max_concurrent_checks if config.check_mode == "async" else config.max_workers_proxies
+        self.concurrency = AimdLimiter(max_limit=max_limit)
+
+    def check_workers(self) -> list[Callable[[], None]]:
+        if self.config.check_mode == "async":
+            return [self.check_proxies_async]
+        return [self.check_proxies for _ in range(self.config.max_workers_proxies)]
+
+    def run(self) -> None:
+        self.judges.start()
+        check_workers = self.check_workers()
+        try:
+            with ThreadPoolExecutor(max_workers=len(check_workers) + 1, thread_name_prefix="SH") as executor:
+                futures = [executor.submit(worker) for worker in check_workers]
+                executor.submit(self.send_results)
+                self.receive_proxies()
+
+                # The proxies not yet checked are dropped, the checks in flight are completed.
+                drain(self._proxies_queue)
+                for _ in check_workers:
+                    self._proxies_queue.put(None)
+                wait(futures)
+                self._results_queue.put(None)
+        finally:
+            self.judges.stop()
+            self._results_conn.close()
+
+    def receive_proxies(self) -> None:
+        """Getting the batches of proxies from the parent until the stop or the closed pipe."""
+        while True:
+            try:
+                data = self._proxies_conn.recv_bytes()
+            except EOFError:
+                break
+            if not data:
+                break
+            batch = new_addresses()
+            batch.frombytes(data)
+            for proxy in batch:
+                self._proxies_queue.put(proxy)
+
+    def send_results(self) -> None:
+        """Sending the results to the parent in batches."""
+        stopped = False
+        while not stopped:
+            batch, stopped = take_batch(self._results_queue, self.config.batch_size)
+            if batch:
+                records: list[ResultRecord] = [result.to_record() for result in batch]
+                self._results_conn.send(records)
+
+    def check_proxies(self) -> None:
+        while True:
+            proxy = self._proxies_queue.get()
+            if proxy is None:
+                break
+            with self.concurrency.slot():
+                result = self.checker_proxy(proxy)
+            if result.is_conclusive:
+                self.concurrency.record(result.is_good)
+            self._results_queue.put(result)
+
+    def check_proxies_async(self) -> None:
+        asyncio.run(self._check_proxies_async())
+
+    async def _check_proxies_async(self) -> None:
+        tasks: set[asyncio.Task[None]] = set()
+
+        while True:
+            while len(tasks) >= self.concurrency.limit:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            try:
+                proxy = self._proxies_queue.get_nowait()
+            except Empty:
+                proxy = await asyncio.to_thread(self._proxies_queue.get)
+            if proxy is None:
+                break
+
+            task = asyncio.create_task(self._check_async(proxy))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _check_async(self, proxy: Proxy) -> None:
+        self.concurrency.in_flight += 1
+        try:
+            result = await self.async_checker_proxy(proxy)
+        finally:
+            self.concurrency.in_flight -= 1
+        if result.is_conclusive:
+            self.concurrency.record(result.is_good)
+        self._results_queue.put(result)
+
+
+def run_shard_worker(config: ShardConfig, proxies_conn: Connection, results_conn: Connection) -> None:
+    """Entry point of a worker process."""
+    # CTRL + C reaches the whole process group, the parent stops the workers through the pipes.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ShardWorker(config, proxies_conn, results_conn).run()
+
+
+class ProcessRunThreads(RunThreads):
+    """
+    This class implements an infinite run threads with proxy checks in worker processes.
+
+    Candidates are sharded between `processes` worker processes by a hash of the packed address, so a proxy is
+    always checked by the same process. Every process runs its own checking stage in the `check_mode`, the
+    `max_workers_proxies` and `max_concurrent_checks` limits apply to each of them. Proxies and results go
+    through pipes in batches. The pages of the providers are parsed in a pool of `parse_processes` processes.
+    Fetching, dedup, prefilter, the pool and the scheduler stay in this process.
+    """
+
+    def __init__(
+        self,
+        processes: int,
+        check_mode: str,
+        max_workers_proxies: int,
+        max_concurrent_checks: int,
+        max_custom_worker: int,
+        providers_list: list[Provider],
+        checker_proxy: CheckerProxy,
+        parse_processes: int | None = None,
+        batch_size: int = 256,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            max_workers_proxies=max_workers_proxies,
+            max_custom_worker=max_custom_worker,
+            providers_list=providers_list,
+            # Used only outside of the checking stage, the workers create their checkers from the config.
+            checker_proxy=checker_proxy,
+            **kwargs,
+        )
+        self.processes = processes
+        self.parse_processes = parse_processes or processes
+        self.batch_size = batch_size
+        self.config = ShardConfig(
+            check_mode=check_mode,
+            max_workers_proxies=max_workers_proxies,
+            max_concurrent_checks=max_concurrent_checks,
+            url_of_second_check=checker_proxy.url_of_second_check,
+            judges=[stats.url for stats in checker_proxy.judges.stats()],
+            batch_size=batch_size,
+        )
+
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: list[BaseProcess] = []
+        self._proxies_conns: list[Connection] = []
+        self._results_conns: list[Connection] = []
+        self._parse_executor: ProcessPoolExecutor | None = None
+        # Proxies sent to every process and not returned yet.
+        self._in_flight_by_shard = [0] * processes
+
+    def register_metrics(self) -> None:
+        super().register_metrics()
+        SHARD_IN_FLIGHT.set_function(
+            lambda: {(str(shard),): count for shard, count in enumerate(self._in_flight_by_shard)}
+        )
+        CHECKS_IN_FLIGHT.set_function(lambda: sum(self._in_flight_by_shard))
+        # The workers of the processes are not seen from here.
+        CHECK_UTILIZATION.set_function(lambda: {})
+
+    def check_workers(self) -> list[Callable[[], None]]:
+        return [self.dispatch_proxies, *[partial(self.receive_results, shard) for shard in range(self.processes)]]
+
+    def dispatch_proxies(self) -> None:
+        """Sending the proxies to the worker processes in batches, sharded by the hash of the address."""
+        stopped = False
+        while not stopped:
+            proxies, stopped = take_batch(self._unchecked_proxies_queue, self.batch_size)
+            batches = [new_addresses() for _ in range(self.processes)]
+            for proxy in proxies:
+                batches[shard_of(proxy, self.processes)].append(proxy)
+            for shard, batch in enumerate(batches):
+                if batch:
+                    with self._locker:
+                        self._in_flight_by_shard[shard] += len(batch)
+                    self._proxies_conns[shard].send_bytes(batch.tobytes())
+
+        for conn in self._proxies_conns:
+            conn.send_bytes(b"")
+
+    def receive_results(self, shard: int) -> None:
+        """Publishing the batches of results of a worker process until it closes the pipe."""
+        conn = self._results_conns[shard]
+        while True:
+            try:
+                records: list[ResultRecord] = conn.recv()
+            except EOFError:
+                break
+            with self._locker:
+                self._in_flight_by_shard[shard] -= len(records)
+            for record in records:
+                self.add_checked_proxy(CheckResult.from_record(record))
+
+    def start_processes(self) -> None:
+        """Start the worker processes and the parsing pool."""
+        for _ in range(self.processes):
+            proxies_reader, proxies_writer = self._context.Pipe(duplex=False)
+            results_reader, results_writer = self._context.Pipe(duplex=False)
+            process = self._context.Process(
+                target=run_shard_worker, args=(self.config, proxies_reader, results_writer), daemon=True
+            )
+            process.start()
+            # The ends of the child are closed here, so a closed pipe is seen when the child exits.
+            proxies_reader.close()
+            results_writer.close()
+            self._processes.append(process)
+            self._proxies_conns.append(proxies_writer)
+            self._results_conns.append(results_reader)
+
+        self._parse_executor = ProcessPoolExecutor(max_workers=self.parse_processes, mp_context=self._context)
+        for provider in self.providers_list:
+            provider.parse_executor = self._parse_executor
+        logger.info(f"Started {self.processes} check processes and {self.parse_processes} parse processes")
+
+    def stop_processes(self) -> None:
+        """Wait for the worker processes and shut down the parsing pool."""
+        for provider in self.providers_list:
+            provider.parse_executor = None
+        if self._parse_executor is not None:
+            self._parse_executor.shutdown(cancel_futures=True)
+            self._parse_executor = None
+
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for conn in [*self._proxies_conns, *self._results_conns]:
+            conn.close()
+        self._processes.clear()
+        self._proxies_conns.clear()
+        self._results_conns.clear()
+
+    def run(self) -> None:
+        self.start_processes()
+        try:
+            super().run()
+        finally:
+            self.stop_processes()
@@ -1,23 +1,119 @@
-import json
-import re
+import math
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Any
 
-from lxml.html import fromstring
 from requests.models import Response
 
-from common.smart_request import SmartRequest
+from common.rate_limit import HOST_LIMITER, HostLimiter
+from common.smart_request import HEADERS, SmartRequest
+
+from .fetch_cache import FetchCache
+from .metrics import PROVIDER_FETCH_SECONDS, PROVIDER_PAGES, PROVIDER_PARSE_SECONDS, PROVIDER_YIELD
+from .parsing import Addresses, Proxy
+from .sources import SOURCES, SourceDefinition, expand_urls, load_sources, parse_links, parse_source
+
+# Weight of the previous runs in the yield of a page, the counters are multiplied by it at every fetch.
+YIELD_DECAY = 0.5
+
+
+class PageStats:
+    """Yield of a page url of a provider.
+
+    The counters are decayed at every fetch of the page, so they follow the recent runs of the source.
+    """
+
+    __slots__ = (
+        "url",
+        "fetches",
+        "parsed",
+        "accepted",
+        "checked",
+        "good",
+        "good_since_fetch",
+        "idle_fetches",
+        "due_at",
+    )
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.fetches = 0.0
+        self.parsed = 0.0
+        # Candidates that have passed the dedup, the proxies of the page not found by another page first.
+        self.accepted = 0.0
+        self.checked = 0.0
+        self.good = 0.0
+        self.good_since_fetch = 0
+        # Consecutive fetches not followed by a good proxy, they space out the next fetches.
+        self.idle_fetches = 0
+        self.due_at = 0.0
 
-IP_PORT_PATTERN = re.compile(
-    r"(?P<ip>(?:(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d?)).*?(?P<port>\d{2,5})"
-)
+    @property
+    def good_per_fetch(self) -> float:
+        return self.good / self.fetches if self.fetches else 0.0
 
+    @property
+    def live_ratio(self) -> float | None:
+        return self.good / self.checked if self.checked else None
 
-class Provider(ABC):
-    """Request handler for a provider."""
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "fetches": round(self.fetches, 3),
+            "parsed": round(self.parsed, 3),
+            "accepted": round(self.accepted, 3),
+            "checked": round(self.checked, 3),
+            "good": round(self.good, 3),
+            "live_ratio": self.live_ratio,
+            "idle_fetches": self.idle_fetches,
+        }
 
-    def __init__(self) -> None:
-        self._result: set[str] = set()
+
+class Provider(ABC):
+    """Request handler for a provider.
+
+    Pages are fetched concurrently within the limits of their hosts. Requests are conditional, a page that has
+    not changed since the previous run is not parsed again. With `parse_executor` set, e.g. to a process pool,
+    whole pages are parsed there instead of the fetching thread.
+
+    The provider keeps the yield of every page url: the proxies parsed, accepted by the dedup, checked and good.
+    The runner reports the accepted candidates and their checks back. Pages are fetched in the order of their
+    good proxies per fetch, and a page whose fetch has not been followed by a good proxy is fetched again only
+    after twice the interval, up to `max_refresh_backoff` times, so bandwidth and checks go to the pages that
+    pay off. Runners fetch the providers in the order of `priority()`.
+
+    max_workers (int): Maximum number of pages fetched at once. Defaults to 8.
+    host_limiter (HostLimiter | None): Per-host limits shared with other providers. Defaults to HOST_LIMITER.
+    min_refresh_interval (float): Minimum time in seconds between the runs that fetch the pages,
+        a run within this time yields nothing. Defaults to 60.
+    max_refresh_backoff (float): Maximum multiple of `min_refresh_interval` between the fetches of a page
+        without good proxies. Defaults to 16.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        host_limiter: HostLimiter | None = None,
+        min_refresh_interval: float = 60,
+        max_refresh_backoff: float = 16,
+    ) -> None:
         self._request = SmartRequest()
+        self._fetched_at: float | None = None
+        self._stats_locker = Lock()
+        self._page_stats: dict[str, PageStats] = {}
+        self.fetch_cache = FetchCache()
+        self.parse_executor: Executor | None = None
+        self.max_workers = max_workers
+        self.host_limiter = host_limiter or HOST_LIMITER
+        self.min_refresh_interval = min_refresh_interval
+        self.max_refresh_backoff = max_refresh_backoff
+
+    @property
+    def name(self) -> str:
+        """Name of the provider in the metrics, the store and the stats."""
+        return type(self).__name__
 
     @abstractmethod
     def create_pages_urls(self) -> list[str]:
@@ -29,203 +125,314 @@ class Provider(ABC):
         pass
 
     @abstractmethod
-    def parsing(self, resp: Response) -> list[str]:
+    def parsing(self, resp: Response) -> Addresses:
         """Parsing the data from the received response.
 
         Args:
             resp (Response): The response received from the request to the page.
 
         Returns:
-            list[str]: Proxy list.
+            Addresses: Packed addresses of the valid proxies.
         """
         pass
 
-    @property
-    def result(self) -> list[str]:
-        return list(self._result)
+    def parse_appended(self, content: bytes) -> "Addresses | None":
+        """Parsing the lines appended to the page since the previous run.
+
+        Args:
+            content (bytes): Appended lines.
 
-    def __call__(self) -> list[str]:
-        self._run()
-        return self.result
+        Returns:
+            Addresses | None: Packed addresses of the valid proxies or None if the page has to be parsed whole.
+        """
+        return None
+
+    def page_stats(self) -> list[PageStats]:
+        """Get the yield of the page urls, the best paying first."""
+        with self._stats_locker:
+            return sorted(self._page_stats.values(), key=lambda x: x.good_per_fetch, reverse=True)
+
+    def priority(self) -> float:
+        """Expected good proxies of a run, infinite before the first run so that every provider is tried."""
+        with self._stats_locker:
+            if not self._page_stats:
+                return math.inf
+            return sum(stats.good_per_fetch for stats in self._page_stats.values())
+
+    def live_ratio(self) -> float | None:
+        """Recent share of the checked candidates that are good, None before the first check."""
+        with self._stats_locker:
+            checked = sum(stats.checked for stats in self._page_stats.values())
+            good = sum(stats.good for stats in self._page_stats.values())
+        return good / checked if checked else None
+
+    def record_accepted(self, url: str, count: int) -> None:
+        """Count the candidates of the page that have passed the dedup."""
+        with self._stats_locker:
+            stats = self._page_stats.get(url)
+            if stats is not None:
+                stats.accepted += count
+
+    def record_result(self, url: str, is_good: bool) -> None:
+        """Count the check of a candidate of the page."""
+        with self._stats_locker:
+            stats = self._page_stats.get(url)
+            if stats is None:
+                return
+            stats.checked += 1
+            if is_good:
+                stats.good += 1
+                stats.good_since_fetch += 1
+
+    def _due_urls(self, urls: list[str], now: float) -> list[str]:
+        """Get the urls due for a fetch, the best paying first and the new ones before them.
+
+        The stats of the urls no longer listed are dropped.
+        """
+        with self._stats_locker:
+            self._page_stats = {url: self._page_stats[url] for url in urls if url in self._page_stats}
+            due = [url for url in urls if url not in self._page_stats or self._page_stats[url].due_at <= now]
+            due.sort(key=lambda url: -self._page_stats[url].good_per_fetch if url in self._page_stats else -math.inf)
+        return due
+
+    def _record_fetch(self, url: str, parsed: int, run_at: float) -> None:
+        """Count the fetch of the page and schedule the next one by the yield of the previous one."""
+        with self._stats_locker:
+            stats = self._page_stats.get(url)
+            if stats is None:
+                stats = self._page_stats[url] = PageStats(url)
+            elif stats.good_since_fetch:
+                stats.idle_fetches = 0
+            else:
+                stats.idle_fetches += 1
+            stats.good_since_fetch = 0
+            stats.fetches *= YIELD_DECAY
+            stats.parsed *= YIELD_DECAY
+            stats.accepted *= YIELD_DECAY
+            stats.checked *= YIELD_DECAY
+            stats.good *= YIELD_DECAY
+            stats.fetches += 1
+            stats.parsed += parsed
+            # From the start of the run, so the page is due at the next run after `min_refresh_interval`.
+            backoff = min(2.0**stats.idle_fetches, self.max_refresh_backoff)
+            stats.due_at = run_at + self.min_refresh_interval * backoff
+
+    def __call__(self) -> Iterator[Proxy]:
+        """Run the provider once.
+
+        Nothing is kept between the runs, so the provider can be reused for every generation of proxies.
+
+        Yields:
+            Proxy: Packed address of a proxy, the proxies of a page as soon as it is parsed.
+        """
+        for addresses in self.stream():
+            yield from addresses
 
-    def _add_to_result(self, value: str | list[str]) -> None:
-        """Adding data to the result.
+    def stream(self) -> Iterator[Addresses]:
+        """Fetching the pages concurrently and yielding the proxies of each page as soon as it is parsed.
 
-        Args:
-            value (str | list[str]): Data to add.
+        Yields:
+            Addresses: Packed addresses of the proxies of a page.
         """
-        if isinstance(value, str):
-            mo = IP_PORT_PATTERN.search(value)
-            if mo:
-                self._result.add(mo.group())
-        elif isinstance(value, list):
-            for item in value:
-                mo = IP_PORT_PATTERN.search(item)
-                if mo:
-                    self._result.add(mo.group())
-
-    def _run(self) -> None:
-        pages_urls = self.create_pages_urls()
-        for url in pages_urls:
-            resp = self._request(url=url, timeout=5, retry=7, allow_redirects=False)
-            if resp:
-                result = self.parsing(resp)
-                self._add_to_result(result)
+        for _, addresses in self.stream_pages():
+            yield addresses
 
+    def stream_pages(self) -> Iterator[tuple[str, Addresses]]:
+        """Fetching the due pages concurrently and yielding the proxies of each page as soon as it is parsed.
 
-class FreeproxylistProxies(Provider):
-    """Getting a proxy from freeproxylist.ru"""
+        Unchanged pages are skipped, only the new lines of the pages that grow by appending are parsed.
 
-    def create_pages_urls(self) -> list[str]:
-        base_url = "https://freeproxylist.ru/protocol"
-        urls_http = [f"{base_url}/http?page={num}" for num in range(1, 11)]
-        urls_https = [f"{base_url}/https?page={num}" for num in range(1, 11)]
-        return [*urls_http, *urls_https]
+        Yields:
+            tuple[str, Addresses]: Url of a page and the packed addresses of its proxies.
+        """
+        now = time.monotonic()
+        if self._fetched_at is not None and now - self._fetched_at < self.min_refresh_interval:
+            return
+        self._fetched_at = now
+
+        name = self.name
+        urls = self.create_pages_urls()
+        self.fetch_cache.retain(urls)
+        due_urls = self._due_urls(urls, now)
+        if len(due_urls) < len(urls):
+            PROVIDER_PAGES.inc(name, "skipped", amount=len(urls) - len(due_urls))
+        for url, resp in self._fetch_many(
+            due_urls, timeout=5, retry=7, allow_redirects=False, request_class="provider", conditional=True
+        ):
+            if not resp:
+                PROVIDER_PAGES.inc(name, "failed")
+                self._record_fetch(url, 0, now)
+                continue
+            update = self.fetch_cache.update(url, resp)
+            if not update.changed:
+                PROVIDER_PAGES.inc(name, "unchanged")
+                self._record_fetch(url, 0, now)
+                continue
+
+            start_time = time.monotonic()
+            addresses = None
+            if update.appended is not None:
+                addresses = self.parse_appended(update.appended)
+            if addresses is not None:
+                PROVIDER_PAGES.inc(name, "appended")
+            else:
+                PROVIDER_PAGES.inc(name, "changed")
+                if self.parse_executor is None:
+                    addresses = self.parsing(resp)
+                else:
+                    addresses = self.parse_remotely(self.parse_executor, resp)
+            PROVIDER_PARSE_SECONDS.observe(time.monotonic() - start_time, name)
+            PROVIDER_YIELD.inc(name, amount=len(addresses))
+            self._record_fetch(url, len(addresses), now)
+            yield url, addresses
+
+    def parse_remotely(self, executor: Executor, resp: Response) -> Addresses:
+        """Parse the whole page in the executor, e.g. a process pool."""
+        return executor.submit(parse_page, type(self), resp).result()
+
+    def _fetch(self, url: str, conditional: bool = False, **kwargs: Any) -> Response | None:
+        """Request to the page within the limits of its host.
+
+        With `conditional` the validators of the previous fetch of the page are sent.
+        """
+        if conditional:
+            kwargs["headers"] = {**HEADERS, **self.fetch_cache.conditional_headers(url)}
+        with self.host_limiter.limit(url):
+            start_time = time.monotonic()
+            resp = self._request(url=url, **kwargs)
+            PROVIDER_FETCH_SECONDS.observe(time.monotonic() - start_time, self.name)
+            return resp
+
+    def _fetch_many(self, urls: list[str], **kwargs: Any) -> Iterator[tuple[str, Response | None]]:
+        """Request to the pages concurrently.
+
+        Yields:
+            tuple[str, Response | None]: Url and response of a page in the order of completion.
+        """
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(urls), self.max_workers), thread_name_prefix="PAGE") as executor:
+            futures = {executor.submit(self._fetch, url, **kwargs): url for url in urls}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
 
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        root = fromstring(resp.content.decode("utf-8"))
-        row_list = root.xpath("//tbody[@class='table-proxy-list']/tr")
-        for row in row_list:
-            ip = row[0].text
-            port = row[1].text
-            result.append(f"{ip}:{port}")
-        return result
 
+def parse_page(provider_class: type[Provider], resp: Response) -> Addresses:
+    """Parse the page in a process of the parsing pool.
 
-class SslproxiesProxies(Provider):
-    """Getting a proxy from www.sslproxies.org"""
+    The parsing does not use the state of the provider, so a bare instance is enough and the provider with its
+    sessions and locks is not sent to the process.
+    """
+    provider = provider_class.__new__(provider_class)
+    return provider.parsing(resp)
 
-    def create_pages_urls(self) -> list[str]:
-        return ["https://www.sslproxies.org/"]
 
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        root = fromstring(resp.content.decode("utf-8"))
-        row_list = root.xpath("//table[contains(@class,'table')]//tbody/tr")
-        for row in row_list:
-            ip = row[0].text
-            port = row[1].text
-            result.append(f"{ip}:{port}")
-        return result
+class SourceProvider(Provider):
+    """Provider of a declarative source, its pages are parsed by the shared engine `parse_source`.
 
+    source (SourceDefinition): Definition of the source.
+    min_refresh_interval (float): Overrides the interval of the definition.
+    Other keyword arguments are passed on to Provider.
+    """
 
-class FatezeroProxies(Provider):
-    """Getting a proxy from proxylist.fatezero.org"""
+    def __init__(self, source: SourceDefinition, **kwargs: Any) -> None:
+        kwargs.setdefault("min_refresh_interval", source.min_refresh_interval)
+        super().__init__(**kwargs)
+        self.source = source
+
+    @property
+    def name(self) -> str:
+        return self.source.name
 
     def create_pages_urls(self) -> list[str]:
-        return ["http://proxylist.fatezero.org/proxy.list"]
+        if not self.source.index_urls:
+            return expand_urls(self.source, self.source.urls)
 
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        rows = resp.text.split("\n")
-        for row in rows:
-            if row:
-                data = json.loads(row)
-                host = data["host"]
-                port = data["port"]
-                result.append(f"{host}:{port}")
-        return result
+        pages_urls: list[str] = []
+        index_urls = expand_urls(self.source, self.source.index_urls)
+        for index_url, resp in self._fetch_many(index_urls, timeout=5, request_class="provider"):
+            if resp:
+                pages_urls.extend(parse_links(self.source, resp.content, index_url))
+        return pages_urls
 
+    def parsing(self, resp: Response) -> Addresses:
+        return parse_source(self.source, resp.content)
 
-class Api89ipcnProxies(Provider):
-    """Getting a proxy from http://api.89ip.cn/tqdl.html?api=1&num=9999"""
+    def parse_appended(self, content: bytes) -> "Addresses | None":
+        return parse_source(self.source, content) if self.source.appendable else None
 
-    def create_pages_urls(self) -> list[str]:
-        max_num = 9999
-        return [f"http://api.89ip.cn/tqdl.html?api=1&num={max_num}"]
-
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        html = resp.text
-        ip_address = re.compile(r"([\d:\.]*)<br>")
-        hosts_ports = ip_address.findall(html)
-        for addr in hosts_ports:
-            addr_split = addr.split(":")
-            if len(addr_split) == 2:
-                host = addr_split[0]
-                port = addr_split[1]
-                result.append(f"{host}:{port}")
-        return result
-
-
-class XsdailiProxies(Provider):
-    """Getting a proxy from www.xsdaili.cn"""
+    def parse_remotely(self, executor: Executor, resp: Response) -> Addresses:
+        # Only the definition and the content go to the process.
+        return executor.submit(parse_source, self.source, resp.content).result()
 
-    def create_pages_urls(self) -> list[str]:
-        pages_urls: list[str] = []
-        base_url = "https://www.xsdaili.cn"
-        pagi_urls_list = [f"{base_url}/dayProxy/{num}.html" for num in range(1, 3)]
 
-        for pagi_url in pagi_urls_list:
-            resp = self._request(url=pagi_url, timeout=5)
-            if resp:
-                root = fromstring(resp.content.decode("utf-8"))
-                root.make_links_absolute(pagi_url)
-                url_list = root.xpath(
-                    "//div[contains(@class, 'table table-hover panel-default panel ips')]/div[@class='title']/a/@href"
-                )
+class ProviderRegistry:
+    """Providers by name, built from declarative source definitions or registered as custom Provider instances.
 
-                for url in url_list:
-                    pages_urls.append(url)
+    A source is added without code by its definition, e.g. loaded from a json file with `load()`. Every provider
+    keeps the yield and the live ratio of its pages, `stats()` reports them for all the providers.
 
-        return pages_urls
+    Args:
+        providers (Iterable[Provider]): Providers to register. Defaults to none.
+    """
 
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        root = fromstring(resp.content.decode("utf-8"))
-        rows_list = root.xpath("//div[@class='cont']/text()")
-        for row in rows_list:
-            mo = IP_PORT_PATTERN.search(row)
-            if mo:
-                result.append(mo.group())
-        return result
+    def __init__(self, providers: Iterable[Provider] = ()) -> None:
+        self._locker = Lock()
+        self._providers: dict[str, Provider] = {}
+        for provider in providers:
+            self.register(provider)
 
+    def __len__(self) -> int:
+        return len(self._providers)
 
-class GithubAccountProxies(Provider):
-    """Getting a proxy from a github accounts."""
+    def __contains__(self, name: str) -> bool:
+        return name in self._providers
 
-    def create_pages_urls(self) -> list[str]:
-        return [
-            # https://proxylist.to (https://github.com/proxylist-to/proxy-list/blob/main/http.txt)
-            "https://github.com/proxylist-to/proxy-list/blob/main/http.txt"
-            # https://github.com/parserpp/ip_ports
-            "https://raw.githubusercontent.com/parserpp/ip_ports/main/proxyinfo.txt",
-            "https://cdn.jsdelivr.net/gh/parserpp/ip_ports/proxyinfo.txt",
-            "https://fastly.jsdelivr.net/gh/parserpp/ip_ports@main/proxyinfo.txt",
-            "https://github.rc1844.workers.dev/parserpp/ip_ports/raw/main/proxyinfo.txt",
-            # https://github.com/monosans/proxy-list
-            "https://github.com/monosans/proxy-list/blob/main/proxies/http.txt",
-            # https://github.com/manuGMG/proxy-365
-            "https://github.com/manuGMG/proxy-365/blob/main/SOCKS5.txt",
-            # https://github.com/rdavydov/proxy-list
-            "https://github.com/rdavydov/proxy-list/blob/main/proxies/http.txt",
-            # https://github.com/hanwayTech/free-proxy-list
-            "https://github.com/hanwayTech/free-proxy-list/blob/main/http.txt",
-            # https://github.com/mmpx12/proxy-list
-            "https://github.com/mmpx12/proxy-list/blob/master/proxies.txt",
-            # # # https://github.com/yemixzy/proxy-list
-            "https://github.com/yemixzy/proxy-list/blob/main/proxy-list/not_checked.txt",
-            # https://github.com/ReCaree/proxy-scrapper
-            "https://raw.githubusercontent.com/ReCaree/proxy-scrapper/master/proxy/http-removed.txt",
-            # https://github.com/jetkai/proxy-list
-            "https://github.com/jetkai/proxy-list/blob/main/online-proxies/txt/proxies.txt",
-        ]
-
-    def parsing(self, resp: Response) -> list[str]:
-        result: list[str] = []
-        html = resp.content.decode("utf-8")
-        list_of_tuple_host_port = re.findall(IP_PORT_PATTERN, html)
-        for item in list_of_tuple_host_port:
-            result.append(f"{item[0]}:{item[1]}")
-        return result
-
-
-PROVIDERS: list[Provider] = [
-    FreeproxylistProxies(),
-    SslproxiesProxies(),
-    FatezeroProxies(),
-    Api89ipcnProxies(),
-    XsdailiProxies(),
-    GithubAccountProxies(),
-]
+    def get(self, name: str) -> Provider | None:
+        return self._providers.get(name)
+
+    def register(self, provider: Provider) -> Provider:
+        """Add the provider.
+
+        Raises:
+            ValueError: A provider of the same name is already registered.
+        """
+        with self._locker:
+            if provider.name in self._providers:
+                raise ValueError(f"Provider {provider.name} is already registered")
+            self._providers[provider.name] = provider
+        return provider
+
+    def add_source(self, source: SourceDefinition, **kwargs: Any) -> SourceProvider:
+        """Add the provider of the source, the keyword arguments are passed on to SourceProvider."""
+        provider = SourceProvider(source, **kwargs)
+        self.register(provider)
+        return provider
+
+    def load(self, path: str, **kwargs: Any) -> list[SourceProvider]:
+        """Add the providers of the sources defined in the json file, see `load_sources()`."""
+        return [self.add_source(source, **kwargs) for source in load_sources(path)]
+
+    def providers(self) -> list[Provider]:
+        """Get the providers in the order of registration."""
+        with self._locker:
+            return list(self._providers.values())
+
+    def ranked(self) -> list[Provider]:
+        """Get the providers by their expected good proxies of a run, the best first."""
+        return sorted(self.providers(), key=lambda x: x.priority(), reverse=True)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Get the yield of every provider and of its pages, ready for json."""
+        report: dict[str, dict[str, Any]] = {}
+        for provider in self.ranked():
+            priority = provider.priority()
+            report[provider.name] = {
+                "good_per_run": priority if math.isfinite(priority) else None,
+                "live_ratio": provider.live_ratio(),
+                "pages": {stats.url: stats.to_dict() for stats in provider.page_stats()},
+            }
+        return report
+
+
+REGISTRY = ProviderRegistry(SourceProvider(source) for source in SOURCES)
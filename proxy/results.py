@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from enum import Enum
+
+from common.tunnel import ProxyProtocol
+
+from .anonymity import Anonymity
+from .parsing import Proxy
+
+# Result in plain types for the pipes and the connections of the worker processes and nodes:
+# proxy, status, latency, judge, protocol, anonymity.
+ResultRecord = tuple[Proxy, str, float | None, str | None, str | None, str | None]
+
+
+class CheckStatus(str, Enum):
+    """Outcome of the proxy check."""
+
+    GOOD = "good"
+    NO_JUDGE = "no_judge"
+    UNREACHABLE = "unreachable"
+    NO_RESPONSE = "no_response"
+    BAD_STATUS = "bad_status"
+    SECOND_CHECK_FAILED = "second_check_failed"
+    ERROR = "error"
+
+
+# Outcomes that tell that the proxy does not work. NO_JUDGE and ERROR tell nothing about the proxy, they come from
+# an outage of the judges or an exception on this host.
+PROXY_FAILURES = frozenset(
+    {CheckStatus.UNREACHABLE, CheckStatus.NO_RESPONSE, CheckStatus.BAD_STATUS, CheckStatus.SECOND_CHECK_FAILED}
+)
+
+
+@dataclass(slots=True)
+class CheckResult:
+    """Result of the proxy check.
+
+    proxy (Proxy): Packed address of the proxy.
+    status (CheckStatus): Outcome of the check.
+    latency (float | None): Response time of the judge through the proxy in seconds. Defaults to None.
+    judge (str | None): Url of the judge used. Defaults to None.
+    protocol (ProxyProtocol | None): Protocol the proxy has been checked with. Defaults to None.
+    anonymity (Anonymity | None): What the proxy reveals, from the environment echoed by the judge.
+        Defaults to None.
+    """
+
+    proxy: Proxy
+    status: CheckStatus
+    latency: float | None = None
+    judge: str | None = None
+    protocol: ProxyProtocol | None = None
+    anonymity: Anonymity | None = None
+
+    @property
+    def is_good(self) -> bool:
+        return self.status is CheckStatus.GOOD
+
+    @property
+    def is_failure(self) -> bool:
+        """Whether the check has found that the proxy does not work."""
+        return self.status in PROXY_FAILURES
+
+    @property
+    def is_conclusive(self) -> bool:
+        """Whether the check tells if the proxy works, the inconclusive checks are neither cached nor counted."""
+        return self.is_good or self.is_failure
+
+    def __bool__(self) -> bool:
+        return self.is_good
+
+    def to_record(self) -> ResultRecord:
+        return (
+            self.proxy,
+            self.status.value,
+            self.latency,
+            self.judge,
+            self.protocol.value if self.protocol is not None else None,
+            self.anonymity.value if self.anonymity is not None else None,
+        )
+
+    @classmethod
+    def from_record(cls, record: ResultRecord) -> "CheckResult":
+        proxy, status, latency, judge, protocol, anonymity = record
+        return cls(
+            proxy,
+            CheckStatus(status),
+            latency,
+            judge,
+            ProxyProtocol(protocol) if protocol is not None else None,
+            Anonymity(anonymity) if anonymity is not None else None,
+        )
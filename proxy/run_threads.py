@@ -1,20 +1,123 @@
+import json
 import time
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait
 from logging import Logger
-from queue import Queue
-from threading import Lock
+from queue import Empty, Queue, SimpleQueue
+from threading import Condition, Event, Lock
+from typing import Callable, Iterable, TypeVar
 
-from common.logger import get_main_logger
+from common.adaptive import AimdLimiter
+from common.logger import get_main_logger, get_rate_limited_logger
+from common.metrics import METRICS
 
 from .checker import CheckerProxy
+from .dedup import ProxyDeduplicator
+from .metrics import (
+    CANDIDATES,
+    CHECK_UTILIZATION,
+    CHECKS,
+    CHECKS_IN_FLIGHT,
+    DEDUP_IN_FLIGHT,
+    GOOD_CHECKS,
+    JUDGE_SECONDS,
+    POOL_SIZE,
+    PROVIDER_LIVE_RATIO,
+    PROVIDER_RESULTS,
+    QUEUE_DEPTH,
+    SCHEDULED,
+)
+from .parsing import Addresses, Proxy, format_address
+from .pool import ProxyPool
+from .prefilter import TcpPrefilter
 from .providers import Provider
+from .results import CheckResult, CheckStatus
+from .scheduler import RevalidationScheduler
+from .scraping import Scraper
+from .store import ProxyStore
 
 logger: Logger = get_main_logger()
+# Good proxies can be found by thousands per second, most of their lines are dropped and counted.
+proxy_logger: Logger = get_rate_limited_logger("proxies", rate=10, burst=50)
+
+T = TypeVar("T")
+
+
+def take_batch(
+    queue: "Queue[T | None] | SimpleQueue[T | None]", size: int, timeout: float | None = None
+) -> tuple[list[T], bool]:
+    """Wait for an item and take the items that are already in the queue, up to `size`.
+
+    Batches are as small as the load allows: a single item is sent at once, a backlog is sent in big batches.
+
+    Args:
+        queue (Queue[T | None] | SimpleQueue[T | None]): Queue with the sentinel None.
+        size (int): Maximum number of items.
+        timeout (float | None): Maximum wait for the first item in seconds. Defaults to None, no limit.
+
+    Returns:
+        tuple[list[T], bool]: Items, empty after the timeout, and whether the sentinel None has been taken.
+    """
+    try:
+        item = queue.get(timeout=timeout)
+    except Empty:
+        return [], False
+    if item is None:
+        return [], True
+    batch = [item]
+    while len(batch) < size:
+        try:
+            item = queue.get_nowait()
+        except Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def put_many(queue: "Queue[T]", items: Iterable[T]) -> None:
+    """Put the items into an unbounded queue under one acquisition of its lock.
+
+    The consumers waiting for items are woken by one notification instead of one for every item.
+    """
+    with queue.mutex:
+        count = 0
+        for item in items:
+            queue._put(item)
+            count += 1
+        queue.unfinished_tasks += count
+        queue.not_empty.notify(count)
+
+
+def drain(queue: "Queue[T]") -> None:
+    """Drop all the items of the queue under one acquisition of its lock."""
+    with queue.mutex:
+        queue.unfinished_tasks -= len(queue.queue)
+        queue.queue.clear()
+        if not queue.unfinished_tasks:
+            queue.all_tasks_done.notify_all()
 
 
 class RunThreads:
     """
     This class implements an infinite run threads.
+
+    Threads form a pipeline: provider fetch -> dedup -> TCP prefilter -> check -> publish. Stages block on queues
+    and conditions, so idle threads do not use the CPU and every stage starts as soon as its input arrives.
+    `None` in a queue is the sentinel that stops the thread reading it.
+
+    The check workers hand their results to one publisher thread through a SimpleQueue, whose `put` takes no lock.
+    The publisher takes the results in batches of up to `publish_batch_size`, as small as the load allows, and
+    publishes every batch with one swap of the pool snapshot and one pass under the lock of the generation, so
+    hundreds of workers do not queue up on the locks of the pool, the scheduler, the store and the generation.
+    Proxies that have been good are rechecked by the scheduler on their own schedule, apart from the generations
+    of the providers.
+
+    The custom workers take proxies from the pool for `custom_work`. With a `scraper` they scrape the jobs of
+    its frontier instead.
+
+    The stages record their metrics in the METRICS registry. Every `report_interval` seconds a short report is
+    logged and, with `metrics_snapshot_path`, a JSON snapshot of all the metrics is appended to that file.
     """
 
     def __init__(
@@ -23,114 +126,370 @@ class RunThreads:
         max_custom_worker: int,
         providers_list: list[Provider],
         checker_proxy: CheckerProxy,
+        max_workers_providers: int = 4,
+        min_generation_interval: float = 1,
+        deduplicator: ProxyDeduplicator | None = None,
+        store: ProxyStore | None = None,
+        pool: ProxyPool | None = None,
+        prefilter: TcpPrefilter | None = None,
+        concurrency: AimdLimiter | None = None,
+        scheduler: RevalidationScheduler | None = None,
+        report_interval: float = 10,
+        metrics_snapshot_path: str | None = None,
+        scraper: Scraper | None = None,
+        publish_batch_size: int = 256,
     ) -> None:
-        self._running: bool = True
+        self._stop_event = Event()
         self._locker = Lock()
+        # Notified when the state of the current generation of proxies changes.
+        self._generation_changed = Condition(self._locker)
+        self._generation_done = Event()
+        self._checked_proxies_ready = Event()
 
-        self._unchecked_proxies_list: list[str] = []
-        self._checked_proxies_temp: list[str] = []
-        self._checked_proxies_list: list[str] = []
-        self._unchecked_proxies_queue: Queue[str] = Queue()
-        self._providers_queue: Queue[Provider] = Queue()
+        # Proxies rechecked by the scheduler, their results do not count in the generation.
+        self._revalidating: set[Proxy] = set()
+        # Provider and page url of every candidate in flight, for its yield and the store.
+        self._proxy_sources: dict[Proxy, tuple[Provider, str]] = {}
+        self._candidates_queue: Queue[Proxy | None] = Queue()
+        self._unchecked_proxies_queue: Queue[Proxy | None] = Queue()
+        self._providers_queue: Queue[Provider | None] = Queue()
+        self._results_queue: SimpleQueue[CheckResult | None] = SimpleQueue()
+        # -1 means that no generation is in progress.
+        self._count_of_pending_providers = -1
         self._count_of_completed_proxy_checks = 0
+        # Totals over all generations, written by the publisher alone.
+        self.count_of_checks = 0
+        self.count_of_good_checks = 0
 
         self.max_workers_proxies: int = max_workers_proxies
         self.max_custom_worker: int = max_custom_worker
+        self.max_workers_providers: int = max_workers_providers
+        self.min_generation_interval = min_generation_interval
         self.providers_list = providers_list
         self.checker_proxy = checker_proxy
+        self.deduplicator = deduplicator if deduplicator is not None else ProxyDeduplicator()
+        self.store = store
+        self.pool = pool if pool is not None else ProxyPool()
+        self.prefilter = prefilter or TcpPrefilter()
+        # The number of threads is the ceiling, the limiter adapts the number of checks actually running.
+        self.concurrency = concurrency or AimdLimiter(max_limit=max_workers_proxies)
+        self.scheduler = scheduler if scheduler is not None else RevalidationScheduler()
+        self.report_interval = report_interval
+        self.metrics_snapshot_path = metrics_snapshot_path
+        self.scraper = scraper
+        self.publish_batch_size = publish_batch_size
+        self._reported_at = time.monotonic()
+        self._reported_checks = 0
+
+    @property
+    def _running(self) -> bool:
+        return not self._stop_event.is_set()
 
     def terminate(self) -> None:
-        """Terminate cycles in threads."""
-        self._running = False
+        """Terminate cycles in threads.
+
+        The queued providers, candidates and proxies are dropped, only the checks in flight are completed.
+        """
+        self._stop_event.set()
+        drain(self._providers_queue)
+        drain(self._candidates_queue)
+        drain(self._unchecked_proxies_queue)
+        for _ in range(self.max_workers_providers):
+            self._providers_queue.put(None)
+        self._candidates_queue.put(None)
+        put_many(self._unchecked_proxies_queue, [None] * len(self.check_workers()))
+        self._results_queue.put(None)
+        with self._generation_changed:
+            self._generation_changed.notify_all()
+        self._generation_done.set()
+        self._checked_proxies_ready.set()
+        self.scheduler.wake()
+
+    def register_metrics(self) -> None:
+        """Read the gauges of the state of the stages from this scraper."""
+        QUEUE_DEPTH.set_function(
+            lambda: {
+                ("providers",): self._providers_queue.qsize(),
+                ("candidates",): self._candidates_queue.qsize(),
+                ("unchecked",): self._unchecked_proxies_queue.qsize(),
+                ("results",): self._results_queue.qsize(),
+                **({("frontier",): len(self.scraper.frontier)} if self.scraper is not None else {}),
+            }
+        )
+        POOL_SIZE.set_function(lambda: len(self.pool))
+        CHECKS_IN_FLIGHT.set_function(lambda: self.concurrency.in_flight)
+        CHECK_UTILIZATION.set_function(lambda: self.concurrency.in_flight / self.concurrency.max_limit)
+        DEDUP_IN_FLIGHT.set_function(lambda: len(self.deduplicator))
+        SCHEDULED.set_function(lambda: len(self.scheduler))
+        PROVIDER_LIVE_RATIO.set_function(
+            lambda: {
+                (provider.name,): ratio
+                for provider in self.providers_list
+                if (ratio := provider.live_ratio()) is not None
+            }
+        )
 
     def report(self) -> None:
-        """Report of the number of proxies processed."""
+        """Log a short report and append the snapshot of the metrics to `metrics_snapshot_path`."""
+        if self.metrics_snapshot_path is not None:
+            with open(self.metrics_snapshot_path, "a") as file:
+                file.write(json.dumps(METRICS.snapshot()) + "\n")
+
+        now = time.monotonic()
+        checks = self.count_of_checks
+        rate = (checks - self._reported_checks) / max(now - self._reported_at, 1e-9)
+        self._reported_at, self._reported_checks = now, checks
         logger.info(
-            f"""
-            Unchecked proxies list: {len(self._unchecked_proxies_list)}
-            Checked proxies list: {len(self._checked_proxies_list)}
-            _count_of_completed_proxy_checks: {self._count_of_completed_proxy_checks}
-            _unchecked_proxies_queue: {self._unchecked_proxies_queue.qsize()}
-            _checked_proxies_temp: {len(self._checked_proxies_temp)}
-            _providers_queue: {self._providers_queue.qsize()}
-            """
+            f"Checks good/total: {self.count_of_good_checks}/{checks} ({rate:.1f}/sec), pool: {len(self.pool)}, "
+            f"candidates: {self._candidates_queue.qsize()}, unchecked: {self._unchecked_proxies_queue.qsize()}, "
+            f"in flight: {CHECKS_IN_FLIGHT.value() or 0:.0f}, scheduled: {len(self.scheduler)}"
         )
 
-    def getting_reports(self, time_sleep: int = 0) -> None:
+    def getting_reports(self, time_sleep: float = 0) -> None:
         """Getting reports inside the threads."""
         while self._running:
+            self._stop_event.wait(time_sleep)
             self.report()
-            time.sleep(time_sleep)
 
     def create_providers_queue(self) -> None:
-        """Create a queue of proxy providers."""
+        """Create a queue of proxy providers, once for each generation of proxies.
+
+        The providers that have paid off most recently are fetched first.
+        """
         while self._running:
-            if len(self._unchecked_proxies_list) == 0 and self._unchecked_proxies_queue.qsize() == 0:
-                for provider in self.providers_list:
-                    self._providers_queue.put(provider)
-            time.sleep(1)
+            with self._locker:
+                self._count_of_pending_providers = len(self.providers_list)
+                self._generation_done.clear()
+            for provider in sorted(self.providers_list, key=lambda x: x.priority(), reverse=True):
+                self._providers_queue.put(provider)
+
+            self._generation_done.wait()
+            self._stop_event.wait(self.min_generation_interval)
 
     def get_unchecked_proxies(self) -> None:
         """Getting unchecked proxies."""
-        while self._running:
-            if self._providers_queue.qsize() == 0:
-                time.sleep(1.2)
-            else:
-                provider = self._providers_queue.get()
-                proxy_list: list[str] = provider()
-                with self._locker:
-                    self._unchecked_proxies_list.extend(proxy_list)
-                    for proxy in proxy_list:
-                        self._unchecked_proxies_queue.put(proxy)
+        while True:
+            provider = self._providers_queue.get()
+            if provider is None:
+                break
+
+            for url, page_proxy_list in provider.stream_pages():
+                accepted = self.dedup_proxies(page_proxy_list)
+                CANDIDATES.inc("accepted", amount=len(accepted))
+                CANDIDATES.inc("dropped", amount=len(page_proxy_list) - len(accepted))
+                provider.record_accepted(url, len(accepted))
+                self._proxy_sources.update(dict.fromkeys(accepted, (provider, url)))
+                put_many(self._candidates_queue, accepted)
+
+            with self._generation_changed:
+                self._count_of_pending_providers -= 1
+                self._generation_changed.notify_all()
+
+    def dedup_proxies(self, proxy_list: Addresses) -> Addresses:
+        """Drop the proxies that are already in flight or have failed recently.
+
+        Returns:
+            Addresses: Proxies to check.
+        """
+        return self.deduplicator.accept(proxy_list)
+
+    def prefilter_proxies(self) -> None:
+        """Passing on to the checks only the candidates that accept TCP connections."""
+        self.prefilter.run(
+            self._candidates_queue, self._on_prefilter_result, self._stop_event, self._on_prefilter_error
+        )
+
+    def _on_prefilter_result(self, proxy: Proxy, connect_time: float | None) -> None:
+        if connect_time is None:
+            self.add_checked_proxy(CheckResult(proxy, CheckStatus.UNREACHABLE))
+        else:
+            self._unchecked_proxies_queue.put(proxy)
+
+    def _on_prefilter_error(self, proxy: Proxy) -> None:
+        # The connect has failed on this host, the proxy is neither cached as failed nor demoted.
+        self.add_checked_proxy(CheckResult(proxy, CheckStatus.ERROR))
+
+    def _is_generation_checked(self) -> bool:
+        return self._count_of_pending_providers == 0 and self._count_of_completed_proxy_checks == len(
+            self.deduplicator
+        )
 
     def watcher_of_proxies_check(self) -> None:
-        """Watcher of proxies check threads."""
+        """Watcher of proxies check threads, starts the next generation when the current one is checked."""
+        while True:
+            with self._generation_changed:
+                self._generation_changed.wait_for(lambda: not self._running or self._is_generation_checked())
+                if not self._running:
+                    break
+
+                self.deduplicator.new_generation()
+                self._count_of_completed_proxy_checks = 0
+                self._count_of_pending_providers = -1
+
+            self._generation_done.set()
+
+    def revalidate_proxies(self) -> None:
+        """Passing the proxies due for a recheck on to the checks."""
         while self._running:
-            if (
-                self._count_of_completed_proxy_checks == len(self._unchecked_proxies_list)
-                and self._count_of_completed_proxy_checks != 0
-            ):
-                with self._locker:
-                    self._checked_proxies_list = [*self._checked_proxies_temp]
-                    self._checked_proxies_temp.clear()
-                    self._unchecked_proxies_list.clear()
-                    self._count_of_completed_proxy_checks = 0
+            due = self.scheduler.pop_due()
+            with self._locker:
+                # A proxy being checked as a candidate is scheduled again by its result.
+                due = [proxy for proxy in due if proxy not in self.deduplicator and proxy not in self._revalidating]
+                self._revalidating.update(due)
+            put_many(self._candidates_queue, due)
 
     def get_checked_proxies(self) -> None:
         """Getting checked proxies."""
-        while self._running:
-            if self._unchecked_proxies_queue.qsize() == 0:
-                time.sleep(1)
+        while True:
+            proxy = self._unchecked_proxies_queue.get()
+            # A proxy put by the prefilter after the queue has been drained is not checked either.
+            if proxy is None or not self._running:
+                break
+            with self.concurrency.slot():
+                result = self.checker_proxy(proxy)
+            self.add_checked_proxy(result)
+
+    def add_checked_proxy(self, result: CheckResult) -> None:
+        """Handing the result of the proxy check to the publisher, takes no lock."""
+        self._results_queue.put(result)
+
+    def publish_results(self) -> None:
+        """Publishing the results of the checks in batches until the sentinel None."""
+        stopped = False
+        while not stopped:
+            results, stopped = take_batch(self._results_queue, self.publish_batch_size)
+            if results:
+                self.publish(results)
+
+    def publish(self, results: list[CheckResult]) -> None:
+        """Publishing a batch of results of the proxy checks."""
+        count_of_checked = count_of_good = 0
+        for result in results:
+            CHECKS.inc(result.status.value)
+            if result.latency is not None and result.judge is not None:
+                JUDGE_SECONDS.observe(result.latency, result.judge, "proxy")
+            self.scheduler.schedule(result)
+            # The rechecks of the scheduler have no source.
+            source = self._proxy_sources.pop(result.proxy, None)
+            if not result.is_conclusive:
+                # An outage of the judges or an error on this host tells nothing about the proxy, it is neither
+                # cached as failed nor counted, and the next generation or recheck checks it again.
+                continue
+
+            if result.status is not CheckStatus.UNREACHABLE:
+                count_of_checked += 1
+            if result.is_good:
+                count_of_good += 1
+                GOOD_CHECKS.inc(
+                    result.protocol.value if result.protocol else "unknown",
+                    result.anonymity.value if result.anonymity else "unknown",
+                )
+                proxy_logger.info("GOOD PROXY: %s", format_address(result.proxy))
             else:
-                proxy: str = self._unchecked_proxies_queue.get()
-                is_good_proxy = self.checker_proxy(proxy)
-                with self._locker:
-                    if is_good_proxy:
-                        logger.info(f"GOOD PROXY: {proxy}")
-                        self._checked_proxies_temp.append(proxy)
+                self.deduplicator.add_failed(result.proxy)
+            if source is not None:
+                provider, url = source
+                provider.record_result(url, result.is_good)
+                PROVIDER_RESULTS.inc(provider.name, "good" if result.is_good else "bad")
+            if self.store is not None:
+                self.store.record(
+                    result.proxy,
+                    result.is_good,
+                    result.latency,
+                    source[0].name if source is not None else None,
+                    result.protocol,
+                    result.anonymity,
+                    # Most candidates never accept a connection, only the known proxies are worth the update.
+                    known_only=result.status is CheckStatus.UNREACHABLE,
+                )
+        self.pool.publish(results)
+        if count_of_good:
+            self._checked_proxies_ready.set()
+        if count_of_checked:
+            # The results of the prefilter are not checks under the limit.
+            self.concurrency.record_many(count_of_checked, count_of_good)
+
+        with self._generation_changed:
+            self.count_of_good_checks += count_of_good
+            self.count_of_checks += len(results)
+            for result in results:
+                if result.proxy in self._revalidating:
+                    self._revalidating.discard(result.proxy)
+                else:
                     self._count_of_completed_proxy_checks += 1
+            if self._is_generation_checked():
+                self._generation_changed.notify_all()
+
+    def check_workers(self) -> list[Callable[[], None]]:
+        """Get the functions of the proxy checking stage, one for each thread."""
+        return [self.get_checked_proxies for _ in range(self.max_workers_proxies)]
 
     def custom_worker(self) -> None:
+        self._checked_proxies_ready.wait()
+        if self.scraper is not None:
+            self.scraper.work(self.pool, self._stop_event)
+            return
+
         while self._running:
-            if len(self._checked_proxies_list) == 0:
-                time.sleep(1)
-            else:
-                # Custom Code
-                pass
+            proxy = self.pool.acquire()
+            if proxy is None:
+                self._stop_event.wait(1)
+                continue
+
+            success = False
+            start_time = time.monotonic()
+            try:
+                success = self.custom_work(format_address(proxy))
+            finally:
+                self.pool.release(proxy, success, time.monotonic() - start_time)
+
+    def custom_work(self, proxy: str) -> bool:
+        """Work of the custom worker with the proxy taken from the pool.
+
+        Args:
+            proxy (str): Proxy as `ip:port`.
+
+        Returns:
+            bool: Whether the requests through the proxy have succeeded, failed proxies are demoted in the pool.
+        """
+        # Custom Code
+        self._stop_event.wait(1)
+        return True
+
+    def warm_start(self) -> None:
+        """Serve the proxies that were good before the restart and revalidate them first."""
+        if self.store is None:
+            return
+
+        results = self.store.load_good()
+        if not results:
+            return
+
+        logger.info(f"Warm start with {len(results)} proxies from {self.store.path}")
+        for result in results:
+            self.pool.add(result)
+            self.scheduler.add(result.proxy)
+        self._checked_proxies_ready.set()
 
     def run(self) -> None:
         """Running threads."""
-        count_workers = 7 + self.max_workers_proxies + self.max_custom_worker
+        self.register_metrics()
+        self.warm_start()
+        check_workers = self.check_workers()
+        count_workers = 6 + self.max_workers_providers + len(check_workers) + self.max_custom_worker
         futures_list = []
 
         try:
             with ThreadPoolExecutor(max_workers=count_workers, thread_name_prefix="TH") as executor:
                 futures_list = [
                     executor.submit(self.create_providers_queue),
-                    *[executor.submit(self.get_unchecked_proxies) for _ in range(4)],
+                    *[executor.submit(self.get_unchecked_proxies) for _ in range(self.max_workers_providers)],
+                    executor.submit(self.prefilter_proxies),
                     executor.submit(self.watcher_of_proxies_check),
-                    executor.submit(self.getting_reports, 1),
-                    *[executor.submit(self.get_checked_proxies) for _ in range(self.max_workers_proxies)],
+                    executor.submit(self.revalidate_proxies),
+                    executor.submit(self.getting_reports, self.report_interval),
+                    executor.submit(self.publish_results),
+                    *[executor.submit(worker) for worker in check_workers],
                     *[executor.submit(self.custom_worker) for _ in range(self.max_custom_worker)],
                 ]
 
@@ -139,12 +498,19 @@ class RunThreads:
 
         finally:
             while True:
-                lst = [future.done() for future in futures_list]
-                if not all(lst):
-                    time.sleep(1)
-                    logger.info(f"Stop {len(list(filter(lambda x: x is False, lst)))} threads. Wait ...")
+                _, not_done = wait(futures_list, timeout=1)
+                if not_done:
+                    logger.info(f"Stop {len(not_done)} threads. Wait ...")
                 else:
                     logger.info("Finish")
                     break
 
+            # Results of the checks that have finished after the publisher has stopped.
+            results, _ = take_batch(self._results_queue, max(1, self._results_queue.qsize()), timeout=0)
+            if results:
+                self.publish(results)
+            if self.store is not None:
+                self.store.close()
+            if self.scraper is not None:
+                self.scraper.close()
             self.report()
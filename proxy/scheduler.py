@@ -0,0 +1,138 @@
+import heapq
+import time
+from threading import Condition
+
+from .parsing import Proxy
+from .results import CheckResult
+
+
+class ScheduleEntry:
+    """Revalidation state of a proxy."""
+
+    __slots__ = ("due", "failures")
+
+    def __init__(self) -> None:
+        # None while the proxy is being checked.
+        self.due: float | None = None
+        self.failures = 0
+
+
+class RevalidationScheduler:
+    """Schedule of the rechecks of the proxies that have been good, a heap keyed by the next due time.
+
+    A good proxy is rechecked every `good_interval` seconds. A failing one is rechecked with an exponential
+    backoff from `min_backoff` to `max_backoff` and is forgotten after `max_failures` failures in a row.
+    A check that tells nothing about the proxy, e.g. without an alive judge, is retried after `min_backoff`
+    and is not a failure.
+    Proxies that have never been good are not scheduled, the providers bring them back.
+
+    Args:
+        good_interval (float): Time in seconds between the rechecks of a good proxy. Defaults to 120.
+        min_backoff (float): Time in seconds before the first recheck of a failed proxy. Defaults to 60.
+        max_backoff (float): Upper bound of the backoff in seconds. Defaults to 1800.
+        backoff_factor (float): Growth of the backoff after every failure. Defaults to 2.
+        max_failures (int): Consecutive failures after which the proxy is forgotten. Defaults to 6.
+    """
+
+    def __init__(
+        self,
+        good_interval: float = 120,
+        min_backoff: float = 60,
+        max_backoff: float = 1800,
+        backoff_factor: float = 2,
+        max_failures: int = 6,
+    ) -> None:
+        self._condition = Condition()
+        # Entries are not removed from the heap, an item whose time differs from the entry is stale.
+        self._heap: list[tuple[float, Proxy]] = []
+        self._entries: dict[Proxy, ScheduleEntry] = {}
+        self._woken = False
+
+        self.good_interval = good_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff_factor = backoff_factor
+        self.max_failures = max_failures
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return proxy in self._entries
+
+    def add(self, proxy: Proxy, due: float | None = None) -> None:
+        """Schedule the recheck of a proxy known to be good, e.g. from the store.
+
+        Args:
+            proxy (Proxy): Packed address of the proxy.
+            due (float | None): Monotonic time of the recheck. Defaults to now.
+        """
+        with self._condition:
+            entry = self._entries.setdefault(proxy, ScheduleEntry())
+            self._push(proxy, entry, time.monotonic() if due is None else due)
+
+    def schedule(self, result: CheckResult) -> None:
+        """Schedule the next recheck after the result of a check."""
+        with self._condition:
+            entry = self._entries.get(result.proxy)
+            if result.is_good:
+                if entry is None:
+                    entry = self._entries[result.proxy] = ScheduleEntry()
+                entry.failures = 0
+                self._push(result.proxy, entry, time.monotonic() + self.good_interval)
+            elif entry is not None and not result.is_failure:
+                # The check has told nothing about the proxy, e.g. the judges are down, it is no failure.
+                self._push(result.proxy, entry, time.monotonic() + self.min_backoff)
+            elif entry is not None:
+                entry.failures += 1
+                if entry.failures >= self.max_failures:
+                    del self._entries[result.proxy]
+                    return
+                backoff = min(self.max_backoff, self.min_backoff * self.backoff_factor ** (entry.failures - 1))
+                self._push(result.proxy, entry, time.monotonic() + backoff)
+
+    def pop_due(self, timeout: float | None = None) -> list[Proxy]:
+        """Wait for the proxies that are due for a recheck.
+
+        Args:
+            timeout (float | None): Maximum wait in seconds. Defaults to None, until a proxy is due or `wake()`.
+
+        Returns:
+            list[Proxy]: Due proxies, they are not scheduled again until their results are passed to `schedule()`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due: list[Proxy] = []
+                while self._heap and self._heap[0][0] <= now:
+                    due_time, proxy = heapq.heappop(self._heap)
+                    entry = self._entries.get(proxy)
+                    if entry is not None and entry.due == due_time:
+                        entry.due = None
+                        due.append(proxy)
+                if due or self._woken:
+                    self._woken = False
+                    return due
+
+                wait_time = self._heap[0][0] - now if self._heap else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return due
+                    wait_time = deadline - now if wait_time is None else min(wait_time, deadline - now)
+                self._condition.wait(wait_time)
+
+    def wake(self) -> None:
+        """Return from `pop_due()` at once, e.g. to stop."""
+        with self._condition:
+            self._woken = True
+            self._condition.notify_all()
+
+    def _push(self, proxy: Proxy, entry: ScheduleEntry, due: float) -> None:
+        entry.due = due
+        heapq.heappush(self._heap, (due, proxy))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(item.due, key) for key, item in self._entries.items() if item.due is not None]
+            heapq.heapify(self._heap)
+        if self._heap[0][1] == proxy:
+            self._condition.notify_all()
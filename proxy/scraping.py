@@ -0,0 +1,411 @@
+import heapq
+import json
+import time
+from collections import deque
+from collections.abc import Callable, Collection
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from threading import Condition, Event, Lock
+from typing import Any
+from urllib.parse import urlsplit
+
+from requests.models import Response
+
+from common.adaptive import LatencyHistogram
+from common.smart_request import HEADERS, SmartRequest
+from common.tunnel import ProxyProtocol
+
+from .anonymity import Anonymity
+from .metrics import SCRAPE_ATTEMPTS, SCRAPE_HEDGES, SCRAPE_JOBS, SCRAPE_SECONDS
+from .parsing import Proxy, format_address
+from .pool import ProxyPool
+
+
+@dataclass(slots=True)
+class ScrapeJob:
+    """Url to scrape.
+
+    url (str): Url of the request.
+    method (str): Method of the request. Defaults to "GET".
+    headers (dict[str, Any] | None): Headers of the request. Defaults to HEADERS.
+    data (dict[str, Any] | None): Body of the request. Defaults to None.
+    timeout (float): Upper bound of the timeout of one request in seconds. Defaults to 10.
+    meta (Any): Data of the caller passed through to the result. Defaults to None.
+    """
+
+    url: str
+    method: str = "GET"
+    headers: dict[str, Any] | None = field(default_factory=lambda: dict(HEADERS))
+    data: dict[str, Any] | None = None
+    timeout: float = 10
+    meta: Any = None
+
+    @property
+    def domain(self) -> str:
+        return urlsplit(self.url).netloc
+
+
+@dataclass(slots=True)
+class ScrapeResult:
+    """Result of the scrape job.
+
+    job (ScrapeJob): The job.
+    response (Response | None): Accepted response, or the last response if none was accepted. Defaults to None.
+    proxy (Proxy | None): Packed address of the proxy of the response. Defaults to None.
+    latency (float): Time from the start of the job to the result in seconds. Defaults to 0.
+    attempts (int): Number of requests sent, the hedged ones included. Defaults to 0.
+    hedged (bool): Whether a backup request was sent. Defaults to False.
+    success (bool): Whether the response has been accepted. Defaults to False.
+    """
+
+    job: ScrapeJob
+    response: Response | None = None
+    proxy: Proxy | None = None
+    latency: float = 0
+    attempts: int = 0
+    hedged: bool = False
+    success: bool = False
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+@dataclass(slots=True)
+class Attempt:
+    """One request of the scrape job through one proxy."""
+
+    proxy: Proxy
+    response: Response | None
+    latency: float
+    success: bool
+
+
+class DomainState:
+    """Politeness state of a domain of the frontier."""
+
+    __slots__ = ("jobs", "in_flight", "next_at", "scheduled")
+
+    def __init__(self) -> None:
+        self.jobs: deque[ScrapeJob] = deque()
+        self.in_flight = 0
+        # Time before which no request to the domain is started.
+        self.next_at = 0.0
+        # Whether the domain is in the heap of the frontier.
+        self.scheduled = False
+
+
+class Frontier:
+    """Thread-safe queue of the urls to scrape with per-domain politeness.
+
+    Requests to one domain start at least `delay` seconds apart and at most `max_per_domain` of its jobs are in
+    flight. Domains waiting for their turn do not hold up the others: `get()` returns the job of the domain that
+    is ready first. A job holds its slot until `done()`, its retries and hedged requests are sent within it.
+
+    Args:
+        delay (float): Minimum interval between the starts of the jobs of a domain in seconds. Defaults to 1.
+        max_per_domain (int): Maximum number of jobs of a domain in flight. Defaults to 2.
+        unique (bool): Ignore the urls that have already been added. Defaults to True.
+    """
+
+    def __init__(self, delay: float = 1, max_per_domain: int = 2, unique: bool = True) -> None:
+        self._condition = Condition()
+        self._domains: dict[str, DomainState] = {}
+        # Heap of the domains that have jobs and a free slot, by the time of their next start.
+        self._ready: list[tuple[float, str]] = []
+        self._seen: set[str] = set()
+        self._count = 0
+
+        self.delay = delay
+        self.max_per_domain = max_per_domain
+        self.unique = unique
+
+    def __len__(self) -> int:
+        return self._count
+
+    def put(self, job: ScrapeJob) -> bool:
+        """Add the job, returns False if its url has already been added."""
+        with self._condition:
+            if self.unique:
+                if job.url in self._seen:
+                    return False
+                self._seen.add(job.url)
+            domain = job.domain
+            state = self._domains.get(domain)
+            if state is None:
+                state = self._domains[domain] = DomainState()
+            state.jobs.append(job)
+            self._count += 1
+            self._schedule(domain, state)
+            self._condition.notify()
+        return True
+
+    def get(self, timeout: float | None = None) -> ScrapeJob | None:
+        """Take the next job whose domain is ready, wait for one up to `timeout` seconds.
+
+        Returns:
+            ScrapeJob | None: The job or None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._ready and self._ready[0][0] <= now:
+                    _, domain = heapq.heappop(self._ready)
+                    state = self._domains[domain]
+                    state.scheduled = False
+                    job = state.jobs.popleft()
+                    self._count -= 1
+                    state.in_flight += 1
+                    state.next_at = now + self.delay
+                    self._schedule(domain, state)
+                    return job
+
+                wait_time = self._ready[0][0] - now if self._ready else None
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    wait_time = deadline - now if wait_time is None else min(wait_time, deadline - now)
+                self._condition.wait(wait_time)
+
+    def done(self, job: ScrapeJob) -> None:
+        """Free the slot of the domain taken by the job."""
+        with self._condition:
+            domain = job.domain
+            state = self._domains[domain]
+            state.in_flight -= 1
+            if not state.jobs and not state.in_flight and state.next_at <= time.monotonic():
+                del self._domains[domain]
+                return
+            if self._schedule(domain, state):
+                self._condition.notify()
+
+    def _schedule(self, domain: str, state: DomainState) -> bool:
+        if state.scheduled or not state.jobs or state.in_flight >= self.max_per_domain:
+            return False
+        state.scheduled = True
+        heapq.heappush(self._ready, (state.next_at, domain))
+        return True
+
+
+def accept_ok(response: Response | None) -> bool:
+    """Accept the responses with a status below 400."""
+    return response is not None and response.ok
+
+
+class JsonLinesSink:
+    """Sink that appends the results as JSON lines to a file.
+
+    Args:
+        path (str): Path of the file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._locker = Lock()
+        self.path = path
+        self._file = open(path, "a")
+
+    def __call__(self, result: ScrapeResult) -> None:
+        response = result.response
+        line = json.dumps(
+            {
+                "url": result.job.url,
+                "success": result.success,
+                "status": response.status_code if response is not None else None,
+                "proxy": format_address(result.proxy) if result.proxy is not None else None,
+                "latency": result.latency,
+                "attempts": result.attempts,
+                "hedged": result.hedged,
+                "body": response.text if response is not None else None,
+            }
+        )
+        with self._locker:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._locker:
+            self._file.close()
+
+
+class Scraper:
+    """Scraping of the jobs of a frontier through the proxies of the pool.
+
+    Every job gets a proxy from the pool. A failed request is retried on another proxy, up to `max_attempts`
+    requests per job. When a request has not answered within the `hedge_percentile` of the recent response times,
+    a backup request is sent through a second proxy and the first accepted response wins, so a proxy that hangs
+    costs a percentile of the latency instead of the whole timeout. The request left behind runs to its end and
+    reports its outcome to the pool.
+
+    With a cache in the request layer, a job whose response is fresh in the cache takes no proxy.
+
+    Only proxies of `protocols` are taken and every request goes through the protocol detected by the check.
+    SOCKS proxies need the `requests[socks]` extra, so they are left out by default.
+
+    Results go to `sink`, which can put new jobs into the frontier to crawl further.
+
+    Args:
+        frontier (Frontier): Jobs to scrape.
+        sink (Callable[[ScrapeResult], None]): Receives the result of every job, successful or not.
+        request (SmartRequest | None): Sender of the requests. Defaults to SmartRequest().
+        accept (Callable[[Response | None], bool]): Whether the response is a success. Defaults to accept_ok.
+        max_attempts (int): Maximum number of requests per job, the hedged ones included. Defaults to 3.
+        hedge (bool): Send backup requests. Defaults to True.
+        hedge_percentile (float): Percentile of the response times after which the backup request is sent.
+            Defaults to 95.
+        min_hedge_delay (float): Lower bound of the delay of the backup request in seconds. Defaults to 0.05.
+        min_samples (int): Number of accepted responses before the requests are hedged. Defaults to 20.
+        max_requests (int): Maximum number of requests in flight. Defaults to 256.
+        protocols (Collection[ProxyProtocol]): Protocols of the proxies to take. Defaults to HTTP and HTTPS.
+        min_anonymity (Anonymity | None): Take only proxies at least this anonymous. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        frontier: Frontier,
+        sink: Callable[[ScrapeResult], None],
+        request: SmartRequest | None = None,
+        accept: Callable[[Response | None], bool] = accept_ok,
+        max_attempts: int = 3,
+        hedge: bool = True,
+        hedge_percentile: float = 95,
+        min_hedge_delay: float = 0.05,
+        min_samples: int = 20,
+        max_requests: int = 256,
+        protocols: Collection[ProxyProtocol] = (ProxyProtocol.HTTP, ProxyProtocol.HTTPS),
+        min_anonymity: Anonymity | None = None,
+    ) -> None:
+        self.frontier = frontier
+        self.sink = sink
+        self.request = request or SmartRequest()
+        self.accept = accept
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.protocols = protocols
+        self.min_anonymity = min_anonymity
+        self.latencies = LatencyHistogram()
+        self._executor = ThreadPoolExecutor(max_workers=max_requests, thread_name_prefix="SCRAPE")
+
+    def work(self, pool: ProxyPool, stop_event: Event) -> None:
+        """Scrape the jobs of the frontier until the stop event, the loop of one worker thread."""
+        while not stop_event.is_set():
+            job = self.frontier.get(timeout=1)
+            if job is None:
+                continue
+            try:
+                result = self.scrape(job, pool)
+            finally:
+                self.frontier.done(job)
+            self.sink(result)
+
+    def scrape(self, job: ScrapeJob, pool: ProxyPool) -> ScrapeResult:
+        """Scrape the job with retries on other proxies and a hedged request."""
+        start_time = time.monotonic()
+        result = ScrapeResult(job)
+        # The first request joins a fetch of the url in flight, the cache of the request layer is checked first.
+        join_in_flight = True
+        cache = self.request.cache
+        if cache is not None and job.data is None:
+            response = cache.get(job.method, job.url)
+            if response is not None and self.accept(response):
+                result.response, result.success = response, True
+                result.latency = time.monotonic() - start_time
+                SCRAPE_JOBS.inc("cached")
+                SCRAPE_SECONDS.observe(result.latency)
+                return result
+            join_in_flight = response is None
+
+        tried: set[Proxy] = set()
+        pending: set[Future[Attempt]] = set()
+        hedge_proxy: Proxy | None = None
+        can_hedge = self.hedge
+        while not result.success:
+            if not pending and (
+                result.attempts >= self.max_attempts or not self._start(job, pool, tried, pending, join_in_flight)
+            ):
+                break
+            result.attempts = len(tried)
+
+            hedge_delay = None
+            if can_hedge and result.attempts < self.max_attempts:
+                hedge_delay = self.hedge_delay()
+            done, pending = wait(pending, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # Only one backup request per job, the pool may have no other proxy for it.
+                can_hedge = False
+                hedge_proxy = self._start(job, pool, tried, pending, False)
+                if hedge_proxy is not None:
+                    result.hedged = True
+                    result.attempts = len(tried)
+                    SCRAPE_HEDGES.inc("started")
+                continue
+
+            for future in done:
+                attempt = future.result()
+                result.response, result.proxy, result.success = attempt.response, attempt.proxy, attempt.success
+                if attempt.success:
+                    if attempt.proxy == hedge_proxy:
+                        SCRAPE_HEDGES.inc("won")
+                    break
+
+        result.latency = time.monotonic() - start_time
+        SCRAPE_JOBS.inc("success" if result.success else "failed")
+        SCRAPE_SECONDS.observe(result.latency)
+        return result
+
+    def hedge_delay(self) -> float | None:
+        """Get the delay of the backup request, None until enough responses have been observed."""
+        if self.latencies.count < self.min_samples:
+            return None
+        percentile = self.latencies.percentile(self.hedge_percentile)
+        return None if percentile is None else max(self.min_hedge_delay, percentile)
+
+    def close(self) -> None:
+        """Stop the threads of the requests, the requests in flight run to their end."""
+        self._executor.shutdown(wait=False)
+
+    def _start(
+        self, job: ScrapeJob, pool: ProxyPool, tried: set[Proxy], pending: set[Future[Attempt]], join_in_flight: bool
+    ) -> Proxy | None:
+        """Send a request of the job through a proxy that has not been tried yet.
+
+        Only the first request of the job joins a fetch of the same url in flight, the backup request and the
+        retries are always sent.
+
+        Returns:
+            Proxy | None: Packed address of the proxy or None if the pool has no other proxy.
+        """
+        proxy = pool.acquire(exclude=tried, protocols=self.protocols, min_anonymity=self.min_anonymity)
+        if proxy is None:
+            return None
+        cached = join_in_flight and not tried
+        tried.add(proxy)
+        pending.add(self._executor.submit(self._attempt, job, pool, proxy, cached))
+        return proxy
+
+    def _attempt(self, job: ScrapeJob, pool: ProxyPool, proxy: Proxy, cached: bool) -> Attempt:
+        proxy_url = pool.protocol(proxy).url(format_address(proxy))
+        response = None
+        success = False
+        start_time = time.monotonic()
+        try:
+            response = self.request(
+                url=job.url,
+                method=job.method,
+                timeout=job.timeout,
+                headers=job.headers,
+                data=job.data,
+                proxies={"http": proxy_url, "https": proxy_url},
+                request_class="scrape",
+                cached=cached,
+            )
+            success = self.accept(response)
+        finally:
+            latency = time.monotonic() - start_time
+            pool.release(proxy, success, latency)
+        SCRAPE_ATTEMPTS.inc("success" if success else "failed")
+        if success:
+            self.latencies.observe(latency)
+        return Attempt(proxy, response, latency, success)
@@ -0,0 +1,207 @@
+import itertools
+import json
+from dataclasses import dataclass, field, fields
+from enum import Enum
+from string import Formatter
+from typing import Any
+
+from lxml.html import fromstring
+
+from .parsing import JSON_ADDRESS_PATTERN, JSON_PORT_FIRST_PATTERN, Addresses, parse_addresses, parse_lines
+
+
+class SourceFormat(str, Enum):
+    """Format of the pages of a source."""
+
+    HTML_TABLE = "html-table"
+    JSON_LINES = "json-lines"
+    RAW_TEXT = "raw-text"
+
+
+@dataclass(frozen=True, slots=True)
+class SourceDefinition:
+    """Declarative definition of a proxy source, run by `SourceProvider`.
+
+    name (str): Name of the provider in the metrics, the store and the stats.
+    urls (tuple[str, ...]): Templates of the page urls, a `{field}` is filled with every value of `params[field]`.
+    format (SourceFormat): Format of the pages. Defaults to SourceFormat.RAW_TEXT.
+    params (dict[str, list[Any]]): Values of the fields of the templates, all their combinations are fetched.
+        Defaults to no fields.
+    rows (str): XPath of the rows of an html table. Defaults to the rows of the bodies of all the tables.
+    columns (tuple[int, int]): Cells of the ip and the port in a row of an html table. Defaults to (0, 1).
+    text (str | None): XPath of the text nodes with the proxies of a raw-text page that is html.
+        Defaults to None, the whole page is scanned.
+    index_urls (tuple[str, ...]): Templates of the urls of index pages. When given, the pages of the source are
+        the links of the index pages instead of `urls`. Defaults to none.
+    links (str): XPath of the links to the pages in an index page. Defaults to all the links.
+    min_refresh_interval (float): Minimum time in seconds between the runs of the provider. Defaults to 60.
+    """
+
+    name: str
+    urls: tuple[str, ...] = ()
+    format: SourceFormat = SourceFormat.RAW_TEXT
+    params: dict[str, list[Any]] = field(default_factory=dict)
+    rows: str = "//table//tbody/tr"
+    columns: tuple[int, int] = (0, 1)
+    text: str | None = None
+    index_urls: tuple[str, ...] = ()
+    links: str = "//a/@href"
+    min_refresh_interval: float = 60
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SourceDefinition":
+        """Create the definition from its json object, the fields are named as the attributes.
+
+        Raises:
+            ValueError: The object has no name, an unknown field or an unknown format.
+        """
+        unknown = set(data) - {item.name for item in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown fields of the source {data.get('name')!r}: {', '.join(sorted(unknown))}")
+        if not data.get("name"):
+            raise ValueError(f"Source without a name: {data!r}")
+
+        kwargs = dict(data)
+        for name in ("urls", "index_urls", "columns"):
+            if name in kwargs:
+                kwargs[name] = tuple(kwargs[name])
+        if "format" in kwargs:
+            kwargs["format"] = SourceFormat(kwargs["format"])
+        return cls(**kwargs)
+
+    @property
+    def appendable(self) -> bool:
+        """Whether the lines appended to a page can be parsed apart from the rest of the page."""
+        return self.format is not SourceFormat.HTML_TABLE and self.text is None
+
+
+def expand_urls(source: SourceDefinition, templates: tuple[str, ...]) -> list[str]:
+    """Fill the templates with every combination of the values of their fields."""
+    urls: list[str] = []
+    for template in templates:
+        names = [name for _, name, _, _ in Formatter().parse(template) if name]
+        for values in itertools.product(*(source.params[name] for name in names)):
+            urls.append(template.format(**dict(zip(names, values))))
+    return urls
+
+
+def parse_source(source: SourceDefinition, content: bytes) -> Addresses:
+    """Parse a page of the source, the one parsing engine of all the declarative providers.
+
+    Text formats are scanned by the regular expressions of `parsing` over the raw bytes, only html is built
+    into a tree and only the selected cells or text nodes go to the scan.
+
+    Args:
+        source (SourceDefinition): Definition of the source of the page.
+        content (bytes): Raw content of the page.
+
+    Returns:
+        Addresses: Packed addresses of the valid proxies.
+    """
+    if source.format is SourceFormat.JSON_LINES:
+        # The order of the fields is the same in all the lines of the list.
+        return parse_addresses(content, JSON_ADDRESS_PATTERN) or parse_addresses(content, JSON_PORT_FIRST_PATTERN)
+    if source.format is SourceFormat.RAW_TEXT and source.text is None:
+        return parse_addresses(content)
+
+    root = fromstring(content.decode("utf-8", errors="replace"))
+    if source.format is SourceFormat.RAW_TEXT:
+        return parse_lines(root.xpath(source.text))
+
+    ip_column, port_column = source.columns
+    min_length = max(ip_column, port_column) + 1
+    return parse_lines(
+        f"{row[ip_column].text}:{row[port_column].text}" for row in root.xpath(source.rows) if len(row) >= min_length
+    )
+
+
+def parse_links(source: SourceDefinition, content: bytes, url: str) -> list[str]:
+    """Get the absolute urls of the pages linked from an index page of the source."""
+    root = fromstring(content.decode("utf-8", errors="replace"))
+    root.make_links_absolute(url)
+    return [str(link) for link in root.xpath(source.links)]
+
+
+def load_sources(path: str) -> list[SourceDefinition]:
+    """Load the definitions of the sources from a json file with a list of objects.
+
+    Example:
+        [{"name": "MyProxies", "urls": ["https://example.com/list?page={page}"], "params": {"page": [1, 2, 3]},
+          "format": "html-table", "rows": "//table[@id='proxies']/tbody/tr", "columns": [0, 1]}]
+
+    Raises:
+        ValueError: A definition is not valid.
+    """
+    with open(path, "rb") as file:
+        data = json.load(file)
+    if not isinstance(data, list):
+        raise ValueError(f"{path} must contain a list of sources")
+    return [SourceDefinition.from_dict(item) for item in data]
+
+
+FREEPROXYLIST = SourceDefinition(
+    name="FreeproxylistProxies",
+    urls=("https://freeproxylist.ru/protocol/{protocol}?page={page}",),
+    format=SourceFormat.HTML_TABLE,
+    params={"protocol": ["http", "https"], "page": list(range(1, 11))},
+    rows="//tbody[@class='table-proxy-list']/tr",
+)
+
+SSLPROXIES = SourceDefinition(
+    name="SslproxiesProxies",
+    urls=("https://www.sslproxies.org/",),
+    format=SourceFormat.HTML_TABLE,
+    rows="//table[contains(@class,'table')]//tbody/tr",
+)
+
+FATEZERO = SourceDefinition(
+    name="FatezeroProxies",
+    urls=("http://proxylist.fatezero.org/proxy.list",),
+    format=SourceFormat.JSON_LINES,
+)
+
+API89IPCN = SourceDefinition(
+    name="Api89ipcnProxies",
+    urls=("http://api.89ip.cn/tqdl.html?api=1&num=9999",),
+)
+
+XSDAILI = SourceDefinition(
+    name="XsdailiProxies",
+    index_urls=("https://www.xsdaili.cn/dayProxy/{page}.html",),
+    params={"page": [1, 2]},
+    links="//div[contains(@class, 'table table-hover panel-default panel ips')]/div[@class='title']/a/@href",
+    text="//div[@class='cont']/text()",
+)
+
+GITHUB_ACCOUNTS = SourceDefinition(
+    name="GithubAccountProxies",
+    urls=(
+        # https://proxylist.to
+        "https://github.com/proxylist-to/proxy-list/blob/main/http.txt",
+        # https://github.com/parserpp/ip_ports
+        "https://raw.githubusercontent.com/parserpp/ip_ports/main/proxyinfo.txt",
+        "https://cdn.jsdelivr.net/gh/parserpp/ip_ports/proxyinfo.txt",
+        "https://fastly.jsdelivr.net/gh/parserpp/ip_ports@main/proxyinfo.txt",
+        "https://github.rc1844.workers.dev/parserpp/ip_ports/raw/main/proxyinfo.txt",
+        # https://github.com/monosans/proxy-list
+        "https://github.com/monosans/proxy-list/blob/main/proxies/http.txt",
+        # https://github.com/manuGMG/proxy-365
+        "https://github.com/manuGMG/proxy-365/blob/main/SOCKS5.txt",
+        # https://github.com/rdavydov/proxy-list
+        "https://github.com/rdavydov/proxy-list/blob/main/proxies/http.txt",
+        # https://github.com/hanwayTech/free-proxy-list
+        "https://github.com/hanwayTech/free-proxy-list/blob/main/http.txt",
+        # https://github.com/mmpx12/proxy-list
+        "https://github.com/mmpx12/proxy-list/blob/master/proxies.txt",
+        # https://github.com/yemixzy/proxy-list
+        "https://github.com/yemixzy/proxy-list/blob/main/proxy-list/not_checked.txt",
+        # https://github.com/ReCaree/proxy-scrapper
+        "https://raw.githubusercontent.com/ReCaree/proxy-scrapper/master/proxy/http-removed.txt",
+        # https://github.com/jetkai/proxy-list
+        "https://github.com/jetkai/proxy-list/blob/main/online-proxies/txt/proxies.txt",
+    ),
+    # The lists on github change rarely and are big.
+    min_refresh_interval=600,
+)
+
+SOURCES: list[SourceDefinition] = [FREEPROXYLIST, SSLPROXIES, FATEZERO, API89IPCN, XSDAILI, GITHUB_ACCOUNTS]
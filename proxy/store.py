@@ -0,0 +1,196 @@
+import itertools
+import sqlite3
+import time
+from threading import Lock
+from typing import Any
+
+from common.tunnel import ProxyProtocol
+
+from .anonymity import Anonymity
+from .parsing import Proxy, format_address, parse_proxy
+from .results import CheckResult, CheckStatus
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS proxies (
+    proxy TEXT PRIMARY KEY,
+    provider TEXT,
+    checked_at REAL NOT NULL,
+    is_good INTEGER NOT NULL,
+    latency REAL,
+    count_of_failures INTEGER NOT NULL DEFAULT 0,
+    protocol TEXT,
+    anonymity TEXT
+)
+"""
+# Columns added after the first schema, created on the databases of older versions.
+MIGRATIONS = {
+    "protocol": "ALTER TABLE proxies ADD COLUMN protocol TEXT",
+    "anonymity": "ALTER TABLE proxies ADD COLUMN anonymity TEXT",
+}
+
+UPSERT = """
+INSERT INTO proxies (proxy, provider, checked_at, is_good, latency, count_of_failures, protocol, anonymity)
+VALUES (?, ?, ?, ?, ?, 1 - ?, ?, ?)
+ON CONFLICT (proxy) DO UPDATE SET
+    provider = COALESCE(excluded.provider, proxies.provider),
+    checked_at = excluded.checked_at,
+    is_good = excluded.is_good,
+    latency = excluded.latency,
+    count_of_failures = CASE WHEN excluded.is_good THEN 0 ELSE proxies.count_of_failures + 1 END,
+    protocol = COALESCE(excluded.protocol, proxies.protocol),
+    anonymity = COALESCE(excluded.anonymity, proxies.anonymity)
+"""
+
+# A failure of a proxy that is already in the store, a failed candidate is not worth a row.
+UPDATE_FAILED = """
+UPDATE proxies SET checked_at = ?, is_good = 0, latency = NULL, count_of_failures = count_of_failures + 1
+WHERE proxy = ?
+"""
+
+DELETE_OLD = "DELETE FROM proxies WHERE checked_at < ?"
+
+# How often the rows not checked within the retention are deleted by a long run.
+PURGE_INTERVAL = 60 * 60
+
+Record = tuple[Proxy, str | None, float, int, float | None, int, str | None, str | None]
+# Statement and the parameters of a buffered write, the packed proxy first.
+Write = tuple[str, tuple[Any, ...]]
+
+
+class ProxyStore:
+    """On-disk store of the results of proxy checks.
+
+    Results are buffered and written in batches, so recording a check does not touch the disk on the hot path.
+
+    Args:
+        path (str): Path of the SQLite database.
+        batch_size (int): Number of buffered results that triggers a write. Defaults to 500.
+        flush_interval (float): Maximum time in seconds the results stay in the buffer. Defaults to 5.
+        retention (float): Proxies not checked for this long in seconds are deleted when the store opens and
+            once an hour. Defaults to a week.
+    """
+
+    def __init__(
+        self, path: str, batch_size: int = 500, flush_interval: float = 5, retention: float = 7 * 24 * 60 * 60
+    ) -> None:
+        self._locker = Lock()
+        self._buffer: list[Write] = []
+        self._flushed_at = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(proxies)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+        self._conn.commit()
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._purge()
+
+    def record(
+        self,
+        proxy: Proxy,
+        is_good: bool,
+        latency: float | None = None,
+        provider: str | None = None,
+        protocol: ProxyProtocol | None = None,
+        anonymity: Anonymity | None = None,
+        known_only: bool = False,
+    ) -> None:
+        """Record the result of the proxy check.
+
+        Args:
+            proxy (Proxy): Packed address of the proxy.
+            is_good (bool): Result of the check.
+            latency (float | None): Duration of the check in seconds. Defaults to None.
+            provider (str | None): Name of the provider the proxy came from. Defaults to None.
+            protocol (ProxyProtocol | None): Detected protocol, None keeps the stored one. Defaults to None.
+            anonymity (Anonymity | None): Detected anonymity, None keeps the stored one. Defaults to None.
+            known_only (bool): Record a failure only for a proxy already in the store, e.g. a candidate that has
+                not accepted a connection, most of them never do. Defaults to False.
+        """
+        with self._locker:
+            if known_only and not is_good:
+                self._buffer.append((UPDATE_FAILED, (proxy, time.time())))
+            else:
+                record: Record = (
+                    proxy,
+                    provider,
+                    time.time(),
+                    int(is_good),
+                    latency,
+                    int(is_good),
+                    protocol.value if protocol else None,
+                    anonymity.value if anonymity else None,
+                )
+                self._buffer.append((UPSERT, record))
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._flushed_at > self.flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        """Write the buffered results."""
+        with self._locker:
+            self._flush()
+
+    def load_good(self, max_age: float = 24 * 60 * 60) -> list[CheckResult]:
+        """Get the proxies that were good at the last check, in the order of revalidation.
+
+        Args:
+            max_age (float): Maximum age of the last check in seconds. Defaults to one day.
+
+        Returns:
+            list[CheckResult]: Good results with the latency, protocol and anonymity of the last check,
+                the most recently checked first, the fastest first within ten minutes.
+        """
+        with self._locker:
+            self._flush()
+            rows = self._conn.execute(
+                "SELECT proxy, latency, protocol, anonymity FROM proxies WHERE is_good = 1 AND checked_at >= ? "
+                "ORDER BY CAST(checked_at / 600 AS INTEGER) DESC, latency ASC",
+                (time.time() - max_age,),
+            ).fetchall()
+        result: list[CheckResult] = []
+        for address, latency, protocol, anonymity in rows:
+            proxy = parse_proxy(address)
+            if proxy is not None:
+                result.append(
+                    CheckResult(
+                        proxy,
+                        CheckStatus.GOOD,
+                        latency,
+                        protocol=ProxyProtocol(protocol) if protocol else None,
+                        anonymity=Anonymity(anonymity) if anonymity else None,
+                    )
+                )
+        return result
+
+    def close(self) -> None:
+        with self._locker:
+            self._flush()
+            self._conn.close()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            with self._conn:
+                # The writes of one proxy are applied in their order, runs of the same statement in one call.
+                for statement, writes in itertools.groupby(self._buffer, key=lambda write: write[0]):
+                    if statement == UPDATE_FAILED:
+                        params = ((checked_at, format_address(proxy)) for _, (proxy, checked_at) in writes)
+                    else:
+                        # Proxies are stored as `ip:port` to keep the database readable.
+                        params = ((format_address(record[0]), *record[1:]) for _, record in writes)
+                    self._conn.executemany(statement, params)
+            self._buffer.clear()
+        self._flushed_at = time.monotonic()
+        if self._flushed_at - self._purged_at > PURGE_INTERVAL:
+            self._purge()
+
+    def _purge(self) -> None:
+        with self._conn:
+            self._conn.execute(DELETE_OLD, (time.time() - self.retention,))
+        self._purged_at = time.monotonic()
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from common import adaptive
+from common.adaptive import AimdLimiter
+
+
+@pytest.fixture(autouse=True)
+def low_load(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(adaptive, "get_load_per_cpu", lambda: 0.0)
+
+
+def record_results(limiter: AimdLimiter, success_rate: float, count: int, rnd: random.Random) -> int:
+    """Record the results one by one and get the lowest limit on the way."""
+    lowest = limiter.limit
+    for _ in range(count):
+        limiter.record(rnd.random() < success_rate)
+        lowest = min(lowest, limiter.limit)
+    return lowest
+
+
+@pytest.mark.parametrize("success_rate", [0.02, 0.05, 0.5])
+@pytest.mark.parametrize("seed", range(5))
+def test_limit_does_not_shrink_at_constant_success_rate(success_rate: float, seed: int) -> None:
+    limiter = AimdLimiter(max_limit=230)
+    lowest = record_results(limiter, success_rate, 200_000, random.Random(seed))
+    # A false alarm now and then is recovered, a collapse to single digits is the noise taken for a drop.
+    assert lowest >= 230 * 0.7
+
+
+@pytest.mark.parametrize("success_rate", [0.05, 0.5])
+def test_limit_shrinks_when_success_rate_drops(success_rate: float) -> None:
+    rnd = random.Random(0)
+    limiter = AimdLimiter(max_limit=230)
+    record_results(limiter, success_rate, 20_000, rnd)
+    record_results(limiter, success_rate / 5, 20_000, rnd)
+    assert limiter.limit < 230 * 0.7
@@ -0,0 +1,18 @@
+from threading import Thread
+
+from common.metrics import PerThreadCells
+
+
+def test_cells_of_finished_threads_are_merged_without_reads() -> None:
+    cells = PerThreadCells(1)
+
+    def record() -> None:
+        cells.values(("label",))[0] += 1
+
+    for _ in range(100):
+        thread = Thread(target=record)
+        thread.start()
+        thread.join()
+
+    assert len(cells._cells) <= 1
+    assert cells.totals() == {("label",): [100.0]}
@@ -0,0 +1,52 @@
+import errno
+import heapq
+import selectors
+import socket
+import time
+from queue import Queue
+
+import pytest
+
+from proxy.parsing import parse_lines
+from proxy.prefilter import InFlight, TcpPrefilter
+
+
+def test_connect_started_later_with_shorter_timeout_expires_first() -> None:
+    prefilter = TcpPrefilter()
+    slow, fast = parse_lines(["10.0.0.1:80", "10.0.0.2:80"])
+    pairs = [socket.socketpair() for _ in range(2)]
+    in_flight: InFlight = []
+    now = time.monotonic()
+    with selectors.DefaultSelector() as selector:
+        # Nothing is ever readable, the connects can only expire.
+        for (sock, _), proxy, deadline, sequence in zip(pairs, (slow, fast), (now + 60, now - 1), (0, 1)):
+            selector.register(sock, selectors.EVENT_READ, (proxy, now))
+            heapq.heappush(in_flight, (deadline, sequence, sock, proxy))
+
+        assert prefilter._poll(selector, in_flight, 0) == [(fast, "timeout", None)]
+        assert [item[3] for item in in_flight] == [slow]
+
+    for sock, peer in pairs:
+        sock.close()
+        peer.close()
+
+
+def test_connect_failing_on_this_host_is_an_error_not_a_dead_proxy(monkeypatch: pytest.MonkeyPatch) -> None:
+    def socket_without_descriptors(*args: object) -> socket.socket:
+        raise OSError(errno.EMFILE, "Too many open files")
+
+    monkeypatch.setattr(socket, "socket", socket_without_descriptors)
+    prefilter = TcpPrefilter()
+    source: Queue[int | None] = Queue()
+    for proxy in parse_lines(["10.0.0.1:80"]):
+        source.put(proxy)
+    source.put(None)
+    results: list[tuple[int, float | None]] = []
+    errors: list[int] = []
+
+    prefilter.run(source, lambda proxy, connect_time: results.append((proxy, connect_time)), on_error=errors.append)
+
+    assert results == []
+    assert errors == list(parse_lines(["10.0.0.1:80"]))
+    assert prefilter.count_of_dead == 0
+    assert prefilter.count_of_errors == 1
@@ -0,0 +1,46 @@
+import time
+from threading import Thread
+
+from requests.models import Response
+
+from common.response_cache import ResponseCache
+
+URL = "https://example.com/page"
+
+
+def make_response(status_code: int) -> Response:
+    resp = Response()
+    resp.status_code = status_code
+    resp._content = b"body"
+    resp.url = URL
+    return resp
+
+
+def collapse(status_code: int) -> list[int]:
+    """Fetch the url by a leader and a waiter, get the status codes of the requests that have been sent."""
+    cache = ResponseCache(default_ttl=60)
+    sent: list[int] = []
+
+    def send_slowly() -> Response:
+        time.sleep(0.2)
+        sent.append(status_code)
+        return make_response(status_code)
+
+    def send() -> Response:
+        sent.append(200)
+        return make_response(200)
+
+    leader = Thread(target=cache.fetch, args=("GET", URL, send_slowly))
+    leader.start()
+    time.sleep(0.05)
+    cache.fetch("GET", URL, send)
+    leader.join()
+    return sent
+
+
+def test_waiter_gets_the_successful_response_of_the_leader() -> None:
+    assert collapse(200) == [200]
+
+
+def test_waiter_sends_its_own_request_after_an_error_of_the_leader() -> None:
+    assert collapse(503) == [503, 200]
@@ -0,0 +1,83 @@
+import time
+from threading import Thread
+
+from proxy.checker import CheckerProxy
+from proxy.judges import JudgeRegistry
+from proxy.parsing import new_addresses, parse_proxy
+from proxy.results import CheckResult, CheckStatus
+from proxy.run_threads import RunThreads, put_many
+
+PROXY = parse_proxy("10.0.0.1:8080")
+
+
+def make_runner() -> RunThreads:
+    # Nothing listens on the port, so no judge is alive, as in an outage of all the judges.
+    judges = JudgeRegistry(judges=["http://127.0.0.1:9/"], probe_timeout=1)
+    return RunThreads(
+        max_workers_proxies=1,
+        max_custom_worker=0,
+        providers_list=[],
+        checker_proxy=CheckerProxy(url_of_second_check="", judges=judges),
+    )
+
+
+def test_judge_outage_neither_caches_nor_demotes_the_proxy() -> None:
+    assert PROXY is not None
+    runner = make_runner()
+    runner.pool.publish([CheckResult(PROXY, CheckStatus.GOOD, 0.1)])
+    runner.scheduler.add(PROXY)
+    runner.scheduler.pop_due(timeout=0)
+
+    result = runner.checker_proxy(PROXY)
+    assert result.status is CheckStatus.NO_JUDGE
+    runner.publish([result])
+
+    assert PROXY in runner.pool
+    assert runner.scheduler._entries[PROXY].failures == 0
+    assert runner.scheduler._entries[PROXY].due is not None
+    runner.deduplicator.new_generation()
+    assert list(runner.deduplicator.accept(new_addresses([PROXY]))) == [PROXY]
+
+
+def test_proxy_failure_caches_and_demotes_the_proxy() -> None:
+    assert PROXY is not None
+    runner = make_runner()
+    runner.pool.publish([CheckResult(PROXY, CheckStatus.GOOD, 0.1)])
+    runner.scheduler.add(PROXY)
+    runner.scheduler.pop_due(timeout=0)
+
+    runner.publish([CheckResult(PROXY, CheckStatus.NO_RESPONSE)])
+
+    assert PROXY not in runner.pool
+    assert runner.scheduler._entries[PROXY].failures == 1
+    runner.deduplicator.new_generation()
+    assert list(runner.deduplicator.accept(new_addresses([PROXY]))) == []
+
+
+class SlowChecker(CheckerProxy):
+    def __init__(self) -> None:
+        super().__init__(url_of_second_check="")
+        self.count_of_checks = 0
+
+    def __call__(self, proxy: int) -> CheckResult:
+        self.count_of_checks += 1
+        time.sleep(0.5)
+        return CheckResult(proxy, CheckStatus.NO_RESPONSE)
+
+
+def test_terminate_drops_the_queued_checks() -> None:
+    checker = SlowChecker()
+    runner = RunThreads(max_workers_proxies=2, max_custom_worker=0, providers_list=[], checker_proxy=checker)
+    put_many(runner._unchecked_proxies_queue, range(1, 41))
+    threads = [Thread(target=worker) for worker in runner.check_workers()]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+
+    start_time = time.monotonic()
+    runner.terminate()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - start_time < 1
+    assert checker.count_of_checks == 2
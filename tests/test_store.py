@@ -0,0 +1,37 @@
+import time
+from pathlib import Path
+
+from proxy.parsing import parse_lines
+from proxy.store import ProxyStore
+
+KNOWN, CANDIDATE = parse_lines(["10.0.0.1:80", "10.0.0.2:80"])
+
+
+def read_rows(store: ProxyStore) -> dict[str, tuple[int, int]]:
+    return {
+        proxy: (is_good, failures)
+        for proxy, is_good, failures in store._conn.execute("SELECT proxy, is_good, count_of_failures FROM proxies")
+    }
+
+
+def test_unreachable_candidates_are_not_stored(tmp_path: Path) -> None:
+    store = ProxyStore(str(tmp_path / "proxies.sqlite3"))
+    store.record(KNOWN, True, 0.1)
+    store.record(KNOWN, False, known_only=True)
+    store.record(CANDIDATE, False, known_only=True)
+    store.flush()
+
+    assert read_rows(store) == {"10.0.0.1:80": (0, 1)}
+    store.close()
+
+
+def test_proxies_not_checked_within_the_retention_are_deleted(tmp_path: Path) -> None:
+    path = str(tmp_path / "proxies.sqlite3")
+    store = ProxyStore(path)
+    store.record(KNOWN, False)
+    store.close()
+
+    time.sleep(0.05)
+    store = ProxyStore(path, retention=0.01)
+    assert read_rows(store) == {}
+    store.close()